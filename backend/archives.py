@@ -0,0 +1,83 @@
+import shutil
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import List, Tuple
+
+
+class ArchiveTooLarge(Exception):
+    pass
+
+
+class ZipStream:
+    """
+    Write-only sink for zipfile.ZipFile: collects the written bytes until drain is called.
+    zipfile writes data descriptors to a sink without tell/seek, so the archive can be sent while it is being built.
+    """
+
+    def __init__(self) -> None:
+        self.__chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.__chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.__chunks)
+        self.__chunks = []
+        return data
+
+
+def safe_member_name(name: str) -> str:
+    # из имени в архиве убираются абсолютные пути и "..", чтобы файл не вышел за пределы папки
+    parts = [part for part in PurePosixPath(name.replace("\\", "/")).parts if part not in ("/", "..", ".")]
+    return "/".join(parts)
+
+
+def extract_pdfs(zip_path: Path, output_dir: Path, max_files: int, max_bytes: int) -> List[Tuple[str, Path]]:
+    """
+    Unpacks the PDFs of the archive into output_dir and returns (name in the archive, path) pairs.
+    Other files are ignored. Sizes are checked against the central directory before anything is unpacked
+    and against the actually read bytes while unpacking, so a forged header doesn't let a zip bomb through.
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        members = [info for info in archive.infolist() if not info.is_dir() and info.filename.lower().endswith(".pdf")]
+        if len(members) > max_files:
+            raise ArchiveTooLarge(f"Слишком много файлов: {len(members)} > {max_files}")
+        if sum(info.file_size for info in members) > max_bytes:
+            raise ArchiveTooLarge("Архив слишком большой")
+
+        extracted = []
+        total = 0
+        for index, info in enumerate(members):
+            path = output_dir.joinpath(f"{index}.pdf")
+            with archive.open(info) as source, open(path, "wb") as target:
+                while True:
+                    chunk = source.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    total += len(chunk)
+                    if total > max_bytes:
+                        raise ArchiveTooLarge("Архив слишком большой")
+                    target.write(chunk)
+            extracted.append((safe_member_name(info.filename), path))
+        return extracted
+
+
+def unique_name(name: str, used: set) -> str:
+    candidate = name
+    stem, dot, suffix = name.rpartition(".")
+    number = 1
+    while candidate in used:
+        candidate = f"{stem}_{number}{dot}{suffix}" if dot else f"{name}_{number}"
+        number += 1
+    used.add(candidate)
+    return candidate
+
+
+def copy_into_zip(archive: zipfile.ZipFile, path: Path, name: str) -> None:
+    # PDF уже сжат, поэтому кладется без повторного сжатия
+    with open(path, "rb") as source, archive.open(zipfile.ZipInfo(name), "w") as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
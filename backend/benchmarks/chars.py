@@ -0,0 +1,53 @@
+import argparse
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from pdf_broken_encoding_reader.metrics import Metrics
+
+
+def measure_correction(reader: object, pdf_path: Path, repeat: int = 3) -> dict:
+    """
+    Runs the layout stage of PDFReader on an already prepared document repeat times and keeps the fastest run
+    of layout.correct, the loop that rewrites the text of every LTChar with the glyph map.
+    """
+    best = None
+    for _ in range(repeat):
+        metrics = Metrics()
+        reader.metrics = metrics
+        for _ in reader.iter_pages(pdf_path, compact=True):
+            pass
+        seconds = metrics.timings.get("layout.correct", 0.0)
+        if best is None or seconds < best["seconds"]:
+            best = {"seconds": seconds, "chars": int(metrics.counters.get("chars", 0)), "pages": int(metrics.counters.get("pages", 0))}
+    best["ns_per_char"] = best["seconds"] / max(best["chars"], 1) * 1e9
+    return best
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measures the per-char cost of the layout correction loop")
+    parser.add_argument("inputs", type=Path, nargs="+", help="PDFs or folders of PDFs, char-heavy documents give stable numbers")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per document, the fastest one is kept")
+    parser.add_argument("--glyph-engine", choices=["fontforge", "numpy"], help="glyph rasterizer (default: config.rasterizer)")
+    args = parser.parse_args(argv)
+
+    from pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader
+    reader = PDFReader(glyph_engine=args.glyph_engine)
+
+    pdf_paths = []
+    for input_path in args.inputs:
+        pdf_paths.extend(sorted(input_path.glob("*.pdf")) if input_path.is_dir() else [input_path])
+
+    total_seconds, total_chars = 0.0, 0
+    print(f"{'document':<40} {'pages':>6} {'chars':>9} {'correct, s':>11} {'ns/char':>8}")
+    for pdf_path in pdf_paths:
+        result = measure_correction(reader, pdf_path, args.repeat)
+        total_seconds += result["seconds"]
+        total_chars += result["chars"]
+        print(f"{pdf_path.name:<40} {result['pages']:>6} {result['chars']:>9} {result['seconds']:>11.4f} {result['ns_per_char']:>8.0f}")
+    print(f"\ntotal: {total_chars} chars in {total_seconds:.4f}s ({total_seconds / max(total_chars, 1) * 1e9:.0f} ns/char)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+import argparse
+import io
+import json
+import random
+import string
+from dataclasses import dataclass
+from itertools import product
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence
+
+import fitz
+from fontTools import subset
+from fontTools.ttLib import TTFont, newTable
+from fontTools.ttLib.tables._c_m_a_p import cmap_format_4
+
+from pdf_broken_encoding_reader import config
+
+default_fonts = (
+    Path("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"),
+    Path("/usr/share/fonts/truetype/dejavu/DejaVuSerif.ttf"),
+)
+
+page_width, page_height = fitz.paper_size("a4")
+margin = 50
+font_size = 11
+leading = 14
+first_code = 33
+symbol_offset = 0xF000
+
+
+@dataclass
+class BrokenFont:
+    """Embedded TrueType font whose glyph names and codes say nothing about the chars they draw."""
+
+    resource: str
+    basefont: str
+    data: bytes
+    codes: Dict[str, int]
+    glyph_names: Dict[int, str]
+    widths: Dict[int, int]
+
+    def encode(self, text: str) -> str:
+        return "".join(f"{self.codes[char]:02X}" for char in text)
+
+    def text_width(self, text: str) -> float:
+        return sum(self.widths[self.codes[char]] for char in text) * font_size / 1000
+
+
+def make_broken_font(font_path: Path, chars: Sequence[str], index: int, rng: random.Random) -> BrokenFont:
+    """
+    Subsets font_path to chars and breaks its encoding the way broken PDF producers do:
+    glyphs are renamed to g1, g2, ... in random order, codes are assigned to chars in random order
+    and the only cmap is a symbolic one, so neither the /Differences names nor the codes give the unicode back.
+    """
+    font = TTFont(str(font_path))
+    options = subset.Options()
+    options.glyph_names = True
+    options.notdef_outline = True
+    options.name_IDs = []
+    options.layout_features = []
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=[ord(char) for char in chars] + [ord(" ")])
+    subsetter.subset(font)
+    char2glyph = {char: font.getBestCmap()[ord(char)] for char in chars}
+
+    buffer = io.BytesIO()
+    font.save(buffer)
+    buffer.seek(0)
+    font = TTFont(buffer)
+    glyph_order = font.getGlyphOrder()
+    post = font["post"]
+    hmtx = font["hmtx"]
+    units_per_em = font["head"].unitsPerEm
+    advances = {name: hmtx[name][0] * 1000 // units_per_em for name in glyph_order}
+
+    numbers = list(range(1, len(glyph_order)))
+    rng.shuffle(numbers)
+    rename = {name: f"g{number}" for name, number in zip(glyph_order[1:], numbers)}
+    rename.update({".notdef": ".notdef", "space": "space"})
+    font.setGlyphOrder([rename[name] for name in glyph_order])
+    hmtx.metrics = {rename[name]: metrics for name, metrics in hmtx.metrics.items()}
+    post.formatType = 2.0
+    post.extraNames = []
+    post.mapping = {}
+
+    code_pool = list(range(first_code, first_code + len(chars)))
+    rng.shuffle(code_pool)
+    codes = dict(zip(chars, code_pool))
+    codes[" "] = 32
+    glyph_names = {code: rename[char2glyph[char]] for char, code in codes.items() if char != " "}
+    glyph_names[32] = "space"
+
+    subtable = cmap_format_4(4)
+    subtable.platformID, subtable.platEncID, subtable.language = 3, 0, 0
+    subtable.cmap = {symbol_offset + code: name for code, name in glyph_names.items()}
+    cmap = newTable("cmap")
+    cmap.tableVersion = 0
+    cmap.tables = [subtable]
+    font["cmap"] = cmap
+
+    buffer = io.BytesIO()
+    font.save(buffer)
+    widths = {code: advances[char2glyph[char]] for char, code in codes.items() if char != " "}
+    widths[32] = advances["space"]
+    tag = "".join(rng.choice(string.ascii_uppercase) for _ in range(6))
+    return BrokenFont(f"F{index}", f"{tag}+Bench{index}", buffer.getvalue(), codes, glyph_names, widths)
+
+
+def add_font(doc: fitz.Document, font: BrokenFont) -> int:
+    """Adds a simple TrueType font with a /Differences encoding and without ToUnicode."""
+    file_xref = doc.get_new_xref()
+    doc.update_object(file_xref, "<<>>")
+    doc.update_stream(file_xref, font.data, new=True)
+    doc.xref_set_key(file_xref, "Length1", str(len(font.data)))
+
+    descriptor_xref = doc.get_new_xref()
+    doc.update_object(descriptor_xref, (
+        f"<< /Type /FontDescriptor /FontName /{font.basefont} /Flags 4 /FontBBox [-1021 -463 1793 1232] "
+        f"/ItalicAngle 0 /Ascent 928 /Descent -236 /CapHeight 700 /StemV 80 /FontFile2 {file_xref} 0 R >>"
+    ))
+
+    codes = sorted(font.glyph_names)
+    differences = " ".join(f"{code} /{font.glyph_names[code]}" for code in codes)
+    widths = " ".join(str(font.widths.get(code, 0)) for code in range(codes[0], codes[-1] + 1))
+    font_xref = doc.get_new_xref()
+    doc.update_object(font_xref, (
+        f"<< /Type /Font /Subtype /TrueType /BaseFont /{font.basefont} /FirstChar {codes[0]} /LastChar {codes[-1]} "
+        f"/Widths [{widths}] /Encoding << /Type /Encoding /Differences [{differences}] >> "
+        f"/FontDescriptor {descriptor_xref} 0 R >>"
+    ))
+    return font_xref
+
+
+def random_words(rng: random.Random, chars: Sequence[str]) -> Iterator[str]:
+    letters = [char for char in chars if char.isalpha()]
+    digits = [char for char in chars if char.isdigit()]
+    punctuation = [char for char in chars if not char.isalnum()]
+    while True:
+        if digits and rng.random() < 0.05:
+            word = "".join(rng.choice(digits) for _ in range(rng.randint(1, 4)))
+        else:
+            word = "".join(rng.choice(letters) for _ in range(rng.randint(2, 10)))
+        if punctuation and rng.random() < 0.1:
+            word += rng.choice(punctuation)
+        yield word
+
+
+def layout_lines(rng: random.Random, chars: Sequence[str], fonts: List[BrokenFont]) -> List[str]:
+    """Splits random words into lines of a page, the font changes from line to line."""
+    words = random_words(rng, chars)
+    lines = []
+    for line_num in range(int((page_height - 2 * margin) // leading)):
+        font = fonts[line_num % len(fonts)]
+        line = next(words)
+        for word in words:
+            if font.text_width(f"{line} {word}") > page_width - 2 * margin:
+                break
+            line = f"{line} {word}"
+        lines.append(line)
+    return lines
+
+
+def page_content(lines: List[str], fonts: List[BrokenFont]) -> bytes:
+    commands = ["BT", f"{leading} TL", f"{margin} {page_height - margin - font_size} Td"]
+    for line_num, line in enumerate(lines):
+        font = fonts[line_num % len(fonts)]
+        commands.append(f"/{font.resource} {font_size} Tf <{font.encode(line)}> Tj T*")
+    commands.append("ET")
+    return "\n".join(commands).encode("ascii")
+
+
+def generate_document(output_path: Path, pages: int, fonts_count: int, alphabet: str,
+                      font_files: Sequence[Path], seed: int) -> dict:
+    """
+    Writes a PDF with broken encoding and returns its ground truth: the text of every page line by line.
+    """
+    rng = random.Random(seed)
+    chars = config.char_pool[alphabet]
+    fonts = [make_broken_font(font_files[index % len(font_files)], chars, index, rng) for index in range(fonts_count)]
+
+    with fitz.open() as doc:
+        font_xrefs = [add_font(doc, font) for font in fonts]
+        font_resources = " ".join(f"/{font.resource} {font_xref} 0 R" for font, font_xref in zip(fonts, font_xrefs))
+        texts = []
+        for _ in range(pages):
+            page = doc.new_page(width=page_width, height=page_height)
+            doc.xref_set_key(page.xref, "Resources", f"<< /Font << {font_resources} >> >>")
+            lines = layout_lines(rng, chars, fonts)
+            contents_xref = doc.get_new_xref()
+            doc.update_object(contents_xref, "<<>>")
+            doc.update_stream(contents_xref, page_content(lines, fonts), new=True)
+            doc.xref_set_key(page.xref, "Contents", f"{contents_xref} 0 R")
+            texts.append("\n".join(lines))
+        doc.save(str(output_path), garbage=3, deflate=True)
+
+    return dict(pages=texts, alphabet=alphabet, fonts=fonts_count, seed=seed)
+
+
+def generate_corpus(output_dir: Path, pages: Sequence[int], fonts: Sequence[int], alphabets: Sequence[str],
+                    font_files: Sequence[Path], seed: int = 0) -> List[Path]:
+    """
+    Generates a document for every combination of pages, fonts and alphabets.
+    Each <name>.pdf gets a <name>.json next to it with the ground truth.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for doc_num, (pages_count, fonts_count, alphabet) in enumerate(product(pages, fonts, alphabets)):
+        name = f"{alphabet}_p{pages_count}_f{fonts_count}"
+        pdf_path = output_dir.joinpath(f"{name}.pdf")
+        truth = generate_document(pdf_path, pages_count, fonts_count, alphabet, font_files, seed + doc_num)
+        with open(output_dir.joinpath(f"{name}.json"), "w", encoding="utf-8") as f:
+            json.dump(truth, f, ensure_ascii=False, indent=2)
+        paths.append(pdf_path)
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generates PDFs with scrambled /Differences encodings and without ToUnicode")
+    parser.add_argument("output_dir", type=Path)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--fonts", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--alphabets", nargs="+", default=["rus_eng"], choices=sorted(config.char_pool))
+    parser.add_argument("--font-file", type=Path, action="append", dest="font_files",
+                        help="TrueType font to embed, can be repeated (DejaVu by default)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    font_files = args.font_files or [path for path in default_fonts if path.exists()]
+    if not font_files:
+        parser.error("DejaVu fonts not found, pass --font-file")
+    for path in generate_corpus(args.output_dir, args.pages, args.fonts, args.alphabets, font_files, args.seed):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
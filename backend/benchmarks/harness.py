@@ -0,0 +1,183 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import re
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import Levenshtein
+
+from pdf_broken_encoding_reader.metrics import Metrics
+
+# Регрессия фиксируется, если время выросло больше чем на threshold и больше чем на min_seconds
+default_threshold = 0.2
+min_seconds = 0.05
+
+reader = None
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в килобайтах на linux и в байтах на macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024 / 1024
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def char_accuracy(texts: List[str], truth: List[str]) -> float:
+    expected = normalize(" ".join(truth))
+    actual = normalize(" ".join(texts))
+    return 1 - Levenshtein.distance(expected, actual) / max(len(expected), 1)
+
+
+def measure_document(pdf_path: Path, repeat: int = 1, corrected_pdf: bool = True) -> dict:
+    """
+    Runs PDFReader on the document repeat times and keeps the fastest run:
+    stage timings and counters of Metrics, wall time, pages/s, glyphs/s and the peak RSS of the process.
+    """
+    global reader
+    if reader is None:
+        from pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader
+        reader = PDFReader()
+
+    best = None
+    for _ in range(repeat):
+        metrics = Metrics()
+        reader.metrics = metrics
+        start = time.perf_counter()
+        with metrics.stage("total"):
+            texts = [page.get_text() for page in reader.iter_pages(pdf_path)]
+            if corrected_pdf:
+                corrected_pdf_path = reader.write_corrected_pdf(pdf_path)
+                if corrected_pdf_path is not None:
+                    Path(corrected_pdf_path).unlink()
+        wall_time = time.perf_counter() - start
+        if best is None or wall_time < best["wall_seconds"]:
+            best = dict(wall_seconds=wall_time, texts=texts, **metrics.as_dict())
+
+    texts = best.pop("texts")
+    counters = best["counters"]
+    wall_time = best["wall_seconds"]
+    result = dict(
+        pages=counters.get("pages", 0),
+        glyphs=counters.get("glyphs", 0),
+        pages_per_second=counters.get("pages", 0) / wall_time,
+        glyphs_per_second=counters.get("glyphs", 0) / wall_time,
+        peak_rss_mb=peak_rss_mb(),
+        **best
+    )
+    truth_path = pdf_path.with_suffix(".json")
+    if truth_path.exists():
+        with open(truth_path, encoding="utf-8") as f:
+            result["accuracy"] = char_accuracy(texts, json.load(f)["pages"])
+    return result
+
+
+def run_benchmark(pdf_paths: List[Path], repeat: int = 1, corrected_pdf: bool = True, isolate: bool = False) -> dict:
+    """
+    Measures every document. With isolate each document runs in a fresh process,
+    so peak_rss_mb belongs to that document only and not to all documents measured before it.
+    """
+    if isolate:
+        context = multiprocessing.get_context("spawn")
+        documents = {}
+        for path in pdf_paths:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                documents[path.name] = executor.submit(measure_document, path, repeat, corrected_pdf).result()
+    else:
+        documents = {path.name: measure_document(path, repeat, corrected_pdf) for path in pdf_paths}
+
+    wall_time = sum(doc["wall_seconds"] for doc in documents.values())
+    pages = sum(doc["pages"] for doc in documents.values())
+    glyphs = sum(doc["glyphs"] for doc in documents.values())
+    return dict(
+        environment=dict(python=platform.python_version(), platform=platform.platform(), processor=platform.processor()),
+        totals=dict(
+            wall_seconds=wall_time,
+            pages=pages,
+            glyphs=glyphs,
+            pages_per_second=pages / wall_time if wall_time else 0.0,
+            glyphs_per_second=glyphs / wall_time if wall_time else 0.0,
+            peak_rss_mb=max((doc["peak_rss_mb"] for doc in documents.values()), default=0.0)
+        ),
+        documents=documents
+    )
+
+
+def compare(results: dict, baseline: dict, threshold: float = default_threshold) -> List[str]:
+    """Returns a line for every document wall time and stage timing that got slower than the baseline allows."""
+    regressions = []
+    for name, doc in results["documents"].items():
+        base = baseline["documents"].get(name)
+        if base is None:
+            continue
+        timings = dict(doc["timings"], wall=doc["wall_seconds"])
+        base_timings = dict(base["timings"], wall=base["wall_seconds"])
+        for stage, seconds in sorted(timings.items()):
+            base_seconds = base_timings.get(stage)
+            if base_seconds is None:
+                continue
+            if seconds > base_seconds * (1 + threshold) and seconds - base_seconds > min_seconds:
+                regressions.append(f"{name} {stage}: {base_seconds:.3f}s -> {seconds:.3f}s (+{(seconds / base_seconds - 1) * 100:.0f}%)")
+        if "accuracy" in doc and "accuracy" in base and doc["accuracy"] < base["accuracy"] - 0.01:
+            regressions.append(f"{name} accuracy: {base['accuracy']:.3f} -> {doc['accuracy']:.3f}")
+    return regressions
+
+
+def print_report(results: dict) -> None:
+    print(f"{'document':<32} {'pages':>6} {'glyphs':>7} {'wall, s':>9} {'pages/s':>9} {'glyphs/s':>9} {'RSS, MB':>9} {'accuracy':>9}")
+    for name, doc in results["documents"].items():
+        accuracy = f"{doc['accuracy']:.3f}" if "accuracy" in doc else "-"
+        print(f"{name:<32} {doc['pages']:>6} {doc['glyphs']:>7} {doc['wall_seconds']:>9.3f} {doc['pages_per_second']:>9.2f} "
+              f"{doc['glyphs_per_second']:>9.1f} {doc['peak_rss_mb']:>9.1f} {accuracy:>9}")
+    totals = results["totals"]
+    print(f"{'total':<32} {totals['pages']:>6} {totals['glyphs']:>7} {totals['wall_seconds']:>9.3f} {totals['pages_per_second']:>9.2f} "
+          f"{totals['glyphs_per_second']:>9.1f} {totals['peak_rss_mb']:>9.1f}")
+
+    stages: Dict[str, float] = {}
+    for doc in results["documents"].values():
+        for stage, seconds in doc["timings"].items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+    print()
+    for stage, seconds in sorted(stages.items(), key=lambda item: -item[1]):
+        print(f"{stage:<24} {seconds:>9.3f}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Times PDFReader stages on a corpus and compares them with a saved baseline")
+    parser.add_argument("corpus_dir", type=Path, help="folder with PDFs, e.g. generated by benchmarks.corpus")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per document, the fastest one is kept")
+    parser.add_argument("--no-corrected-pdf", dest="corrected_pdf", action="store_false")
+    parser.add_argument("--isolate", action="store_true", help="measure every document in a fresh process")
+    parser.add_argument("--output", type=Path, help="save results as JSON")
+    parser.add_argument("--baseline", type=Path, help="results JSON to compare with, exit code 1 on regression")
+    parser.add_argument("--threshold", type=float, default=default_threshold)
+    args = parser.parse_args(argv)
+
+    pdf_paths = sorted(args.corpus_dir.glob("*.pdf"))
+    if not pdf_paths:
+        parser.error(f"no PDFs in {args.corpus_dir}")
+    results = run_benchmark(pdf_paths, args.repeat, args.corrected_pdf, args.isolate)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
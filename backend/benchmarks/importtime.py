@@ -0,0 +1,83 @@
+import argparse
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+backend_dir = Path(__file__).resolve().parents[1]
+default_modules = ["main", "pdf_broken_encoding_reader.batch", "pdf_broken_encoding_reader.pdf_worker.pdf_reader"]
+# модули, которые не должны загружаться при старте сервиса: они нужны только при первой обработке документа
+default_forbidden = ["torch", "huggingface_hub", "Levenshtein"]
+
+line_pattern = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, float, float]]:
+    """Returns (module, nesting level, self seconds, cumulative seconds) for the -X importtime lines of stderr."""
+    records = []
+    for line in stderr.splitlines():
+        match = line_pattern.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            records.append((module, (len(indent) - 1) // 2, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return records
+
+
+def measure_import(module: str) -> Dict:
+    """Imports the module in a fresh interpreter started from the backend folder, as the workers are."""
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=backend_dir,
+                             stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True)
+    wall_seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{process.stderr[-2000:]}")
+    records = parse_importtime(process.stderr)
+    # importtime печатает модуль после всех его зависимостей: поддерево модуля идет перед его строкой уровня 0
+    end = next(index for index, (name, level, _, _) in enumerate(records) if name == module and level == 0)
+    start = end
+    while start > 0 and records[start - 1][1] > 0:
+        start -= 1
+    return {"module": module, "wall_seconds": wall_seconds, "import_seconds": records[end][3],
+            "records": records, "subtree": records[start:end]}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import time of the backend entry points: what a cold worker pays before it is ready")
+    parser.add_argument("modules", nargs="*", default=default_modules)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per module, the fastest one is kept")
+    parser.add_argument("--top", type=int, default=15, help="heaviest top-level imports to show")
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds allowed for importing the first module")
+    parser.add_argument("--forbid", nargs="*", default=default_forbidden,
+                        help="packages the first module must not import")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for index, module in enumerate(args.modules):
+        result = min((measure_import(module) for _ in range(args.repeat)), key=lambda run: run["import_seconds"])
+        print(f"{module}: import {result['import_seconds']:.3f}s, interpreter start + import {result['wall_seconds']:.3f}s")
+        # тяжелые прямые зависимости импортируемого модуля, сгруппированные по пакетам
+        heaviest: Dict[str, float] = {}
+        for name, level, _, cumulative in result["subtree"]:
+            if level == 1:
+                package = name.split(".")[0]
+                heaviest[package] = heaviest.get(package, 0.0) + cumulative
+        for package, seconds in sorted(heaviest.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {package:<40} {seconds:>8.3f}s")
+
+        if index == 0:
+            loaded = {name.split(".")[0] for name, _, _, _ in result["records"]}
+            forbidden = sorted(loaded & set(args.forbid))
+            if forbidden:
+                print(f"FAIL: {module} imports {', '.join(forbidden)} at startup")
+                failed = True
+            if result["import_seconds"] > args.budget:
+                print(f"FAIL: {module} imports in {result['import_seconds']:.3f}s, budget {args.budget:.3f}s")
+                failed = True
+        print()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
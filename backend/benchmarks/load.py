@@ -0,0 +1,266 @@
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from itertools import count, cycle
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+backend_dir = Path(__file__).resolve().parent.parent
+finished_statuses = ("done", "failed", "cancelled")
+
+
+@dataclass
+class Sample:
+    latency: float
+    status: int
+    error: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+class LoadClient:
+    """
+    Sends the PDFs of a folder to the service in a loop.
+    With unique_bodies every upload gets a distinct trailing comment, so that it misses the result cache of the service.
+    """
+
+    def __init__(self, base_url: str, pdf_paths: List[Path], endpoint: str = "extract", corrected_pdf: bool = True,
+                 unique_bodies: bool = True, poll_interval: float = 0.2, timeout: float = 600.0) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.documents = [(path.name, path.read_bytes()) for path in pdf_paths]
+        self.endpoint = endpoint
+        self.params = {"corrected_pdf": str(corrected_pdf).lower()}
+        self.unique_bodies = unique_bodies
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.__documents = cycle(self.documents)
+        self.__numbers = count()
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    def request(self, scheduled_at: Optional[float] = None) -> Sample:
+        """
+        Sends one document and waits for its result. Latency is counted from scheduled_at if it is given,
+        so in the open-loop mode the time a request waited for a free connection is included.
+        """
+        with self.__lock:
+            filename, body = next(self.__documents)
+            number = next(self.__numbers)
+        if self.unique_bodies:
+            body += f"\n%load-{os.getpid()}-{number}\n".encode("ascii")
+
+        start = time.perf_counter() if scheduled_at is None else scheduled_at
+        try:
+            if self.endpoint == "jobs":
+                response = self.__run_job(filename, body)
+            else:
+                response = self.__session().post(f"{self.base_url}/extract-text", params=self.params,
+                                                 files={"file": (filename, body, "application/pdf")}, timeout=self.timeout)
+        except requests.RequestException as e:
+            return Sample(time.perf_counter() - start, 0, type(e).__name__)
+
+        latency = time.perf_counter() - start
+        if response.status_code != 200:
+            return Sample(latency, response.status_code, response.text[:200])
+        return Sample(latency, response.status_code, timings=response.json().get("timings", {}))
+
+    def __run_job(self, filename: str, body: bytes) -> requests.Response:
+        session = self.__session()
+        response = session.post(f"{self.base_url}/jobs", params=self.params,
+                                files={"file": (filename, body, "application/pdf")}, timeout=self.timeout)
+        if response.status_code != 202:
+            return response
+        job_id = response.json()["id"]
+        deadline = time.perf_counter() + self.timeout
+        while True:
+            response = session.get(f"{self.base_url}/jobs/{job_id}", timeout=self.timeout)
+            if response.status_code != 200 or response.json()["status"] in finished_statuses:
+                break
+            if time.perf_counter() > deadline:
+                raise requests.Timeout(f"job {job_id}")
+            time.sleep(self.poll_interval)
+        if response.status_code == 200 and response.json()["status"] != "done":
+            return response
+        return session.get(f"{self.base_url}/jobs/{job_id}/result", timeout=self.timeout)
+
+    def __session(self) -> requests.Session:
+        if not hasattr(self.__local, "session"):
+            self.__local.session = requests.Session()
+        return self.__local.session
+
+
+def run_closed_loop(client: LoadClient, concurrency: int, duration: float, total: Optional[int]) -> List[Sample]:
+    """concurrency users send requests one after another until duration runs out or total requests are sent."""
+    samples = []
+    lock = threading.Lock()
+    sent = count()
+    deadline = time.perf_counter() + duration
+
+    def user() -> None:
+        while time.perf_counter() < deadline and (total is None or next(sent) < total):
+            sample = client.request()
+            with lock:
+                samples.append(sample)
+
+    threads = [threading.Thread(target=user, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def run_open_loop(client: LoadClient, rate: float, duration: float, total: Optional[int], max_in_flight: int,
+                  seed: int = 0) -> List[Sample]:
+    """Requests arrive as a Poisson process with the given rate per second, whether the previous ones are finished or not."""
+    rng = random.Random(seed)
+    futures = []
+    start = time.perf_counter()
+    next_arrival = start
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        while next_arrival - start < duration and (total is None or len(futures) < total):
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(client.request, next_arrival))
+            next_arrival += rng.expovariate(rate)
+        return [future.result() for future in futures]
+
+
+def percentile(values: List[float], share: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(share * len(values)) - 1)]
+
+
+def summarize(samples: List[Sample], elapsed: float) -> dict:
+    ok = [sample for sample in samples if sample.status == 200]
+    latencies = [sample.latency for sample in ok]
+    errors: Dict[str, int] = {}
+    for sample in samples:
+        if sample.status != 200:
+            key = str(sample.status) if sample.status else sample.error
+            errors[key] = errors.get(key, 0) + 1
+
+    stage_seconds: Dict[str, float] = {}
+    for sample in ok:
+        for stage, seconds in sample.timings.items():
+            stage_seconds[stage] = stage_seconds.get(stage, 0.0) + seconds
+
+    return dict(
+        requests=len(samples),
+        succeeded=len(ok),
+        error_rate=(len(samples) - len(ok)) / len(samples) if samples else 0.0,
+        errors=errors,
+        elapsed_seconds=elapsed,
+        throughput=len(ok) / elapsed if elapsed else 0.0,
+        latency=dict(
+            mean=sum(latencies) / len(latencies) if latencies else 0.0,
+            p50=percentile(latencies, 0.5),
+            p95=percentile(latencies, 0.95),
+            p99=percentile(latencies, 0.99),
+            max=max(latencies, default=0.0)
+        ),
+        server_stage_seconds_mean={stage: seconds / len(ok) for stage, seconds in sorted(stage_seconds.items())}
+    )
+
+
+def print_summary(summary: dict) -> None:
+    latency = summary["latency"]
+    print(f"requests: {summary['requests']}, succeeded: {summary['succeeded']}, error rate: {summary['error_rate']:.1%}")
+    for error, errors_count in summary["errors"].items():
+        print(f"  {error}: {errors_count}")
+    print(f"throughput: {summary['throughput']:.2f} docs/s over {summary['elapsed_seconds']:.1f}s")
+    print(f"latency, s: mean {latency['mean']:.3f}  p50 {latency['p50']:.3f}  p95 {latency['p95']:.3f}  "
+          f"p99 {latency['p99']:.3f}  max {latency['max']:.3f}")
+    if summary["server_stage_seconds_mean"]:
+        print("server stages, mean s per document:")
+        for stage, seconds in sorted(summary["server_stage_seconds_mean"].items(), key=lambda item: -item[1]):
+            print(f"  {stage:<24} {seconds:.3f}")
+
+
+@contextmanager
+def local_server(workers: int, job_workers: int) -> Iterator[str]:
+    """Starts the app with uvicorn on a free local port, as the Dockerfile does, with its own jobs folder."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    with tempfile.TemporaryDirectory() as jobs_dir:
+        env = dict(os.environ, JOBS_DIR=jobs_dir, JOB_WORKERS=str(job_workers))
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+            cwd=backend_dir, env=env
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            for _ in range(600):
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+                try:
+                    requests.get(f"{base_url}/metrics", timeout=1)
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn did not start in 60 seconds")
+            yield base_url
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replays a folder of PDFs against the HTTP service and reports latency percentiles")
+    parser.add_argument("pdf_dir", type=Path)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", choices=["extract", "jobs"], default="extract",
+                        help="extract: POST /extract-text, jobs: POST /jobs, poll the status and fetch the result")
+    parser.add_argument("--concurrency", type=int, default=4, help="closed loop: simultaneous users")
+    parser.add_argument("--rate", type=float, help="open loop: Poisson arrivals per second instead of --concurrency")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="open loop: limit of simultaneous requests")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to send requests for")
+    parser.add_argument("--requests", type=int, help="stop after this many requests")
+    parser.add_argument("--no-corrected-pdf", dest="corrected_pdf", action="store_false")
+    parser.add_argument("--allow-cache", dest="unique_bodies", action="store_false",
+                        help="send the files as is, repeated files are then served from the result cache")
+    parser.add_argument("--spawn", action="store_true", help="start the app locally with uvicorn instead of using --url")
+    parser.add_argument("--workers", type=int, default=1, help="--spawn: uvicorn workers")
+    parser.add_argument("--job-workers", type=int, default=1, help="--spawn: JOB_WORKERS of the app")
+    parser.add_argument("--output", type=Path, help="save the summary as JSON")
+    args = parser.parse_args(argv)
+
+    pdf_paths = sorted(args.pdf_dir.glob("*.pdf"))
+    if not pdf_paths:
+        parser.error(f"no PDFs in {args.pdf_dir}")
+
+    with (local_server(args.workers, args.job_workers) if args.spawn else nullcontext(args.url)) as base_url:
+        client = LoadClient(base_url, pdf_paths, args.endpoint, args.corrected_pdf, args.unique_bodies)
+        start = time.perf_counter()
+        if args.rate:
+            samples = run_open_loop(client, args.rate, args.duration, args.requests, args.max_in_flight)
+        else:
+            samples = run_closed_loop(client, args.concurrency, args.duration, args.requests)
+        summary = summarize(samples, time.perf_counter() - start)
+
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return 0 if summary["succeeded"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import fitz
+import numpy as np
+
+from pdf_broken_encoding_reader import config
+from pdf_broken_encoding_reader.functions import correctly_resize, is_empty
+from pdf_broken_encoding_reader.rasterizer import UnsupportedFont, rasterize_font
+
+
+def extract_fonts(pdf_paths: List[Path], fonts_dir: Path) -> List[Path]:
+    """Writes the embedded fonts of the PDFs the same way PDFReader extracts them."""
+    font_paths = []
+    for pdf_path in pdf_paths:
+        with fitz.open(pdf_path) as doc:
+            xrefs = {fontinfo[0] for page_num in range(doc.page_count) for fontinfo in doc.get_page_fonts(page_num)}
+            for xref in sorted(xrefs):
+                font = doc.extract_font(xref, named=True)
+                if font["ext"] == "n/a":
+                    continue
+                font_path = fonts_dir.joinpath(f"{pdf_path.stem}_{xref}.{font['ext']}")
+                font_path.write_bytes(font["content"])
+                font_paths.append(font_path)
+    return font_paths
+
+
+def fontforge_images(font_path: Path) -> Dict[str, np.ndarray]:
+    """Glyph images of the fontforge engine: fontforge_wrapper export + correctly_resize, as PDFReader does."""
+    from PIL import Image
+
+    with tempfile.TemporaryDirectory() as save_dir:
+        with open(os.devnull, "wb") as devnull:
+            subprocess.check_output(["fontforge", "-script", str(config.folders["ffwraper_folder"]), "generate_all_images",
+                                     save_dir, str(font_path)], stderr=devnull)
+        images = {}
+        for png_path in Path(save_dir).glob("*.png"):
+            if is_empty(str(png_path)):
+                continue
+            correctly_resize(str(png_path))
+            images[png_path.stem] = np.asarray(Image.open(png_path).convert("L"))
+        return images
+
+
+def numpy_images(font_path: Path) -> Dict[str, np.ndarray]:
+    keys, images, _, _, _ = rasterize_font(font_path)
+    return dict(zip(keys, images))
+
+
+def timed(function, *args) -> Tuple[object, float]:
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def compare_images(reference: Dict[str, np.ndarray], candidate: Dict[str, np.ndarray]) -> dict:
+    """Share of fontforge glyphs found by the numpy engine, mean absolute pixel difference and IoU of the ink masks."""
+    common = sorted(set(reference) & set(candidate))
+    if not common:
+        return dict(glyph_parity=0.0, mean_abs_diff=None, iou=None)
+    diffs, ious = [], []
+    for key in common:
+        a = reference[key].astype(np.float32)
+        b = candidate[key].astype(np.float32)
+        diffs.append(np.abs(a - b).mean())
+        mask_a, mask_b = a > 127, b > 127
+        union = (mask_a | mask_b).sum()
+        ious.append((mask_a & mask_b).sum() / union if union else 1.0)
+    return dict(glyph_parity=len(common) / max(len(reference), 1), mean_abs_diff=float(np.mean(diffs)), iou=float(np.mean(ious)))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compares the numpy glyph rasterizer with fontforge: speed and image parity")
+    parser.add_argument("inputs", type=Path, nargs="+", help="PDFs or a folder of PDFs to take the embedded fonts from")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per font, the fastest one is kept")
+    args = parser.parse_args(argv)
+
+    pdf_paths = []
+    for input_path in args.inputs:
+        pdf_paths.extend(sorted(input_path.glob("*.pdf")) if input_path.is_dir() else [input_path])
+    has_fontforge = shutil.which("fontforge") is not None
+    if not has_fontforge:
+        print("fontforge not found: timing the numpy engine only", file=sys.stderr)
+
+    totals = {"fontforge": 0.0, "numpy": 0.0, "glyphs": 0}
+    with tempfile.TemporaryDirectory() as fonts_dir:
+        print(f"{'font':<40} {'glyphs':>7} {'numpy, s':>9} {'ff, s':>9} {'speedup':>8} {'parity':>7} {'diff':>7} {'IoU':>6}")
+        for font_path in extract_fonts(pdf_paths, Path(fonts_dir)):
+            try:
+                runs = [timed(numpy_images, font_path) for _ in range(args.repeat)]
+            except UnsupportedFont as e:
+                print(f"{font_path.name:<40} unsupported: {e}")
+                continue
+            images, numpy_seconds = min(runs, key=lambda run: run[1])
+            totals["numpy"] += numpy_seconds
+            totals["glyphs"] += len(images)
+            line = f"{font_path.name:<40} {len(images):>7} {numpy_seconds:>9.3f}"
+            if has_fontforge:
+                reference, ff_seconds = min((timed(fontforge_images, font_path) for _ in range(args.repeat)), key=lambda run: run[1])
+                totals["fontforge"] += ff_seconds
+                parity = compare_images(reference, images)
+                diff = f"{parity['mean_abs_diff']:.1f}" if parity["mean_abs_diff"] is not None else "-"
+                iou = f"{parity['iou']:.3f}" if parity["iou"] is not None else "-"
+                line += f" {ff_seconds:>9.3f} {ff_seconds / numpy_seconds:>7.1f}x {parity['glyph_parity']:>7.1%} {diff:>7} {iou:>6}"
+            print(line)
+
+    print(f"\nnumpy: {totals['glyphs']} glyphs in {totals['numpy']:.3f}s ({totals['glyphs'] / max(totals['numpy'], 1e-9):.0f} glyphs/s)")
+    if has_fontforge:
+        print(f"fontforge: {totals['fontforge']:.3f}s, speedup {totals['fontforge'] / max(totals['numpy'], 1e-9):.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,12 @@
-from typing import List
+from typing import List, Union
 
 from pdfminer.layout import LTPage, LTTextLine, LTTextBox
 
+from pdf_broken_encoding_reader.pdf_worker.compact_page import CompactPage
 
-def extract_text_per_page(pages: List[LTPage]) -> List[str]:
-    return [extract_text_from_ltpage(page) for page in pages]
+
+def extract_text_per_page(pages: List[Union[LTPage, CompactPage]]) -> List[str]:
+    return [page.get_text() if isinstance(page, CompactPage) else extract_text_from_ltpage(page) for page in pages]
 
 
 def extract_text_from_ltpage(page: LTPage) -> str:
@@ -0,0 +1,640 @@
+import enum
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from pdf_broken_encoding_reader.metrics import Metrics, null_metrics
+from profiling import profile_run
+from settings import (collect_metrics, font_cache_mb, glyph_engine, job_cost_aging, job_fair_window, job_heartbeat_interval,
+                      job_stale_after, page_store_mb, scratch_dir, scratch_quota_mb, store_pages)
+
+if TYPE_CHECKING:
+    from pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    worker_pid INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL,
+    options TEXT NOT NULL DEFAULT '{}',
+    input_hash TEXT,
+    profiled INTEGER NOT NULL DEFAULT 0,
+    client TEXT,
+    cost REAL NOT NULL DEFAULT 0,
+    started_at REAL,
+    parent_id TEXT,
+    start_page INTEGER NOT NULL DEFAULT 0,
+    end_page INTEGER NOT NULL DEFAULT 0,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS jobs_input_hash ON jobs (input_hash, options);
+CREATE INDEX IF NOT EXISTS jobs_started ON jobs (started_at);
+CREATE INDEX IF NOT EXISTS jobs_parent ON jobs (parent_id, start_page);
+CREATE TABLE IF NOT EXISTS metrics (
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, name)
+);
+"""
+
+# колонки, добавленные после создания таблицы: хранилище переживает обновления сервиса
+added_columns = dict(
+    options="TEXT NOT NULL DEFAULT '{}'",
+    input_hash="TEXT",
+    profiled="INTEGER NOT NULL DEFAULT 0",
+    client="TEXT",
+    cost="REAL NOT NULL DEFAULT 0",
+    started_at="REAL",
+    parent_id="TEXT",
+    start_page="INTEGER NOT NULL DEFAULT 0",
+    end_page="INTEGER NOT NULL DEFAULT 0",
+    chunks="INTEGER NOT NULL DEFAULT 0",
+    heartbeat_at="REAL"
+)
+
+purge_interval = 60.0
+
+
+class JobStatus(str, enum.Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+finished_statuses = (JobStatus.done.value, JobStatus.failed.value, JobStatus.cancelled.value)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def dump_options(options: Optional[Dict]) -> str:
+    return json.dumps(options or {}, sort_keys=True)
+
+
+def row_to_job(row: sqlite3.Row) -> Dict:
+    job = dict(row)
+    job["options"] = json.loads(job["options"])
+    return job
+
+
+class JobStore:
+    """
+    Persistent job table in a local SQLite file.
+    Every job owns a folder in jobs_dir with the uploaded PDF and the results.
+    """
+
+    def __init__(self, db_path: Path, jobs_dir: Path) -> None:
+        self.db_path = db_path
+        self.jobs_dir = jobs_dir
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        with self.__connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, ddl in added_columns.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {ddl}")
+            conn.executescript(INDEXES)
+
+    @contextmanager
+    def __connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def job_dir(self, job_id: str) -> Path:
+        return self.jobs_dir.joinpath(job_id)
+
+    def input_path(self, job_id: str) -> Path:
+        return self.job_dir(job_id).joinpath("input.pdf")
+
+    def result_path(self, job_id: str) -> Path:
+        return self.job_dir(job_id).joinpath("result.json")
+
+    def corrected_pdf_path(self, job_id: str) -> Path:
+        return self.job_dir(job_id).joinpath("corrected.pdf")
+
+    def create(self, filename: str, upload_path: Path, options: Optional[Dict] = None,
+               status: JobStatus = JobStatus.queued, input_hash: Optional[str] = None, client: Optional[str] = None,
+               cost: float = 0.0, chunks: Sequence[Tuple[int, int, float]] = ()) -> str:
+        """
+        Moves the uploaded file into the job folder and registers the job.
+        Synchronous requests pass status=running to keep their results in the same store.
+        Queued jobs carry the client and the expected cost for the scheduler; with several (start page, end page, cost)
+        chunks the workers claim the chunks instead of the job, and the worker of the last chunk merges their results.
+        """
+        job_id = uuid.uuid4().hex
+        self.job_dir(job_id).mkdir()
+        shutil.move(str(upload_path), str(self.input_path(job_id)))
+        now = time.time()
+        chunk_rows = [
+            (uuid.uuid4().hex, filename, JobStatus.queued.value, dump_options(options), client, chunk_cost, job_id, start, end, now, now)
+            for start, end, chunk_cost in (chunks if len(chunks) > 1 else ())
+        ]
+        for chunk_row in chunk_rows:
+            self.job_dir(chunk_row[0]).mkdir()
+        with self.__connect() as conn:
+            # задача и ее части появляются одной транзакцией, чтобы воркер не взял задачу целиком
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO jobs (id, filename, status, options, input_hash, worker_pid, heartbeat_at, client, cost, chunks, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, filename, status.value, dump_options(options), input_hash, os.getpid() if status == JobStatus.running else None,
+                 now if status == JobStatus.running else None, client, cost, len(chunk_rows), now, now)
+            )
+            conn.executemany(
+                "INSERT INTO jobs (id, filename, status, options, client, cost, parent_id, start_page, end_page, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                chunk_rows
+            )
+            conn.execute("COMMIT")
+        return job_id
+
+    def find_done(self, input_hash: str, options: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        Result cache: the latest finished job for the same file contents and options, if it hasn't expired yet.
+        """
+        with self.__connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE input_hash = ? AND options = ? AND status = ? ORDER BY finished_at DESC LIMIT 1",
+                (input_hash, dump_options(options), JobStatus.done.value)
+            ).fetchone()
+        if row is None or not self.result_path(row["id"]).exists():
+            return None
+        return row_to_job(row)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self.__connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row_to_job(row) if row is not None else None
+
+    def save_result(self, job_id: str, texts_per_page: List[str], corrected_pdf_path: Optional[str], repair_skipped: bool = False,
+                    metrics: Optional[Dict] = None, glyph_map: Optional[Dict[str, Dict[str, str]]] = None) -> None:
+        if corrected_pdf_path is not None:
+            shutil.move(str(corrected_pdf_path), str(self.corrected_pdf_path(job_id)))
+
+        result_path = self.result_path(job_id)
+        tmp_path = result_path.with_suffix(".tmp")
+        result = {
+            "text": "\n".join(texts_per_page),
+            "pages": texts_per_page,
+            "repair_skipped": repair_skipped,
+            "metrics": metrics or {}
+        }
+        if glyph_map is not None:
+            result["glyph_map"] = glyph_map
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp_path, result_path)
+
+    def load_result(self, job_id: str) -> Dict:
+        with open(self.result_path(job_id), encoding="utf-8") as f:
+            return json.load(f)
+
+    def chunks(self, job_id: str) -> List[Dict]:
+        with self.__connect() as conn:
+            rows = conn.execute("SELECT * FROM jobs WHERE parent_id = ? ORDER BY start_page", (job_id,)).fetchall()
+        return [row_to_job(row) for row in rows]
+
+    def claim(self, worker_pid: int, fair_window: float = 0.0, aging: float = 0.0) -> Optional[Dict]:
+        """
+        Takes the next queued job or chunk. The clients that used the workers least over the last fair_window seconds go first,
+        among their jobs the cheapest one, with the cost lowered by aging for every second in the queue.
+        Jobs split into chunks are never taken themselves, only their chunks.
+        """
+        now = time.time()
+        with self.__connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT jobs.* FROM jobs LEFT JOIN ("
+                    "    SELECT client, SUM(cost) AS used FROM jobs WHERE started_at > ? AND chunks = 0 GROUP BY client"
+                    ") AS usage ON usage.client IS jobs.client "
+                    "WHERE jobs.status = ? AND jobs.chunks = 0 "
+                    "ORDER BY COALESCE(usage.used, 0), jobs.cost - (? - jobs.created_at) * ?, jobs.created_at, jobs.start_page LIMIT 1",
+                    (now - fair_window, JobStatus.queued.value, now, aging)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, worker_pid = ?, started_at = ?, heartbeat_at = ?, updated_at = ? WHERE id = ?",
+                        (JobStatus.running.value, worker_pid, now, now, now, row["id"])
+                    )
+                    if row["parent_id"] is not None:
+                        conn.execute(
+                            "UPDATE jobs SET status = ?, started_at = COALESCE(started_at, ?), updated_at = ? WHERE id = ? AND status = ?",
+                            (JobStatus.running.value, now, now, row["parent_id"], JobStatus.queued.value)
+                        )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return row_to_job(row) if row is not None else None
+
+    def update_progress(self, job_id: str, stage: str, done: int, total: int) -> None:
+        with self.__connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET stage = ?, done = ?, total = ?, updated_at = ? WHERE id = ?",
+                (stage, done, total, time.time(), job_id)
+            )
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        with self.__connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is None or bool(row["cancel_requested"])
+
+    def finish(self, job_id: str, status: JobStatus, error: Optional[str] = None) -> None:
+        now = time.time()
+        with self.__connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+                (status.value, error, now, now, job_id)
+            )
+
+    def finish_chunk(self, chunk: Dict, status: JobStatus, error: Optional[str] = None) -> bool:
+        """
+        Finishes a chunk and updates its job: a failed or cancelled chunk ends the job and stops its other chunks.
+        Returns True for the last chunk done, its worker merges the results into the job.
+        """
+        now = time.time()
+        job_id = chunk["parent_id"]
+        with self.__connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+                    (status.value, error, now, now, chunk["id"])
+                )
+                if status == JobStatus.done:
+                    done = conn.execute(
+                        "SELECT COUNT(*) FROM jobs WHERE parent_id = ? AND status = ?", (job_id, JobStatus.done.value)
+                    ).fetchone()[0]
+                    conn.execute(
+                        "UPDATE jobs SET stage = 'chunks', done = ?, total = chunks, updated_at = ? WHERE id = ?", (done, now, job_id)
+                    )
+                    last = conn.execute("SELECT 1 FROM jobs WHERE id = ? AND chunks = ?", (job_id, done)).fetchone() is not None
+                else:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, error = ?, updated_at = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)",
+                        (status.value, error, now, now, job_id, JobStatus.queued.value, JobStatus.running.value)
+                    )
+                    self.__cancel_chunks(conn, job_id, now)
+                    last = False
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return last
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Queued jobs are cancelled at once, running ones are flagged and stopped by their worker at the next stage or page.
+        Returns the resulting status or None if there is no such job.
+        """
+        now = time.time()
+        with self.__connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (JobStatus.cancelled.value, now, now, job_id, JobStatus.queued.value)
+            )
+            conn.execute(
+                "UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ? AND status = ?",
+                (now, job_id, JobStatus.running.value)
+            )
+            self.__cancel_chunks(conn, job_id, now)
+            # задача, разбитая на части, между частями никем не выполняется и отменяется сразу
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ? AND chunks > 0 "
+                "AND NOT EXISTS (SELECT 1 FROM jobs WHERE parent_id = ? AND status = ?)",
+                (JobStatus.cancelled.value, now, job_id, JobStatus.running.value, job_id, JobStatus.running.value)
+            )
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row is not None else None
+
+    @staticmethod
+    def __cancel_chunks(conn: sqlite3.Connection, job_id: str, now: float) -> None:
+        conn.execute(
+            "UPDATE jobs SET status = ?, updated_at = ?, finished_at = ? WHERE parent_id = ? AND status = ?",
+            (JobStatus.cancelled.value, now, now, job_id, JobStatus.queued.value)
+        )
+        conn.execute(
+            "UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE parent_id = ? AND status = ?",
+            (now, job_id, JobStatus.running.value)
+        )
+
+    def heartbeat(self, worker_pid: int) -> None:
+        """Marks the jobs running in the process as alive."""
+        with self.__connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE worker_pid = ? AND status = ?", (time.time(), worker_pid, JobStatus.running.value)
+            )
+
+    def requeue_orphaned(self, stale_after: float) -> List[str]:
+        """
+        Requeues the running jobs whose process hasn't sent a heartbeat for stale_after seconds: it died or was restarted.
+        Jobs of live processes are left alone, so any process may call it, at start or periodically.
+        Jobs split into chunks follow their chunks and are skipped. Returns the ids of the requeued and cancelled jobs.
+        """
+        now = time.time()
+        with self.__connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? AND chunks = 0 AND COALESCE(heartbeat_at, updated_at) < ?",
+                    (JobStatus.running.value, now - stale_after)
+                ).fetchall()
+                orphaned = [row["id"] for row in rows]
+                for job_id in orphaned:
+                    # отмененная до падения задача не перезапускается
+                    conn.execute(
+                        "UPDATE jobs SET status = CASE WHEN cancel_requested = 0 THEN ? ELSE ? END, "
+                        "finished_at = CASE WHEN cancel_requested = 0 THEN NULL ELSE ? END, "
+                        "stage = NULL, done = 0, total = 0, worker_pid = NULL, heartbeat_at = NULL, updated_at = ? WHERE id = ?",
+                        (JobStatus.queued.value, JobStatus.cancelled.value, now, now, job_id)
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return orphaned
+
+    def mark_profiled(self, job_id: str) -> None:
+        with self.__connect() as conn:
+            conn.execute("UPDATE jobs SET profiled = 1 WHERE id = ?", (job_id,))
+
+    def list_profiled(self, limit: int = 100) -> List[Dict]:
+        with self.__connect() as conn:
+            rows = conn.execute("SELECT * FROM jobs WHERE profiled = 1 ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [row_to_job(row) for row in rows]
+
+    def add_metrics(self, metrics: Dict[str, Dict[str, float]]) -> None:
+        """
+        Adds {kind: {name: value}} to the service-wide totals, shared by the API process and all workers.
+        """
+        rows = [(kind, name, value) for kind, values in metrics.items() for name, value in values.items()]
+        with self.__connect() as conn:
+            conn.executemany(
+                "INSERT INTO metrics (kind, name, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (kind, name) DO UPDATE SET value = value + excluded.value",
+                rows
+            )
+
+    def read_metrics(self) -> Dict[str, Dict[str, float]]:
+        metrics = {}
+        with self.__connect() as conn:
+            for row in conn.execute("SELECT kind, name, value FROM metrics ORDER BY kind, name"):
+                metrics.setdefault(row["kind"], {})[row["name"]] = row["value"]
+        return metrics
+
+    def purge_expired(self, ttl: float) -> List[str]:
+        deadline = time.time() - ttl
+        placeholders = ", ".join("?" for _ in finished_statuses)
+        with self.__connect() as conn:
+            rows = conn.execute(
+                f"SELECT id FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?", (*finished_statuses, deadline)
+            ).fetchall()
+            expired = [row["id"] for row in rows]
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired])
+        for job_id in expired:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        return expired
+
+
+class Heartbeat:
+    """Daemon thread that calls store.heartbeat for the current process every interval seconds until stopped."""
+
+    def __init__(self, store: JobStore, interval: float) -> None:
+        self.store = store
+        self.interval = interval
+        self.__stopped = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def start(self) -> "Heartbeat":
+        self.__thread = threading.Thread(target=self.__run, name="job-heartbeat", daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def __run(self) -> None:
+        while not self.__stopped.wait(self.interval):
+            try:
+                self.store.heartbeat(os.getpid())
+            except sqlite3.Error:
+                # пропущенный удар не страшен: задача считается брошенной только после job_stale_after
+                pass
+
+
+def run_job(store: JobStore, reader: "PDFReader", job: Dict, on_progress: Optional[Callable[[str, int, int], None]] = None) -> None:
+    """Runs PDFReader over the job input page by page and saves the result into the store."""
+    input_path = store.input_path(job["id"])
+    options = job["options"]
+    metrics = Metrics() if collect_metrics else null_metrics
+    reader.metrics = metrics
+    profiler = profile_run(store.job_dir(job["id"]), job["input_hash"]) if options.get("profile") else nullcontext()
+    try:
+        with profiler, metrics.stage("total"):
+            pages = reader.iter_pages(input_path, on_progress=on_progress, skip_if_correct=not options.get("force_repair", False))
+            texts_per_page = [page.get_text() for page in pages]
+            if options.get("corrected_pdf", True):
+                reader.write_corrected_pdf(input_path, output_path=store.corrected_pdf_path(job["id"]))
+    finally:
+        reader.metrics = null_metrics
+    if options.get("profile"):
+        store.mark_profiled(job["id"])
+    metrics.count("documents")
+    metrics.count("repair_skipped", int(reader.repair_skipped))
+    store.save_result(job["id"], texts_per_page, None, repair_skipped=reader.repair_skipped, metrics=metrics.as_dict())
+    if metrics.enabled:
+        store.add_metrics({"stage_seconds": metrics.timings, "stage_calls": metrics.calls, "counter": metrics.counters})
+
+
+def run_chunk(store: JobStore, reader: "PDFReader", chunk: Dict, on_progress: Optional[Callable[[str, int, int], None]] = None) -> None:
+    """Runs PDFReader over the pages of a chunk and saves their texts with the glyph map for the merge."""
+    input_path = store.input_path(chunk["parent_id"])
+    options = chunk["options"]
+    metrics = Metrics() if collect_metrics else null_metrics
+    reader.metrics = metrics
+    try:
+        with metrics.stage("total"):
+            pages = reader.iter_pages(input_path, on_progress=on_progress, skip_if_correct=not options.get("force_repair", False),
+                                      start_page=chunk["start_page"], end_page=chunk["end_page"])
+            texts_per_page = [page.get_text() for page in pages]
+    finally:
+        reader.metrics = null_metrics
+    metrics.count("chunks")
+    store.save_result(chunk["id"], texts_per_page, None, repair_skipped=reader.repair_skipped, metrics=metrics.as_dict(),
+                      glyph_map=reader.glyph_map())
+    if metrics.enabled:
+        store.add_metrics({"stage_seconds": metrics.timings, "stage_calls": metrics.calls, "counter": metrics.counters})
+
+
+def merge_chunks(store: JobStore, reader: "PDFReader", job_id: str) -> None:
+    """
+    Joins the results of the chunks into the job result. Runs in the worker of the last chunk right after it,
+    so the reader still holds the fonts of the document and only takes the glyphs met in the other chunks.
+    """
+    job = store.get(job_id)
+    results = [store.load_result(chunk["id"]) for chunk in store.chunks(job_id)]
+    texts_per_page = [text for result in results for text in result["pages"]]
+    glyph_map: Dict[str, Dict[str, str]] = {}
+    for result in results:
+        for fontname, glyphs in result.get("glyph_map", {}).items():
+            glyph_map.setdefault(fontname, {}).update(glyphs)
+
+    metrics = Metrics() if collect_metrics else null_metrics
+    reader.metrics = metrics
+    try:
+        with metrics.stage("merge"):
+            input_path = store.input_path(job_id)
+            if job["options"].get("corrected_pdf", True):
+                reader.write_corrected_pdf(input_path, glyph_map, output_path=store.corrected_pdf_path(job_id))
+    finally:
+        reader.metrics = null_metrics
+    metrics.count("documents")
+    metrics.count("repair_skipped", int(reader.repair_skipped))
+    if metrics.enabled:
+        store.add_metrics({"stage_seconds": metrics.timings, "stage_calls": metrics.calls, "counter": metrics.counters})
+        # в ответе задачи — суммарные замеры всех частей
+        for result in results:
+            for name, seconds in result["metrics"].get("timings", {}).items():
+                metrics.timings[name] = metrics.timings.get(name, 0.0) + seconds
+            for name, calls in result["metrics"].get("calls", {}).items():
+                metrics.calls[name] = metrics.calls.get(name, 0) + calls
+            for name, value in result["metrics"].get("counters", {}).items():
+                metrics.count(name, value)
+    store.save_result(job_id, texts_per_page, None, repair_skipped=reader.repair_skipped, metrics=metrics.as_dict())
+
+
+def process_job(store: JobStore, reader: "PDFReader", job: Dict) -> None:
+    if job["parent_id"] is not None:
+        process_chunk(store, reader, job)
+        return
+    job_id = job["id"]
+
+    def on_progress(stage: str, done: int, total: int) -> None:
+        if store.is_cancel_requested(job_id):
+            raise JobCancelled(job_id)
+        store.update_progress(job_id, stage, done, total)
+
+    try:
+        run_job(store, reader, job, on_progress=on_progress)
+    except JobCancelled:
+        store.finish(job_id, JobStatus.cancelled)
+    except Exception as e:
+        store.finish(job_id, JobStatus.failed, error=str(e))
+    else:
+        store.finish(job_id, JobStatus.done)
+
+
+def process_chunk(store: JobStore, reader: "PDFReader", chunk: Dict) -> None:
+    chunk_id, job_id = chunk["id"], chunk["parent_id"]
+
+    def on_progress(stage: str, done: int, total: int) -> None:
+        if store.is_cancel_requested(chunk_id):
+            raise JobCancelled(chunk_id)
+        store.update_progress(chunk_id, stage, done, total)
+
+    try:
+        run_chunk(store, reader, chunk, on_progress=on_progress)
+    except JobCancelled:
+        store.finish_chunk(chunk, JobStatus.cancelled)
+        return
+    except Exception as e:
+        store.finish_chunk(chunk, JobStatus.failed, error=str(e))
+        return
+    if not store.finish_chunk(chunk, JobStatus.done):
+        return
+    try:
+        merge_chunks(store, reader, job_id)
+    except Exception as e:
+        store.finish(job_id, JobStatus.failed, error=str(e))
+    else:
+        store.finish(job_id, JobStatus.done)
+
+
+def run_worker(db_path: Path, jobs_dir: Path, poll_interval: float, result_ttl: float,
+               should_retire: Optional[Callable[[int], bool]] = None) -> None:
+    """
+    Claims and processes queued jobs until should_retire(number of processed jobs) returns True after a job.
+    Without should_retire the worker runs until it is terminated.
+    """
+    from pdf_broken_encoding_reader.font_cache import DiskFontCache
+    from pdf_broken_encoding_reader.page_store import DiskPageStore
+    from pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader
+    from pdf_broken_encoding_reader.scratch import ScratchSpace
+
+    store = JobStore(db_path, jobs_dir)
+    Heartbeat(store, job_heartbeat_interval).start()
+    scratch = ScratchSpace(scratch_dir, scratch_quota_mb)
+    page_store = DiskPageStore(jobs_dir.joinpath("page_store"), max_mb=page_store_mb) if store_pages else None
+    # части одного документа могут попасть к разным воркерам: распознанные шрифты общие для всех воркеров
+    font_cache = DiskFontCache(jobs_dir.joinpath("font_cache"), max_mb=font_cache_mb)
+    reader = PDFReader(glyph_engine=glyph_engine, font_cache=font_cache,
+                       scratch=scratch, page_store=page_store)
+    last_purge = 0.0
+    processed = 0
+    while True:
+        if time.time() - last_purge > purge_interval:
+            store.purge_expired(result_ttl)
+            # задачи упавших воркеров возвращаются в очередь, пока остальные воркеры работают
+            store.requeue_orphaned(job_stale_after)
+            last_purge = time.time()
+
+        job = store.claim(os.getpid(), fair_window=job_fair_window, aging=job_cost_aging)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        process_job(store, reader, job)
+        processed += 1
+        if should_retire is not None and should_retire(processed):
+            return
+
+
+def start_workers(count: int, db_path: Path, jobs_dir: Path, poll_interval: float, result_ttl: float) -> List[multiprocessing.Process]:
+    # spawn, чтобы не копировать в воркеры состояние event loop сервера
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for _ in range(count):
+        worker = context.Process(target=run_worker, args=(db_path, jobs_dir, poll_interval, result_ttl), daemon=True)
+        worker.start()
+        workers.append(worker)
+    return workers
+
+
+def stop_workers(workers: List[multiprocessing.Process]) -> None:
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.join()
@@ -1,14 +1,69 @@
-from pathlib import Path
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+import zipfile
+from contextlib import asynccontextmanager
+from pathlib import Path, PurePath
+import threading
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Iterator, List, Optional, Tuple
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import Depends, FastAPI, UploadFile, File, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-import os
-import tempfile
-from pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader  # Импортируем ваш метод
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pdf_broken_encoding_reader.cancellation import Cancelled, CancelToken
+from pdf_broken_encoding_reader.font_cache import DiskFontCache, FontCache
+from pdf_broken_encoding_reader.page_store import DiskPageStore
+from pdf_broken_encoding_reader.scratch import ScratchSpace
+
+import profiling
+import settings
+from archives import ArchiveTooLarge, ZipStream, copy_into_zip, extract_pdfs, unique_name
+from jobs import Heartbeat, JobStatus, JobStore, dump_options, run_job, start_workers, stop_workers
+from monitoring import render_prometheus
+from quality import Load, apply_level, choose_level, level_names, quality_levels
+from scheduling import estimate_document, job_cost, plan_chunks
+from singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    from pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader
+
+job_store = JobStore(settings.jobs_db_path, settings.jobs_dir)
+# prefork.py выключает: там задачи восстанавливает и воркеры задач запускает мастер-процесс, а не каждый HTTP-воркер
+manage_jobs = True
+# одинаковые одновременные запросы (тот же файл и параметры) ждут одну обработку
+in_flight = SingleFlight()
+# fitz не потокобезопасен: синхронные запросы и проверки загрузок процесса выполняются в пуле потоков по одному
+extraction_lock = threading.Lock()
+# обработки процесса, выполняемые и ждущие extraction_lock: по ним выбирается уровень качества
+extraction_load = Load()
+# как часто запрос, ждущий extraction_lock, проверяет, не отменен ли он
+lock_poll_interval = 0.1
+scratch_space = ScratchSpace(settings.scratch_dir, settings.scratch_quota_mb)
+# распознанные шрифты и восстановленные страницы общие с воркерами задач: новая редакция документа,
+# загруженная любым способом, обрабатывается заново только в измененных страницах и новых шрифтах
+font_cache = DiskFontCache(settings.jobs_dir.joinpath("font_cache"), max_mb=settings.font_cache_mb)
+page_store = DiskPageStore(settings.jobs_dir.joinpath("page_store"), max_mb=settings.page_store_mb) if settings.store_pages else None
 
-from functions import extract_text_from_ltpage, extract_text_per_page
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    workers = []
+    # синхронные запросы этого процесса тоже выполняются как задачи в статусе running
+    heartbeat = Heartbeat(job_store, settings.job_heartbeat_interval).start()
+    if manage_jobs:
+        scratch_space.purge_stale()
+        # при uvicorn --workers N процесс, запущенный позже, не трогает задачи уже работающих процессов
+        job_store.requeue_orphaned(settings.job_stale_after)
+        workers = start_workers(settings.job_workers, settings.jobs_db_path, settings.jobs_dir, settings.job_poll_interval, settings.job_result_ttl)
+    yield
+    stop_workers(workers)
+    heartbeat.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,32 +74,478 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post("/extract-text")
-async def extract_text(file: UploadFile = File(...)):
+
+@app.middleware("http")
+async def reject_large_uploads(request: Request, call_next):
+    # отказываем до разбора multipart, если размер тела известен заранее
+    content_length = request.headers.get("content-length")
+    max_bytes = settings.max_batch_bytes if request.url.path == "/extract-batch" else settings.max_upload_bytes
+    if request.method == "POST" and content_length is not None and content_length.isdigit() \
+            and int(content_length) > max_bytes + settings.upload_chunk_size:
+        return JSONResponse(status_code=413, content={"detail": "Файл слишком большой"})
+    return await call_next(request)
+
+
+async def save_upload(file: UploadFile, path: Path) -> str:
+    """
+    Пишет загрузку на диск частями, не держа файл в памяти, и возвращает sha256 содержимого.
+    Сам PDF проверяется позже, в inspect_pdf под extraction_lock.
+    """
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(400, detail="Требуется PDF-файл")
+    return await copy_upload(file, path, settings.max_upload_bytes)
+
+
+async def copy_upload(file: UploadFile, path: Path, max_bytes: int) -> str:
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as f:
+        while True:
+            chunk = await file.read(settings.upload_chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(413, detail="Файл слишком большой")
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(settings.upload_chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def run_locked(func: Callable[..., Any], *args: Any, token: Optional[CancelToken] = None) -> Any:
+    """
+    Runs func in the threadpool under extraction_lock, for fitz calls made while handling a request.
+    While it waits for the lock, a cancelled token stops the wait with Cancelled.
+    """
+    def locked() -> Any:
+        # не в цикле событий: большой PDF не задерживает другие запросы, а с extraction_lock не пересекается с обработкой
+        while not extraction_lock.acquire(timeout=lock_poll_interval):
+            if token is not None:
+                token.check()
+        try:
+            return func(*args)
+        finally:
+            extraction_lock.release()
+
+    return await run_in_threadpool(locked)
+
+
+def inspect_pdf(path: Path) -> Tuple[int, int]:
+    """Checks the upload with check_pdf and returns its page and glyph counts for the cost estimate."""
+    check_pdf(path)
+    return estimate_document(path)
+
+
+def check_pdf(path: Path) -> None:
+    import fitz
+
+    try:
+        with fitz.open(path) as doc:
+            page_count = doc.page_count
+    except Exception:
+        raise HTTPException(400, detail="Не удалось открыть PDF-файл")
+    if page_count > settings.max_pages:
+        raise HTTPException(413, detail=f"Слишком много страниц: {page_count} > {settings.max_pages}")
+
+
+def request_options(corrected_pdf: bool, force_repair: bool, x_profile: Optional[str], x_admin_token: Optional[str]) -> dict:
+    options = {"corrected_pdf": corrected_pdf, "force_repair": force_repair}
+    # профилируемые запросы всегда выполняются заново, мимо кэша результатов и замедляют весь процесс (tracemalloc),
+    # поэтому заголовок X-Profile принимается только с токеном администратора
+    if x_profile == "1":
+        check_admin_token(x_admin_token)
+    if settings.profile_requests or x_profile == "1":
+        options["profile"] = True
+    return options
+
+
+def job_result_response(job: dict, filename: Optional[str] = None) -> dict:
+    result = job_store.load_result(job["id"])
+    pdf_url = None
+    if job_store.corrected_pdf_path(job["id"]).exists():
+        pdf_url = str(app.url_path_for("get_job_pdf", job_id=job["id"]))
+    filename = filename or job["filename"]
+    return {
+        "id": job["id"],
+        "text": result["text"],
+        "pages": result["pages"],
+        "repair_skipped": result.get("repair_skipped", False),
+        "timings": result.get("metrics", {}).get("timings", {}),
+        "quality": job["options"].get("quality", level_names[0]),
+        "pdf_url": pdf_url,
+        "filename": "corrected_" + filename
+    }
+
+
+@app.post("/extract-text")
+async def extract_text(request: Request, file: UploadFile = File(...), corrected_pdf: bool = True, force_repair: bool = False,
+                       timeout: Optional[float] = None, quality: str = "auto", x_profile: Optional[str] = Header(None),
+                       x_admin_token: Optional[str] = Header(None)):
+    """
+    Синхронная обработка. Исправленный PDF не встраивается в ответ, а отдается по ссылке pdf_url,
+    при corrected_pdf=false он не создается вовсе.
+    Документы с корректным текстовым слоем не восстанавливаются (repair_skipped=true), если не передан force_repair=true.
+    timeout — срок запроса в секундах (по умолчанию REQUEST_TIMEOUT), по его истечении отдается 504. При этом,
+    как и при разрыве соединения, обработка останавливается, если ее результата не ждут такие же запросы.
+    quality — уровень качества (full, no_pdf, fast, minimal), при auto выбирается по сроку запроса и очереди процесса.
+    Использованный уровень возвращается в поле quality.
+    """
+    if quality != "auto" and quality not in quality_levels:
+        raise HTTPException(400, detail=f"Неизвестный уровень качества: {quality}")
+    timeout = timeout if timeout is not None else settings.request_timeout or None
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    options = request_options(corrected_pdf, force_repair, x_profile, x_admin_token)
+    token = CancelToken()
+    with scratch_space.session() as scratch:
+        upload_path = scratch.path.joinpath("upload.pdf")
+        input_hash = await save_upload(file, upload_path)
+
+        def start() -> Awaitable[str]:
+            # загрузка сразу переходит к обработке: та продолжается для остальных, даже если первый запрос уйдет
+            run_dir = scratch_space.mkdtemp()
+            os.replace(upload_path, run_dir.joinpath("upload.pdf"))
+            return process_upload(file.filename, run_dir, input_hash, options, quality, deadline, token)
+
+        if options.get("profile"):
+            job_id = await await_request(request, start(), deadline, abandon=token.cancel)
+        else:
+            # такие же загрузки объединяются еще до проверки PDF, которая ждет extraction_lock
+            key = (input_hash, dump_options(options), quality)
+            job_id, shared = await await_request(request, in_flight.do(key, start, abandon=token.cancel), deadline)
+            if shared:
+                job_store.add_metrics({"counter": {"in_flight_hits": 1}})
+    return job_result_response(job_store.get(job_id), filename=file.filename)
+
+
+async def process_upload(filename: str, run_dir: Path, input_hash: str, options: dict, quality: str,
+                         deadline: Optional[float], token: CancelToken) -> str:
+    """
+    Returns the id of a stored result for the upload in run_dir or of its extraction, which is started
+    at the quality level, picked here for "auto". The PDF is opened only if no stored result fits.
+    """
+    try:
+        upload_path = run_dir.joinpath("upload.pdf")
+        # без оценки документа подходит только результат полного качества
+        cached = find_cached(input_hash, options, quality if quality != "auto" else level_names[0])
+        if cached is None:
+            cost = job_cost(*await run_locked(inspect_pdf, upload_path, token=token))
+            if quality == "auto":
+                budget = max(deadline - time.monotonic(), 0) if deadline is not None else None
+                quality = choose_level(cost, extraction_load, budget)
+                cached = find_cached(input_hash, options, quality)
+        if cached is not None:
+            job_store.add_metrics({"counter": {"result_cache_hits": 1}})
+            return cached["id"]
+        job_store.add_metrics({"counter": {f"quality_{quality}": 1}})
+        return await start_extraction(filename, upload_path, apply_level(options, quality), input_hash, token,
+                                      cost * quality_levels[quality]["cost_factor"])
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def find_cached(input_hash: str, options: dict, quality: str) -> Optional[dict]:
+    """A finished result of the upload with the options at the quality level or a better one."""
+    if options.get("profile"):
+        return None
+    for level in level_names[:level_names.index(quality) + 1]:
+        cached = job_store.find_done(input_hash, apply_level(options, level))
+        if cached is not None:
+            return cached
+    return None
+
+
+async def await_request(request: Request, work: Awaitable[Any], deadline: Optional[float],
+                        abandon: Optional[Callable[[], None]] = None) -> Any:
+    """
+    Awaits the work of a request until the client disconnects or the deadline (time.monotonic) passes.
+    Then the wait is cancelled, abandon is called and HTTPException 499 or 504 is raised.
+    """
+    work = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(wait_disconnect(request))
+    timeout = max(deadline - time.monotonic(), 0) if deadline is not None else None
     try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            file_path = os.path.join(temp_dir, file.filename)
-            with open(file_path, "wb") as f:
-                f.write(await file.read())
-            reader = PDFReader()
-            result = reader.get_correct_layout(Path(file_path))
+        done, _ = await asyncio.wait({work, watcher}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if work in done:
+        return work.result()
+    work.cancel()
+    # сначала отмена: ожидание в пуле потоков заканчивается только после нее
+    if abandon is not None:
+        abandon()
+    await asyncio.wait({work})
+    if watcher in done:
+        job_store.add_metrics({"counter": {"client_disconnects": 1}})
+        raise HTTPException(499, detail="Клиент закрыл соединение")
+    job_store.add_metrics({"counter": {"deadline_exceeded": 1}})
+    raise HTTPException(504, detail="Истек срок обработки запроса")
+
 
-            pages_list = result[0][1]
-            good_pdf_path = str(result[1])
+async def wait_disconnect(request: Request) -> None:
+    # тело уже прочитано, поэтому следующее сообщение сервера — разрыв соединения.
+    # request.is_disconnected не подходит: за middleware он не видит сообщение, пришедшее без ожидания
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
 
-            texts_per_page = extract_text_per_page(pages_list)
-            return_text = '\n'.join(texts_per_page)
 
-            print(return_text)
-            print(good_pdf_path)
+def start_extraction(filename: str, upload_path: Path, options: dict, input_hash: str, token: CancelToken,
+                     cost: float) -> Awaitable[str]:
+    """Registers the job (the upload is moved into the store right away) and returns the awaitable of its processing."""
+    job_id = job_store.create(filename, upload_path, options=options, status=JobStatus.running, input_hash=input_hash)
+    return run_in_threadpool(run_extraction, job_id, token, cost)
 
-            with open(good_pdf_path, "rb") as f:
-                pdf_bytes = f.read()
-            import base64
-            return {"text": return_text, "pdf": base64.b64encode(pdf_bytes).decode("utf-8"), "filename": "corrected_" + file.filename}
-            # return {"text": return_text}
 
+def run_extraction(job_id: str, token: CancelToken, cost: float) -> str:
+    from pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader
+
+    job = job_store.get(job_id)
+    level = quality_levels[job["options"].get("quality", level_names[0])]
+    try:
+        with extraction_load.track(cost):
+            # отмененный запрос не дожидается своей очереди
+            while not extraction_lock.acquire(timeout=lock_poll_interval):
+                token.check()
+            try:
+                engine = level["glyph_engine"] or settings.glyph_engine
+                # растеризатор входит в ключ кэша шрифтов, поэтому уровни качества с другим растеризатором его не смешивают
+                reader = PDFReader(glyph_engine=engine, font_cache=font_cache, scratch=scratch_space, page_store=page_store)
+                reader.cancel_token = token
+                reader.max_glyphs_per_font = level["max_glyphs_per_font"]
+                run_job(job_store, reader, job)
+            finally:
+                extraction_lock.release()
+    except Cancelled:
+        job_store.finish(job_id, JobStatus.cancelled)
+        job_store.add_metrics({"counter": {"cancelled_extractions": 1}})
+        raise HTTPException(499, detail="Обработка отменена")
     except Exception as e:
+        job_store.finish(job_id, JobStatus.failed, error=str(e))
         raise HTTPException(500, detail=f"Ошибка обработки: {str(e)}")
+    job_store.finish(job_id, JobStatus.done)
+    return job_id
+
+
+@app.post("/extract-batch")
+async def extract_batch(files: List[UploadFile] = File(...), corrected_pdf: bool = True, force_repair: bool = False):
+    """
+    Обработка многих файлов за один запрос: PDF и ZIP-архивы с PDF в любом сочетании.
+    Файлы обрабатываются одним PDFReader с общим кэшем шрифтов, поэтому шрифт, встреченный в нескольких файлах,
+    распознается один раз. В ответ по мере обработки отдается ZIP: <имя>.txt и исправленный <имя>.pdf на каждый файл
+    и manifest.json со статусом каждого файла. Ошибка в одном файле не прерывает обработку остальных.
+    """
+    options = {"corrected_pdf": corrected_pdf, "force_repair": force_repair}
+    temp_dir = scratch_space.mkdtemp()
+    try:
+        inputs = await save_batch_uploads(files, temp_dir)
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    return StreamingResponse(iter_batch_results(inputs, options, temp_dir), media_type="application/zip",
+                             headers={"Content-Disposition": 'attachment; filename="results.zip"'})
+
+
+async def save_batch_uploads(files: List[UploadFile], temp_dir: Path) -> List[dict]:
+    """Saves the uploads and unpacks the archives, returns {"name", "path"} per PDF of the batch."""
+    inputs = []
+    total = 0
+    for upload_num, file in enumerate(files):
+        name = file.filename or f"{upload_num}.pdf"
+        path = temp_dir.joinpath(f"upload_{upload_num}")
+        await copy_upload(file, path, settings.max_batch_bytes - total)
+        total += path.stat().st_size
+        if name.lower().endswith(".zip"):
+            member_dir = temp_dir.joinpath(f"zip_{upload_num}")
+            member_dir.mkdir()
+            try:
+                # распакованное тоже лежит на диске: все архивы пакета делят один лимит с загрузками
+                members = extract_pdfs(path, member_dir, settings.max_batch_files - len(inputs), settings.max_batch_bytes - total)
+            except zipfile.BadZipFile:
+                raise HTTPException(400, detail=f"Не удалось открыть архив {name}")
+            except ArchiveTooLarge as e:
+                raise HTTPException(413, detail=str(e))
+            path.unlink()
+            total += sum(member_path.stat().st_size for _, member_path in members)
+            inputs.extend({"name": member_name, "path": member_path} for member_name, member_path in members)
+        else:
+            inputs.append({"name": name, "path": path})
+        if len(inputs) > settings.max_batch_files:
+            raise HTTPException(413, detail=f"Слишком много файлов: больше {settings.max_batch_files}")
+    if not inputs:
+        raise HTTPException(400, detail="Нет PDF-файлов")
+    return inputs
+
+
+def iter_batch_results(inputs: List[dict], options: dict, temp_dir: Path) -> Iterator[bytes]:
+    """Processes the batch file by file and yields the result archive in parts as it grows."""
+    try:
+        from pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader
+        reader = PDFReader(font_cache=FontCache(), glyph_engine=settings.glyph_engine, scratch=scratch_space)
+        stream = ZipStream()
+        manifest = []
+        used_names = set()
+        with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for item in inputs:
+                entry = process_batch_file(reader, item, options)
+                if entry["status"] == JobStatus.done.value:
+                    result = job_store.load_result(entry["id"])
+                    stem = item["name"][:-4] if item["name"].lower().endswith(".pdf") else item["name"]
+                    entry["text_file"] = unique_name(f"{stem}.txt", used_names)
+                    archive.writestr(entry["text_file"], result["text"])
+                    pdf_path = job_store.corrected_pdf_path(entry["id"])
+                    if pdf_path.exists():
+                        entry["pdf_file"] = unique_name(f"{stem}.pdf", used_names)
+                        copy_into_zip(archive, pdf_path, entry["pdf_file"])
+                    entry["pages"] = len(result["pages"])
+                    entry["repair_skipped"] = result.get("repair_skipped", False)
+                    entry["timings"] = result.get("metrics", {}).get("timings", {})
+                manifest.append(entry)
+                yield stream.drain()
+            summary = {
+                "files": len(manifest),
+                "done": sum(entry["status"] == JobStatus.done.value for entry in manifest),
+                "font_cache": {"hits": reader.font_cache.hits, "misses": reader.font_cache.misses}
+            }
+            archive.writestr("manifest.json", json.dumps({"summary": summary, "files": manifest}, ensure_ascii=False, indent=2))
+        yield stream.drain()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def process_batch_file(reader: "PDFReader", item: dict, options: dict) -> dict:
+    """Runs one file of the batch as a job of the store, so results are cached and counted in /metrics like single requests."""
+    entry = {"filename": item["name"]}
+    try:
+        with extraction_lock:
+            check_pdf(item["path"])
+    except HTTPException as e:
+        return dict(entry, status=JobStatus.failed.value, error=e.detail)
+    input_hash = file_digest(item["path"])
+    cached = job_store.find_done(input_hash, options)
+    if cached is not None:
+        job_store.add_metrics({"counter": {"result_cache_hits": 1}})
+        return dict(entry, id=cached["id"], status=JobStatus.done.value)
+
+    job_id = job_store.create(PurePath(item["name"]).name, item["path"], options=options, status=JobStatus.running, input_hash=input_hash)
+    try:
+        with extraction_lock:
+            run_job(job_store, reader, job_store.get(job_id))
+    except Exception as e:
+        job_store.finish(job_id, JobStatus.failed, error=str(e))
+        return dict(entry, id=job_id, status=JobStatus.failed.value, error=f"Ошибка обработки: {str(e)}")
+    job_store.finish(job_id, JobStatus.done)
+    return dict(entry, id=job_id, status=JobStatus.done.value)
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: Request, file: UploadFile = File(...), corrected_pdf: bool = True, force_repair: bool = False,
+                     x_profile: Optional[str] = Header(None), x_client_id: Optional[str] = Header(None),
+                     x_admin_token: Optional[str] = Header(None)):
+    options = request_options(corrected_pdf, force_repair, x_profile, x_admin_token)
+    # очередь делится поровну между клиентами: по заголовку X-Client-Id, без него — по адресу
+    client = x_client_id or (request.client.host if request.client else None)
+    with scratch_space.session() as scratch:
+        upload_path = scratch.path.joinpath("upload.pdf")
+        input_hash = await save_upload(file, upload_path)
+        cached = None if options.get("profile") else job_store.find_done(input_hash, options)
+        if cached is not None:
+            job_store.add_metrics({"counter": {"result_cache_hits": 1}})
+            return {"id": cached["id"], "status": cached["status"]}
+        # проверка ждет extraction_lock, клиент, закрывший соединение, ее не дожидается
+        token = CancelToken()
+        pages, glyphs = await await_request(request, run_locked(inspect_pdf, upload_path, token=token), None, abandon=token.cancel)
+        # профилируемая задача выполняется целиком, чтобы профиль покрывал весь документ
+        chunks = plan_chunks(pages, glyphs, 0 if options.get("profile") else settings.job_chunk_pages)
+        job_id = job_store.create(file.filename, upload_path, options=options, input_hash=input_hash, client=client,
+                                  cost=sum(cost for _, _, cost in chunks), chunks=chunks)
+    return {"id": job_id, "status": JobStatus.queued.value}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(404, detail="Задача не найдена")
+    return {
+        "id": job["id"],
+        "filename": job["filename"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "done": job["done"],
+        "total": job["total"],
+        "error": job["error"],
+        "cancel_requested": bool(job["cancel_requested"]),
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(404, detail="Задача не найдена")
+    if job["status"] != JobStatus.done.value:
+        raise HTTPException(409, detail=f"Задача в статусе {job['status']}")
+    return job_result_response(job)
+
+
+@app.get("/jobs/{job_id}/pdf")
+async def get_job_pdf(job_id: str):
+    job = job_store.get(job_id)
+    if job is None or job["status"] != JobStatus.done.value:
+        raise HTTPException(404, detail="Задача не найдена")
+    pdf_path = job_store.corrected_pdf_path(job_id)
+    if not pdf_path.exists():
+        raise HTTPException(404, detail="Исправленный PDF не создавался")
+    return FileResponse(pdf_path, media_type="application/pdf", filename="corrected_" + job["filename"])
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    status = job_store.cancel(job_id)
+    if status is None:
+        raise HTTPException(404, detail="Задача не найдена")
+    return {"id": job_id, "status": status}
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_prometheus(job_store.read_metrics()), media_type="text/plain; version=0.0.4")
+
+
+def check_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not settings.admin_token or x_admin_token != settings.admin_token:
+        raise HTTPException(403, detail="Доступ запрещен")
+
+
+@app.get("/admin/profiles", dependencies=[Depends(check_admin_token)])
+async def list_profiles(limit: int = 100):
+    return [
+        {"id": job["id"], "filename": job["filename"], "input_hash": job["input_hash"], "status": job["status"], "created_at": job["created_at"]}
+        for job in job_store.list_profiled(limit)
+    ]
+
+
+@app.get("/admin/profiles/{job_id}", dependencies=[Depends(check_admin_token)])
+async def get_profile(job_id: str, format: str = "pstats"):
+    """
+    format=pstats отдает дамп cProfile (pstats.Stats / snakeviz), format=text - сводку по cumulative time,
+    format=info - пиковую память и хэш входного файла.
+    """
+    filenames = {"pstats": profiling.profile_filename, "text": profiling.summary_filename, "info": profiling.info_filename}
+    if format not in filenames:
+        raise HTTPException(400, detail="format: pstats, text или info")
+    profile_path = job_store.job_dir(job_id).joinpath(filenames[format])
+    if not profile_path.exists():
+        raise HTTPException(404, detail="Профиль не найден")
+    if format == "pstats":
+        return FileResponse(profile_path, media_type="application/octet-stream", filename=f"{job_id}.prof")
+    return FileResponse(profile_path, media_type="application/json" if format == "info" else "text/plain")
@@ -0,0 +1,33 @@
+import re
+from typing import Dict, List
+
+prefix = "pdf_reader"
+
+
+def metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def render_prometheus(metrics: Dict[str, Dict[str, float]]) -> str:
+    """
+    Renders the totals of JobStore.read_metrics in the Prometheus text format.
+    Stage durations are exported as counters labelled by stage, so rate(seconds) / rate(calls) gives the mean duration.
+    """
+    lines: List[str] = []
+
+    stage_metrics = (
+        ("stage_seconds", f"{prefix}_stage_seconds_total", "Time spent in PDFReader stages"),
+        ("stage_calls", f"{prefix}_stage_calls_total", "Number of times PDFReader stages were run"),
+    )
+    for kind, name, help_text in stage_metrics:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for stage, value in sorted(metrics.get(kind, {}).items()):
+            lines.append(f'{name}{{stage="{stage}"}} {value}')
+
+    for counter, value in sorted(metrics.get("counter", {}).items()):
+        name = f"{prefix}_{metric_name(counter)}_total"
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
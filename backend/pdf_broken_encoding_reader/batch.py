@@ -0,0 +1,181 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from pdf_broken_encoding_reader.font_cache import DiskFontCache
+from pdf_broken_encoding_reader.metrics import Metrics, null_metrics
+from pdf_broken_encoding_reader.page_store import DiskPageStore
+
+checkpoint_filename = "checkpoint.jsonl"
+output_formats = ("txt", "json", "pdf")
+
+reader = None
+
+
+def iter_inputs(inputs: Sequence[Path]) -> Iterator[Tuple[Path, Path]]:
+    """
+    Yields (pdf_path, relative output path) for every PDF of the input folders and manifests.
+    A manifest is a text file with a PDF path per line, relative paths are resolved against the manifest folder.
+    """
+    for input_path in inputs:
+        if input_path.is_dir():
+            for pdf_path in sorted(input_path.rglob("*")):
+                if pdf_path.is_file() and pdf_path.suffix.lower() == ".pdf":
+                    yield pdf_path, pdf_path.relative_to(input_path)
+        elif input_path.suffix.lower() == ".pdf":
+            yield input_path, Path(input_path.name)
+        else:
+            with open(input_path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith("#"):
+                        continue
+                    pdf_path = input_path.parent.joinpath(line)
+                    relative = pdf_path.relative_to(pdf_path.anchor) if Path(line).is_absolute() else Path(line)
+                    yield pdf_path, relative
+
+
+def read_checkpoint(checkpoint_path: Path) -> Dict[str, str]:
+    """Returns {input: last status} of previous runs. A line cut off by an interrupted write is ignored."""
+    statuses = {}
+    if not checkpoint_path.exists():
+        return statuses
+    with open(checkpoint_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            statuses[record["input"]] = record["status"]
+    return statuses
+
+
+def init_worker(font_cache_dir: Optional[str], glyph_engine: Optional[str] = None, page_store_dir: Optional[str] = None) -> None:
+    """Loads the model once per worker process, all files of the worker share it, the font cache and the page store."""
+    global reader
+    from pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader
+    font_cache = DiskFontCache(Path(font_cache_dir)) if font_cache_dir else None
+    page_store = DiskPageStore(Path(page_store_dir)) if page_store_dir else None
+    reader = PDFReader(font_cache=font_cache, glyph_engine=glyph_engine, page_store=page_store)
+
+
+def process_file(pdf_path: str, output_base: str, formats: Sequence[str], skip_if_correct: bool) -> dict:
+    """Processes one PDF in a worker and writes <output_base>.txt/.json/.pdf."""
+    start = time.perf_counter()
+    metrics = Metrics()
+    reader.metrics = metrics
+    try:
+        output_base = Path(output_base)
+        output_base.parent.mkdir(parents=True, exist_ok=True)
+        texts = [page.get_text() for page in reader.iter_pages(Path(pdf_path), skip_if_correct=skip_if_correct)]
+        # PDF пишется рядом с результатом и переименовывается, как txt и json
+        pdf_tmp_path = output_base.with_name(f"{output_base.name}.pdf.tmp")
+        corrected_pdf_path = reader.write_corrected_pdf(Path(pdf_path), output_path=pdf_tmp_path) if "pdf" in formats else None
+    finally:
+        reader.metrics = null_metrics
+
+    # страницы склеиваются так же, как в результате задачи API
+    text = "\n".join(texts)
+    if "txt" in formats:
+        write_atomic(output_path(output_base, "txt"), text.encode("utf-8"))
+    if "json" in formats:
+        result = {"text": text, "pages": texts, "repair_skipped": reader.repair_skipped, "metrics": metrics.as_dict()}
+        write_atomic(output_path(output_base, "json"), json.dumps(result, ensure_ascii=False).encode("utf-8"))
+    if corrected_pdf_path is not None:
+        os.replace(corrected_pdf_path, output_path(output_base, "pdf"))
+    return {"pages": len(texts), "repair_skipped": reader.repair_skipped, "seconds": time.perf_counter() - start}
+
+
+def output_path(output_base: Path, output_format: str) -> Path:
+    # не with_suffix: он отрезал бы часть имени с точкой, и report.v1 и report.v2 писали бы в один report.txt
+    return output_base.with_name(f"{output_base.name}.{output_format}")
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def run_batch(inputs: Sequence[Path], output_dir: Path, workers: int = 1, formats: Sequence[str] = output_formats,
+              font_cache_dir: Optional[Path] = None, skip_if_correct: bool = True, retry_failed: bool = False,
+              glyph_engine: Optional[str] = None, page_store_dir: Optional[Path] = None) -> Dict[str, int]:
+    """
+    Processes all PDFs of inputs in a pool of worker processes and mirrors the input tree in output_dir.
+    Every finished file is appended to output_dir/checkpoint.jsonl, so a rerun with the same arguments
+    skips the files finished before. Failed files are retried only if retry_failed is set.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint_path = output_dir.joinpath(checkpoint_filename)
+    skip_statuses = ("done",) if retry_failed else ("done", "failed")
+    finished = {input_key for input_key, status in read_checkpoint(checkpoint_path).items() if status in skip_statuses}
+    stats = {"done": 0, "failed": 0, "skipped": 0}
+
+    context = multiprocessing.get_context("spawn")
+    initargs = (str(font_cache_dir) if font_cache_dir else None, glyph_engine, str(page_store_dir) if page_store_dir else None)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker, initargs=initargs) as executor, \
+            open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        pending: Dict[Future, str] = {}
+
+        def collect(return_when: str) -> None:
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                input_key = pending.pop(future)
+                record = {"input": input_key}
+                try:
+                    record.update(status="done", **future.result())
+                except Exception as e:
+                    record.update(status="failed", error="".join(traceback.format_exception_only(type(e), e)).strip())
+                stats[record["status"]] += 1
+                checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+                checkpoint.flush()
+                print(f"[{record['status']}] {input_key}", file=sys.stderr)
+
+        for pdf_path, relative in iter_inputs(inputs):
+            input_key = str(pdf_path.resolve())
+            if input_key in finished:
+                stats["skipped"] += 1
+                continue
+            output_base = output_dir.joinpath(relative).with_suffix("")
+            future = executor.submit(process_file, str(pdf_path), str(output_base), list(formats), skip_if_correct)
+            pending[future] = input_key
+            # очередь ограничена, чтобы не держать в памяти задачи для всего архива
+            if len(pending) >= workers * 4:
+                collect(FIRST_COMPLETED)
+        while pending:
+            collect(FIRST_COMPLETED)
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Restores the text of many PDFs with broken encoding, resumable")
+    parser.add_argument("inputs", type=Path, nargs="+", help="PDF files, folders (searched recursively) or manifests with a path per line")
+    parser.add_argument("-o", "--output", type=Path, required=True, help="output folder, mirrors the input tree")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--formats", nargs="+", choices=output_formats, default=list(output_formats))
+    parser.add_argument("--font-cache", type=Path, help="folder for recognized fonts shared by workers and runs "
+                                                        "(default: <output>/font_cache)")
+    parser.add_argument("--page-store", type=Path, help="folder for restored pages: unchanged pages of new revisions "
+                                                        "of documents are taken from there instead of processed again")
+    parser.add_argument("--force-repair", action="store_true", help="repair documents with a correct text layer too")
+    parser.add_argument("--glyph-engine", choices=["fontforge", "numpy"], help="glyph rasterizer (default: config.rasterizer)")
+    parser.add_argument("--retry-failed", action="store_true", help="process files that failed in previous runs again")
+    args = parser.parse_args(argv)
+
+    font_cache_dir = args.font_cache or args.output.joinpath("font_cache")
+    stats = run_batch(args.inputs, args.output, args.workers, args.formats, font_cache_dir,
+                      skip_if_correct=not args.force_repair, retry_failed=args.retry_failed, glyph_engine=args.glyph_engine,
+                      page_store_dir=args.page_store)
+    print(f"done: {stats['done']}, failed: {stats['failed']}, skipped: {stats['skipped']}")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
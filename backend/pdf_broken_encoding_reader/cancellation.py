@@ -0,0 +1,34 @@
+import threading
+import time
+from typing import Optional
+
+
+class Cancelled(Exception):
+    """Raised at a checkpoint of PDFReader once its cancel token is cancelled or its deadline has passed."""
+
+
+class CancelToken:
+    """
+    Cooperative cancellation of a PDFReader run, may be cancelled from any thread.
+    With a timeout the token cancels itself that many seconds after it was created.
+    """
+
+    def __init__(self, timeout: Optional[float] = None) -> None:
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.reason: Optional[str] = None
+        self.__event = threading.Event()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self.__event.is_set():
+            self.reason = reason
+            self.__event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self.__event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        return self.__event.is_set()
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise Cancelled(self.reason)
@@ -0,0 +1,28 @@
+import torch
+import torch.nn.functional as f
+from torch import nn
+
+
+class CNNModel(nn.Module):
+
+    def __init__(self, num_classes: int) -> None:
+        super(CNNModel, self).__init__()
+        self.conv1 = nn.Conv2d(1, 32, kernel_size=3)
+        self.pool1 = nn.MaxPool2d(2, 2)
+        self.conv2 = nn.Conv2d(32, 64, kernel_size=3)
+        self.pool2 = nn.MaxPool2d(2, 2)
+        self.dropout1 = nn.Dropout(0.2)
+        self.fc1 = nn.Linear(64 * 5 * 5, 256)  # For input size 28x28
+        self.dropout2 = nn.Dropout(0.5)
+        self.fc2 = nn.Linear(256, num_classes)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        x = self.pool1(f.relu(self.conv1(x)))
+        x = self.pool2(f.relu(self.conv2(x)))
+        self.view = x.view(x.size(0), -1)
+        x = self.view
+        x = self.dropout1(x)
+        x = f.relu(self.fc1(x))
+        x = self.dropout2(x)
+        x = self.fc2(x)
+        return x
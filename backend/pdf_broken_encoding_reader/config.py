@@ -59,6 +59,44 @@ other = dict(
     ]
 )
 
+# Проверка шрифтов с уже корректной кодировкой: такие шрифты не распознаются CNN
+triage = dict(
+    pages=3,
+    min_words=20,
+    min_valid_share=0.7,
+    min_standard_names_share=0.9,
+    min_tounicode_agreement=0.9
+)
+
+# Быстрая проверка всего документа: если текстовый слой корректен, восстановление не запускается
+fast_path = dict(
+    pages=5,
+    min_words=30,
+    min_valid_share=0.8
+)
+
+# Растеризация глифов: fontforge (внешний процесс) или numpy (fontTools в том же процессе)
+rasterizer = dict(
+    engine="fontforge",
+    image_size=80,
+    supersampling=4,
+    curve_steps=8
+)
+
+# Рабочие папки обработки документа: корень (None — системная временная папка, tmpfs вроде /dev/shm держит их в памяти)
+# и квота на документ
+scratch = dict(
+    root=None,
+    quota_mb=1024
+)
+
+# Кэш шрифтов и хранилище восстановленных страниц на диске: сколько файлов и мегабайт хранится в папке,
+# при превышении удаляются давно не использованные записи
+disk_stores = dict(
+    font_cache=dict(max_files=100000, max_mb=1024),
+    page_store=dict(max_files=100000, max_mb=4096)
+)
+
 convert = dict(
     convert_chars_to_rus={
         "a": "а", "b": "в", "c": "с", "d": "д", "e": "е", "h": "н", "k": "к", "m": "м", "o": "о", "p": "р", "r": "г",
@@ -95,7 +133,13 @@ def get_default_models() -> List[str]:
     return [f.stem for f in models_folder.glob("*.pt")]
 
 
-default_models = get_default_models()
+def __getattr__(name: str) -> List[str]:
+    # папка моделей просматривается при первом обращении к config.default_models, а не при импорте
+    if name == "default_models":
+        value = get_default_models()
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def chars_to_code(char_list: List[str]) -> List[int]:
@@ -0,0 +1,62 @@
+import hashlib
+from pathlib import Path
+from typing import Dict, Optional
+
+from pdf_broken_encoding_reader import config
+from pdf_broken_encoding_reader.lru_store import JsonFolder, LruStore
+
+
+def font_key(font_path: Path, glyph_engine: str, model_version: str) -> str:
+    """
+    Key of the font in a FontCache: the SHA-256 of the font program together with the glyph engine and the model version
+    that produced the recognition, so another rasterizer or new weights don't reuse it.
+    """
+    digest = hashlib.sha256()
+    with open(font_path, "rb") as f:
+        digest.update(f.read())
+    digest.update(f"\0{glyph_engine}\0{model_version}".encode())
+    return digest.hexdigest()
+
+
+class FontCache(LruStore):
+    """
+    Recognition results of embedded fonts keyed by font_key.
+    An entry is {"name2code": ..., "white_spaces": ..., "match": ...}: what fontforge and the CNN produced for the font,
+    so a font met again in another document skips glyph export and recognition.
+    Keeps the max_fonts most recently used entries in memory and is safe to share between threads.
+    """
+
+    def __init__(self, max_fonts: int = 10000) -> None:
+        super().__init__(max_fonts)
+
+
+class DiskFontCache(FontCache):
+    """
+    FontCache backed by a JsonFolder with a <digest>.json file per font, shared by all processes pointed at the folder.
+    The folder is limited by max_files and max_mb (config.disk_stores["font_cache"] by default).
+    """
+
+    def __init__(self, cache_dir: Path, max_fonts: int = 10000, max_files: Optional[int] = None,
+                 max_mb: Optional[float] = None) -> None:
+        super().__init__(max_fonts)
+        limits = config.disk_stores["font_cache"]
+        self.files = JsonFolder(cache_dir, max_files or limits["max_files"], max_mb or limits["max_mb"])
+        self.cache_dir = self.files.folder
+
+    def _load(self, digest: str) -> Optional[dict]:
+        return self.files.load(digest)
+
+    def _store(self, digest: str, entry: dict) -> None:
+        self.files.store(digest, entry)
+
+    def _touch(self, digest: str) -> None:
+        self.files.touch(digest)
+
+
+def make_entry(name2code: Dict, white_spaces: Dict, match: Dict) -> dict:
+    # ключи и значения приводятся к виду, который переживает json
+    return {
+        "name2code": {str(name): code for name, code in name2code.items()},
+        "white_spaces": {str(key): value for key, value in white_spaces.items()},
+        "match": {str(key): value for key, value in match.items()}
+    }
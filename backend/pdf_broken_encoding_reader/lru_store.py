@@ -0,0 +1,151 @@
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+
+class LruStore:
+    """
+    Entries keyed by a hex digest. Keeps the max_entries most recently used entries in memory and is safe to share
+    between threads. Subclasses load the entries missing in memory and store the new ones through _load and _store.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.__entries: "OrderedDict[str, Any]" = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+        if entry is None:
+            entry = self._load(key)
+            if entry is not None:
+                self.__remember(key, entry)
+        else:
+            self._touch(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: Any) -> None:
+        self.__remember(key, entry)
+        self._store(key, entry)
+
+    def __remember(self, key: str, entry: Any) -> None:
+        with self.__lock:
+            self.__entries[key] = entry
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[Any]:
+        return None
+
+    def _store(self, key: str, entry: Any) -> None:
+        pass
+
+    def _touch(self, key: str) -> None:
+        pass
+
+
+class JsonFolder:
+    """
+    A folder with a <key>.json file per entry, shared by all processes pointed at it.
+    Files are written through a temporary file and os.replace, so a concurrent reader never sees half of an entry.
+    The folder keeps at most max_files files and max_mb megabytes: reads touch the files, and a write that goes over
+    a limit removes the least recently used files down to evict_ratio of the limits.
+    """
+
+    evict_ratio = 0.9
+    # записи других процессов этот процесс не видит: папка пересчитывается, когда он сам дописал столько от лимита
+    rescan_ratio = 0.1
+
+    def __init__(self, folder: Path, max_files: int, max_mb: float) -> None:
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_files = max_files
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.__lock = threading.Lock()
+        self.__files = 0
+        self.__bytes = 0
+        self.__written = 0
+        self.evict()
+
+    def path(self, key: str) -> Path:
+        return self.folder.joinpath(f"{key}.json")
+
+    def load(self, key: str) -> Optional[Any]:
+        path = self.path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.touch(key)
+        return entry
+
+    def touch(self, key: str) -> None:
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            # файл мог удалить другой процесс
+            pass
+
+    def store(self, key: str, entry: Any) -> None:
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(key))
+        with self.__lock:
+            self.__files += 1
+            self.__bytes += len(data)
+            self.__written += len(data)
+            over = (self.__files > self.max_files or self.__bytes > self.max_bytes
+                    or self.__written > self.max_bytes * self.rescan_ratio)
+        if over:
+            self.evict()
+
+    def evict(self) -> int:
+        """Counts the files of the folder and removes the least recently used ones over the limits, returns how many."""
+        files = self.__scan()
+        count, size = len(files), sum(file_size for _, file_size, _ in files)
+        removed = 0
+        if count > self.max_files or size > self.max_bytes:
+            files.sort()
+            for _, file_size, path in files:
+                if count <= self.max_files * self.evict_ratio and size <= self.max_bytes * self.evict_ratio:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                count -= 1
+                size -= file_size
+                removed += 1
+        with self.__lock:
+            self.__files, self.__bytes, self.__written = count, size, 0
+        return removed
+
+    def __scan(self) -> List[Tuple[float, int, str]]:
+        files = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
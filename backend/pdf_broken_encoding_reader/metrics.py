@@ -0,0 +1,55 @@
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+from typing import ContextManager, Dict, Iterator
+
+
+class Metrics:
+    """
+    Durations and counters of PDFReader stages for one run.
+    Durations of a stage entered several times (per font, per page) are summed up.
+    """
+
+    enabled = True
+
+    def __init__(self) -> None:
+        self.timings: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.counters: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + perf_counter() - start
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self) -> dict:
+        return {
+            "timings": {name: round(seconds, 4) for name, seconds in self.timings.items()},
+            "calls": dict(self.calls),
+            "counters": dict(self.counters)
+        }
+
+
+class NullMetrics:
+    """Default metrics hook of PDFReader: records nothing."""
+
+    enabled = False
+    __stage = nullcontext()
+
+    def stage(self, name: str) -> ContextManager[None]:
+        return self.__stage
+
+    def count(self, name: str, value: float = 1) -> None:
+        pass
+
+    def as_dict(self) -> dict:
+        return {"timings": {}, "calls": {}, "counters": {}}
+
+
+null_metrics = NullMetrics()
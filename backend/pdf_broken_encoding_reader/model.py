@@ -1,49 +1,23 @@
-from typing import List
-
-import torch
-import torch.nn.functional as f
-from torch import nn
-from huggingface_hub import hf_hub_download
-
-
-
-class CNNModel(nn.Module):
-
-    def __init__(self, num_classes: int) -> None:
-        super(CNNModel, self).__init__()
-        self.conv1 = nn.Conv2d(1, 32, kernel_size=3)
-        self.pool1 = nn.MaxPool2d(2, 2)
-        self.conv2 = nn.Conv2d(32, 64, kernel_size=3)
-        self.pool2 = nn.MaxPool2d(2, 2)
-        self.dropout1 = nn.Dropout(0.2)
-        self.fc1 = nn.Linear(64 * 5 * 5, 256)  # For input size 28x28
-        self.dropout2 = nn.Dropout(0.5)
-        self.fc2 = nn.Linear(256, num_classes)
-
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
-        x = self.pool1(f.relu(self.conv1(x)))
-        x = self.pool2(f.relu(self.conv2(x)))
-        self.view = x.view(x.size(0), -1)
-        x = self.view
-        x = self.dropout1(x)
-        x = f.relu(self.fc1(x))
-        x = self.dropout2(x)
-        x = self.fc2(x)
-        return x
+import hashlib
+import threading
+from typing import List, Optional, Sequence
 
 
 class Model:
     """
     PyTorch CNN model for font's glyphs prediction.
     Used in PDFBrokenEncodingReader.
+    version identifies the weights and the labels: stored recognition results of other versions are not reused.
     """
 
     def __init__(self) -> None:
         from .config import Language
         self.model = None
+        self.version = ""
         self.__load_weights()
         s = sorted(Language.Russian_and_English.value, key=lambda i: str(ord(i)))
         self.labels = [ord(i) for i in s]
+        self.version = hashlib.sha256(f"{self.version}:{self.labels}".encode()).hexdigest()
 
     def __assert_labels_and_model(self) -> None:
         assert self.model.fc1.out_features == len(self.labels)
@@ -51,7 +25,6 @@ class Model:
     def recognize_glyph(self, images: List[str]) -> list:
         import cv2
         import numpy as np
-        import torch
 
         images_readen = []
         for png in images:
@@ -61,8 +34,14 @@ class Model:
                 img = cv2.imdecode(numpyarray, cv2.IMREAD_UNCHANGED)
                 img = np.array(img).reshape(28, 28)
                 images_readen.append(img)
+        return self.recognize_arrays(images_readen)
+
+    def recognize_arrays(self, images: Sequence) -> list:
+        """Same as recognize_glyph for 28x28 uint8 images already in memory (white glyph on black)."""
+        import numpy as np
+        import torch
 
-        images_readen = np.array(images_readen, dtype=np.float32)
+        images_readen = np.asarray(images, dtype=np.float32)
         images_readen = images_readen / 255.0
 
         images_tensor = torch.tensor(images_readen).unsqueeze(1)
@@ -75,6 +54,11 @@ class Model:
         return predictions
 
     def __load_weights(self) -> None:
+        # torch и huggingface_hub импортируются здесь, а не при импорте модуля: сервис готов принимать запросы без них
+        import torch
+        from huggingface_hub import hf_hub_download
+        from pdf_broken_encoding_reader.cnn import CNNModel
+
         cache_dir = "models"
         filename = "rus_eng.pt"  # Имя файла с весами
 
@@ -87,3 +71,21 @@ class Model:
         self.model = CNNModel(160)
         self.model.load_state_dict(torch.load(weights_path))
         self.model.eval()
+        with open(weights_path, "rb") as f:
+            self.version = hashlib.sha256(f.read()).hexdigest()
+
+
+_shared_model: Optional[Model] = None
+_shared_model_lock = threading.Lock()
+
+
+def shared_model() -> Model:
+    """
+    The Model of the process, loaded on the first call: all PDFReaders of the process use the same weights,
+    and processes forked after the call share them copy-on-write.
+    """
+    global _shared_model
+    with _shared_model_lock:
+        if _shared_model is None:
+            _shared_model = Model()
+        return _shared_model
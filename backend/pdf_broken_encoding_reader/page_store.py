@@ -0,0 +1,115 @@
+import hashlib
+import re
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from pdf_broken_encoding_reader import config
+from pdf_broken_encoding_reader.lru_store import JsonFolder, LruStore
+from pdf_broken_encoding_reader.pdf_worker.compact_page import CompactPage
+
+if TYPE_CHECKING:
+    import fitz
+
+reference = re.compile(r"(\d+) \d+ R")
+
+
+class PageStore(LruStore):
+    """
+    Restored pages keyed by page_fingerprint: {"page": CompactPage, "fonts": Differences of the page fonts,
+    "glyphs": glyph map of the page}, so a page that is the same in a new revision of a document skips layout parsing
+    and correction. Keeps the max_pages most recently used records in memory and is safe to share between threads.
+    """
+
+    def __init__(self, max_pages: int = 1000) -> None:
+        super().__init__(max_pages)
+
+
+class DiskPageStore(PageStore):
+    """
+    PageStore backed by a JsonFolder with a <fingerprint>.json file per page, written like DiskFontCache entries.
+    The folder is limited by max_files and max_mb (config.disk_stores["page_store"] by default).
+    """
+
+    def __init__(self, store_dir: Path, max_pages: int = 1000, max_files: Optional[int] = None,
+                 max_mb: Optional[float] = None) -> None:
+        super().__init__(max_pages)
+        limits = config.disk_stores["page_store"]
+        self.files = JsonFolder(store_dir, max_files or limits["max_files"], max_mb or limits["max_mb"])
+        self.store_dir = self.files.folder
+        # страницы прежнего формата не читаются: pickle из общей папки мог бы выполнить чужой код
+        for path in self.store_dir.glob("*.pickle"):
+            path.unlink(missing_ok=True)
+
+    def _load(self, fingerprint: str) -> Optional[dict]:
+        record = self.files.load(fingerprint)
+        if record is None:
+            return None
+        try:
+            return dict(record, page=CompactPage.from_dict(record["page"]))
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def _store(self, fingerprint: str, record: dict) -> None:
+        self.files.store(fingerprint, dict(record, page=record["page"].to_dict()))
+
+    def _touch(self, fingerprint: str) -> None:
+        self.files.touch(fingerprint)
+
+
+def page_fingerprints(doc: "fitz.Document") -> List[Tuple[str, List[str]]]:
+    """
+    (fingerprint, base font names) per page. The fingerprint covers the decoded content of the page, its boxes
+    and everything its resources reference: fonts with their programs and encodings, form XObjects, images.
+    An object shared by pages, such as a font, is hashed once.
+    """
+    digests: Dict[int, str] = {}
+    fingerprints = []
+    for page in doc:
+        digest = hashlib.sha256(page.read_contents())
+        digest.update(repr((tuple(page.mediabox), tuple(page.cropbox), page.rotation)).encode())
+        digest.update(value_digest(doc, inherited_resources(doc, page.xref), digests).encode())
+        fonts = sorted(font[3] for font in doc.get_page_fonts(page.number))
+        fingerprints.append((digest.hexdigest(), fonts))
+    return fingerprints
+
+
+def inherited_resources(doc: "fitz.Document", xref: int) -> Tuple[str, str]:
+    # Resources можно не указывать у страницы, тогда они берутся у ближайшего родителя в дереве страниц
+    kind, value = doc.xref_get_key(xref, "Resources")
+    visited = {xref}
+    while kind == "null":
+        parent_kind, parent = doc.xref_get_key(xref, "Parent")
+        if parent_kind != "xref":
+            break
+        xref = int(parent.split()[0])
+        if xref in visited:
+            break
+        visited.add(xref)
+        kind, value = doc.xref_get_key(xref, "Resources")
+    return kind, value
+
+
+def value_digest(doc: "fitz.Document", value: Tuple[str, str], digests: Dict[int, str]) -> str:
+    """Digest of a value returned by xref_get_key, references are replaced by the digests of their objects."""
+    kind, text = value
+    if kind == "xref":
+        return object_digest(doc, int(text.split()[0]), digests)
+    digest = hashlib.sha256(text.encode())
+    for xref in reference.findall(text):
+        digest.update(object_digest(doc, int(xref), digests).encode())
+    return digest.hexdigest()
+
+
+def object_digest(doc: "fitz.Document", xref: int, digests: Dict[int, str]) -> str:
+    if xref in digests:
+        return digests[xref]
+    # объект, до которого дошли по циклу ссылок, учитывается только своим номером
+    digests[xref] = str(xref)
+    source = doc.xref_object(xref, compressed=True)
+    digest = hashlib.sha256(source.encode())
+    if doc.xref_is_stream(xref):
+        digest.update(doc.xref_stream_raw(xref) or b"")
+    for ref in reference.findall(source):
+        digest.update(object_digest(doc, int(ref), digests).encode())
+    digests[xref] = digest.hexdigest()
+    return digests[xref]
@@ -11,8 +11,6 @@ from dedoc.readers.pdf_reader.data_classes.pdf_image_attachment import PdfImageA
 from dedoc.readers.pdf_reader.data_classes.tables.scantable import ScanTable
 from dedoc.readers.pdf_reader.pdf_base_reader import ParametersForParseDoc
 from dedoc.readers.pdf_reader.pdf_base_reader import PdfBaseReader
-from dedoc.readers.pdf_reader.pdf_txtlayer_reader.pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader
-from dedoc.readers.pdf_reader.pdf_txtlayer_reader.pdf_txtlayer_reader import PdfTxtlayerReader
 
 logging.getLogger("pdfminer").setLevel(logging.ERROR)
 WordObj = namedtuple("Word", ["start", "end", "value"])
@@ -31,6 +29,8 @@ class PdfBrokenEncodingReader(PdfBaseReader):
         super().__init__(config=config, recognized_extensions=recognized_extensions.pdf_like_format, recognized_mimes=recognized_mimes.pdf_like_format)
 
         from dedoc.readers.pdf_reader.pdf_txtlayer_reader.pdfminer_reader.pdfminer_extractor import PdfminerExtractor
+        from dedoc.readers.pdf_reader.pdf_txtlayer_reader.pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader
+        from dedoc.readers.pdf_reader.pdf_txtlayer_reader.pdf_txtlayer_reader import PdfTxtlayerReader
         self.extractor_layer = PdfminerExtractor(config=self.config)
         self.__pdf_txtlayer_reader = PdfTxtlayerReader(config=config)
         self.reader = PDFReader()
@@ -74,9 +74,10 @@ class PdfBrokenEncodingReader(PdfBaseReader):
         )
         file_path = Path(file_path)
 
-        pages, layouts = self.reader.get_correct_layout(file_path)
+        pages = self.reader.iter_pages(file_path, compact=False, start_page=first_page or 0, end_page=last_page or 0)
         lines = []
-        for idx, (page, layout) in enumerate(zip(pages, layouts)):
+        # номера страниц отсчитываются от начала документа, а не от начала среза
+        for idx, (page, layout) in enumerate(pages, start=first_page or 0):
             page_bb = self.extractor_layer.handle_page(page, idx, file_path, params_for_parse, layout)
             page_bb.bboxes = [bbox for bbox in page_bb.bboxes]
             lines += self.metadata_extractor.extract_metadata_and_set_annotations(page_with_lines=page_bb, call_classifier=False)
@@ -97,11 +98,9 @@ class PdfBrokenEncodingReader(PdfBaseReader):
                 table_type=parameters.table_type
             )
 
-        layout = self.reader.get_correct_layout(path)
-
         lines = []
-        for idx, page in enumerate(layout):
-            page_bb = self.extractor_layer.handle_page(page, idx, path, parameters)
+        for idx, (page, layout) in enumerate(self.reader.iter_pages(Path(path), compact=False)):
+            page_bb = self.extractor_layer.handle_page(page, idx, path, parameters, layout)
             page_bb.bboxes = [bbox for bbox in page_bb.bboxes]
             lines.append(self.metadata_extractor.extract_metadata_and_set_annotations(page_with_lines=page_bb,
                                                                                       call_classifier=False))
@@ -0,0 +1,121 @@
+import base64
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, Tuple
+
+from pdfminer.layout import LTChar, LTPage, LTTextBox, LTTextLine
+
+
+class CompactPage:
+    """
+    Corrected page without pdfminer objects.
+    Keeps the page text in the same form as the text boxes of the layout
+    and the positioned chars as columns: x0/y0/x1/y1/size arrays, a text buffer with offsets and a font index.
+    """
+
+    __slots__ = ("page_num", "width", "height", "text", "chars", "char_offsets", "x0", "y0", "x1", "y1", "size", "font", "fonts")
+
+    def __init__(self, page_num: int, width: float, height: float) -> None:
+        self.page_num = page_num
+        self.width = width
+        self.height = height
+        self.text = ""
+        self.chars = ""
+        self.char_offsets = array("I", [0])
+        self.x0 = array("f")
+        self.y0 = array("f")
+        self.x1 = array("f")
+        self.y1 = array("f")
+        self.size = array("f")
+        self.font = array("H")
+        self.fonts = ()
+
+    @classmethod
+    def from_layout(cls, layout: LTPage, page_num: int) -> "CompactPage":
+        page = cls(page_num, layout.width, layout.height)
+        page.text = "".join(element.get_text() for element in layout if isinstance(element, (LTTextBox, LTTextLine)))
+
+        fonts: Dict[str, int] = {}
+        chars = []
+        offset = 0
+        for char in iter_chars(layout):
+            text = char.get_text()
+            chars.append(text)
+            offset += len(text)
+            page.char_offsets.append(offset)
+            page.x0.append(char.x0)
+            page.y0.append(char.y0)
+            page.x1.append(char.x1)
+            page.y1.append(char.y1)
+            page.size.append(char.size)
+            page.font.append(fonts.setdefault(char.fontname, len(fonts)))
+        page.chars = "".join(chars)
+        page.fonts = tuple(fonts)
+        return page
+
+    def to_dict(self) -> dict:
+        """JSON-compatible form of the page, the char columns are base64 of their little-endian bytes."""
+        data = {name: getattr(self, name) for name in ("page_num", "width", "height", "text", "chars")}
+        data["fonts"] = list(self.fonts)
+        for name in column_names:
+            data[name] = pack_column(getattr(self, name))
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CompactPage":
+        page = cls(data["page_num"], data["width"], data["height"])
+        page.text = data["text"]
+        page.chars = data["chars"]
+        page.fonts = tuple(data["fonts"])
+        for name in column_names:
+            setattr(page, name, unpack_column(getattr(page, name).typecode, data[name]))
+        if len({len(getattr(page, name)) for name in column_names[1:]}) != 1 or len(page.char_offsets) != len(page) + 1:
+            raise ValueError("char columns of different length")
+        return page
+
+    def __len__(self) -> int:
+        return len(self.x0)
+
+    def get_text(self) -> str:
+        return self.text.strip()
+
+    def char_text(self, index: int) -> str:
+        return self.chars[self.char_offsets[index]:self.char_offsets[index + 1]]
+
+    def iter_chars(self) -> Iterator[Tuple[str, float, float, float, float, float, str]]:
+        """Yields (text, x0, y0, x1, y1, size, fontname) for every char of the page."""
+        for index in range(len(self)):
+            yield (self.char_text(index), self.x0[index], self.y0[index], self.x1[index], self.y1[index], self.size[index],
+                   self.fonts[self.font[index]])
+
+
+column_names = ("char_offsets", "x0", "y0", "x1", "y1", "size", "font")
+
+
+def pack_column(column: array) -> str:
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return base64.b64encode(column.tobytes()).decode("ascii")
+
+
+def unpack_column(typecode: str, packed: str) -> array:
+    column = array(typecode)
+    column.frombytes(base64.b64decode(packed))
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+def iter_chars(layout: Iterable) -> Iterator[LTChar]:
+    # обход без рекурсии: у глубоких LTFigure не упираемся в лимит стека
+    stack = [iter(layout)]
+    while stack:
+        for element in stack[-1]:
+            if isinstance(element, LTChar):
+                yield element
+            elif isinstance(element, Iterable):
+                stack.append(iter(element))
+                break
+        else:
+            stack.pop()
@@ -1,20 +1,27 @@
 import ast
+import copy
+import hashlib
+import json
+import logging
 import os
 import re
+import shutil
+import signal
 import subprocess
-import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from itertools import zip_longest
 from pathlib import Path, PurePath
 from sys import platform
-from typing import Dict, Iterable, List, Optional, Union
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
 from pdfminer.cmapdb import CMapDB
 
-from pypdf import PdfWriter as pypdfwriter
-
 import fitz
+import numpy as np
 from fontTools.ttLib import TTFont
 from pdfminer.converter import PDFPageAggregator
-from pdfminer.layout import LAParams, LTChar, LTTextLineHorizontal
+from pdfminer.encodingdb import name2unicode
+from pdfminer.layout import LAParams, LTChar, LTPage, LTTextLine, LTTextLineHorizontal
 from pdfminer.pdfdocument import PDFDocument
 from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
 from pdfminer.pdfpage import PDFPage
@@ -24,16 +31,46 @@ from pdfminer.psparser import PSLiteral
 
 from pdf_broken_encoding_reader import config
 from pdf_broken_encoding_reader import functions
+from pdf_broken_encoding_reader.cancellation import Cancelled, CancelToken
+from pdf_broken_encoding_reader.font_cache import FontCache, font_key, make_entry
 from pdf_broken_encoding_reader.functions import correctly_resize, junk_string
-from pdf_broken_encoding_reader.model import Model
+from pdf_broken_encoding_reader.metrics import null_metrics
+from pdf_broken_encoding_reader.model import Model, shared_model
+from pdf_broken_encoding_reader.page_store import PageStore, page_fingerprints
+from pdf_broken_encoding_reader.pdf_worker.compact_page import CompactPage, iter_chars
 from pdf_broken_encoding_reader.pdf_worker import pdf_text_correcter
-from pdf_broken_encoding_reader.pdf_worker.pdf_text_correcter import correct_string_incorrect_chars
+from pdf_broken_encoding_reader.pdf_worker.pdf_text_correcter import text_quality
+from pdf_broken_encoding_reader.scratch import Scratch, ScratchSpace
+
+logger = logging.getLogger(__name__)
+
+# как часто проверяется токен отмены, пока работает fontforge
+fontforge_poll_interval = 0.1
 
 
 class PDFReader:
-    def __init__(self) -> None:
+    """
+    Restores the text of PDFs with broken encoding.
+    Set the metrics attribute to a Metrics object to record stage durations and counters of the next runs.
+    With a font_cache fonts already recognized in other documents skip glyph export and recognition.
+    glyph_engine selects the glyph rasterizer: "fontforge" exports PNGs with the fontforge binary,
+    "numpy" draws the outlines read by fontTools straight into arrays (fonts it can't read still go to fontforge).
+    Readers share the weights of shared_model unless a model is given.
+    Set the cancel_token attribute to a CancelToken to stop the next runs with Cancelled at the next stage, font or page,
+    a running fontforge process is killed.
+    With max_glyphs_per_font the numpy engine renders and recognizes only that many of the most used glyphs of a font,
+    the other glyphs keep their text as it is.
+    Fonts and glyph images of a document go to a folder of the scratch space, removed when the glyph map is built.
+    With a page_store the restored pages are stored by page fingerprint, and iter_pages takes the pages
+    of a new revision of a document that didn't change from there instead of parsing and correcting them again.
+    Together with a font_cache only the changed pages are parsed and only the new fonts are recognized.
+    """
+
+    def __init__(self, triage_fonts: bool = True, font_cache: Optional[FontCache] = None, glyph_engine: Optional[str] = None,
+                 model: Optional[Model] = None, scratch: Optional[ScratchSpace] = None,
+                 page_store: Optional[PageStore] = None) -> None:
         self.extract_path = config.folders.get("extracted_data_folder")
-        self.model = Model()
+        self.model = model or shared_model()
         self.text = None
         self.match_dict = {}
         self.__cached_fonts = None
@@ -45,6 +82,25 @@ class PDFReader:
         self.__need2correct = True
         self.__pdf_fonts_dict = {}
         self.__glyph_to_unicode = {}
+        self.__char_tables = {}
+        self.__on_progress = None
+        self.__triage_fonts = triage_fonts
+        self.__trusted_fonts = set()
+        self.__font_digests = {}
+        self.__cached_matches = {}
+        self.__glyph_arrays = {}
+        self.font_cache = font_cache
+        self.page_store = page_store
+        self.__page_fingerprints = []
+        self.glyph_engine = glyph_engine or config.rasterizer["engine"]
+        self.repair_skipped = False
+        self.metrics = null_metrics
+        self.cancel_token: Optional[CancelToken] = None
+        self.max_glyphs_per_font = 0
+        self.scratch = scratch or ScratchSpace()
+        self.__scratch: Optional[Scratch] = None
+        self.__glyph_usage = {}
+        self.__partial_fonts = set()
 
     def restore_text(self, pdf_path: Path, start_page: int = 0, end_page: int = 0) -> str:
         assert end_page > start_page or start_page == end_page == 0, "wrong pages range"
@@ -62,11 +118,16 @@ class PDFReader:
         self.__extract_glyphs(fonts_path, glyphs_path)
 
     def __extract_fonts(self, pdf_path: Path, fonts_path: Path) -> None:
+        with self.metrics.stage("fonts.extract"):
+            self.__extract_fonts_files(pdf_path, fonts_path)
+
+    def __extract_fonts_files(self, pdf_path: Path, fonts_path: Path) -> None:
         doc = fitz.open(pdf_path)
         xref_visited = []
 
         junk = 0
         for page_num in range(doc.page_count):
+            self.__checkpoint()
             page = doc.get_page_fonts(page_num)
             for fontinfo in page:
                 junk += 1
@@ -80,6 +141,9 @@ class PDFReader:
                     ofile = open(font_path, "wb")
                     ofile.write(font["content"])
                     ofile.close()
+                    self.metrics.count("fonts")
+                    self.metrics.count("font_bytes", len(font["content"]))
+                    self.__check_scratch()
 
                     self.__pdf_fonts_dict[font['name']] = {"xref": xref, "font_data": font}
         doc.close()
@@ -87,36 +151,45 @@ class PDFReader:
     def __extract_glyphs(self, fonts_path: Path, glyphs_path: Path) -> None:
         font_files = list(fonts_path.iterdir())
         white_spaces = {}
-        for font_file in font_files:
+        for font_num, font_file in enumerate(font_files):
+            self.__report_progress("glyphs", font_num, len(font_files))
             font_white_spaces = {}
             font_name = Path(font_file).parts[-1].split(".")[0]
             font_name = re.split(junk_string, font_name)[0]
+            if font_name in self.__trusted_fonts:
+                continue
             save_path = glyphs_path.joinpath(font_name)
             font_path = fonts_path.joinpath(os.fsdecode(font_file))
+            if self.__load_cached_font(font_name, font_path, white_spaces):
+                continue
+            if self.glyph_engine == "numpy" and self.__rasterize_in_process(font_name, font_path, white_spaces):
+                continue
 
             save_path.mkdir()
             save_path = str(save_path)
             font_path = str(font_path)
             ff_path = config.folders.get("ffwraper_folder")
 
-            devnull = open(os.devnull, "wb")
-            if platform == "linux" or platform == "linux2":
-                result = subprocess.check_output(f"fontforge -script {str(ff_path)} generate_all_images {save_path} {font_path}", shell=True, stderr=devnull)
-            else:
-                console_command = f"ffpython {str(ff_path)} generate_all_images {save_path} {font_path}"
-                try:
-                    result = subprocess.check_output(console_command, stderr=devnull)
-                except Exception:
-                    if font_file.suffix.lower() not in [".ttf", ".otf"]:
-                        continue
-                    font = TTFont(font_path)
-                    name_table = font["name"]
-                    for record in name_table.names:
-                        record.string = "undef".encode("utf-16-be")
-                    font.save(font_path)
-
-                    result = subprocess.check_output(console_command, stderr=devnull)
-            devnull.close()
+            with self.metrics.stage("glyphs.rasterize"):
+                if platform == "linux" or platform == "linux2":
+                    result = self.__run_fontforge(f"fontforge -script {str(ff_path)} generate_all_images {save_path} {font_path}", shell=True)
+                else:
+                    console_command = f"ffpython {str(ff_path)} generate_all_images {save_path} {font_path}"
+                    try:
+                        result = self.__run_fontforge(console_command)
+                    except Cancelled:
+                        raise
+                    except Exception:
+                        if font_file.suffix.lower() not in [".ttf", ".otf"]:
+                            continue
+                        font = TTFont(font_path)
+                        name_table = font["name"]
+                        for record in name_table.names:
+                            record.string = "undef".encode("utf-16-be")
+                        font.save(font_path)
+
+                        result = self.__run_fontforge(console_command)
+            self.__check_scratch()
             result = result.decode("utf-8")
             eval_list = list(ast.literal_eval(result))
             imgs_to_resize_set = set(eval_list[0])
@@ -124,36 +197,121 @@ class PDFReader:
             names = eval_list[2]
             codes = eval_list[3]
             name2code = dict(zip_longest(names, codes))
+            self.metrics.count("glyphs", len(imgs_to_resize_set))
 
             if font_name not in self.__name2code:
                 self.__name2code[font_name] = name2code
             else:
                 self.__name2code[font_name].update(name2code)
 
-            for img in imgs_to_resize_set:
-                if functions.is_empty(img) and "png" in img:
-                    uni_whitespace = (PurePath(img).parts[-1]).split(".")[0]
-                    name_whitespace = ""
-                    try:
-                        name_whitespace = chr(int(uni_whitespace))
-                    except Exception:
-                        name_whitespace = uni_whitespace
-                    finally:
-                        font_white_spaces[name_whitespace] = " "
-                        os.remove(img)
-                else:
-                    correctly_resize(img)
+            with self.metrics.stage("glyphs.preprocess"):
+                for img in imgs_to_resize_set:
+                    if functions.is_empty(img) and "png" in img:
+                        uni_whitespace = (PurePath(img).parts[-1]).split(".")[0]
+                        name_whitespace = ""
+                        try:
+                            name_whitespace = chr(int(uni_whitespace))
+                        except Exception:
+                            name_whitespace = uni_whitespace
+                        finally:
+                            font_white_spaces[name_whitespace] = " "
+                            os.remove(img)
+                    else:
+                        correctly_resize(img)
             white_spaces[font_name] = empty_glyphs
         self.white_spaces = white_spaces
 
+    def __run_fontforge(self, command: str, shell: bool = False) -> bytes:
+        """subprocess.check_output that kills the process with its children once the cancel token is cancelled."""
+        posix = os.name == "posix"
+        with subprocess.Popen(command, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, start_new_session=posix) as process:
+            while True:
+                try:
+                    output, _ = process.communicate(timeout=fontforge_poll_interval if self.cancel_token is not None else None)
+                    break
+                except subprocess.TimeoutExpired:
+                    if not self.cancel_token.cancelled:
+                        continue
+                    # с shell=True fontforge — дочерний процесс оболочки, поэтому убивается вся группа
+                    try:
+                        if posix:
+                            os.killpg(process.pid, signal.SIGKILL)
+                        else:
+                            process.kill()
+                    except ProcessLookupError:
+                        pass
+                    process.wait()
+                    self.metrics.count("fontforge_killed")
+                    self.cancel_token.check()
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, command, output)
+        return output
+
+    def __rasterize_in_process(self, font_name: str, font_path: Path, white_spaces: dict) -> bool:
+        """Renders the glyphs of the font into 28x28 arrays without fontforge. Returns False if fontTools can't read the font."""
+        from pdf_broken_encoding_reader.rasterizer import UnsupportedFont, rasterize_font
+
+        try:
+            with self.metrics.stage("glyphs.rasterize"):
+                keys, images, empty_glyphs, names, codes = rasterize_font(font_path, self.__frequent_glyphs(font_name, font_path))
+        except UnsupportedFont:
+            self.metrics.count("rasterizer_fallbacks")
+            return False
+        self.metrics.count("glyphs", len(keys))
+        self.__name2code.setdefault(font_name, {}).update(zip(names, codes))
+        self.__glyph_arrays[font_name] = (keys, images)
+        white_spaces[font_name] = empty_glyphs
+        return True
+
+    def __frequent_glyphs(self, font_name: str, font_path: Path) -> Optional[Set[int]]:
+        """Glyph ids to render with max_glyphs_per_font, None for all glyphs."""
+        # номера глифов текста совпадают с порядком глифов fontTools только для TrueType/OpenType и CFF
+        usage = self.__glyph_usage.get(font_name.split("+")[-1])
+        if not self.max_glyphs_per_font or usage is None or font_path.suffix.lower() not in (".ttf", ".otf", ".cff"):
+            return None
+        self.__partial_fonts.add(font_name)
+        return {glyph_id for glyph_id, _ in usage.most_common(self.max_glyphs_per_font)}
+
+    def __load_cached_font(self, font_name: str, font_path: Path, white_spaces: dict) -> bool:
+        """Takes the glyph names and the recognized glyphs of the font from font_cache, if the font is there."""
+        if self.font_cache is None:
+            return False
+        digest = font_key(font_path, self.glyph_engine, self.model.version)
+        self.__font_digests[font_name] = digest
+        entry = self.font_cache.get(digest)
+        if entry is None:
+            return False
+        self.__name2code.setdefault(font_name, {}).update(entry["name2code"])
+        white_spaces[font_name] = dict(entry["white_spaces"])
+        self.__cached_matches[font_name] = entry["match"]
+        self.metrics.count("font_cache_hits")
+        return True
+
+    def __store_cached_font(self, font_name: str, matching_res: dict) -> None:
+        # неполное распознавание не попадает в кэш, иначе оно досталось бы и запросам полного качества
+        if self.font_cache is None or font_name not in self.__font_digests or font_name in self.__partial_fonts:
+            return
+        entry = make_entry(self.__name2code.get(font_name, {}), self.white_spaces.get(font_name, {}), matching_res)
+        self.font_cache.put(self.__font_digests[font_name], entry)
+
     def __match_glyphs_and_encoding_for_all(self, fonts_path: Path, glyphs_path: Path) -> None:
-        fonts = fonts_path.iterdir()
+        fonts = list(fonts_path.iterdir())
         dicts = self.white_spaces
-        for font_file in fonts:
+        for font_num, font_file in enumerate(fonts):
+            self.__report_progress("recognition", font_num, len(fonts))
             fontname_with_ext = PurePath(font_file).parts[-1]
             fontname = fontname_with_ext.split(".")[0]
             fontname = fontname.split(junk_string)[0]
-            matching_res = self.__match_glyphs_and_encoding(glyphs_path.joinpath(fontname))
+            if fontname in self.__trusted_fonts:
+                continue
+            if fontname in self.__cached_matches:
+                matching_res = self.__cached_matches[fontname]
+            elif fontname in self.__glyph_arrays:
+                matching_res = self.__match_glyphs(*self.__glyph_arrays[fontname], self.model.recognize_arrays)
+                self.__store_cached_font(fontname, matching_res)
+            else:
+                matching_res = self.__match_glyphs_and_encoding(glyphs_path.joinpath(fontname))
+                self.__store_cached_font(fontname, matching_res)
             if fontname in dicts:
                 dicts[fontname].update(matching_res)
             else:
@@ -161,28 +319,24 @@ class PDFReader:
         self.match_dict = dicts
 
     def __match_glyphs_and_encoding(self, images_path: Path) -> Dict[Union[str, int], str]:
-        images = images_path.glob("*")
+        image_paths = list(images_path.glob("*"))
+        keys = ["".join(img.parts[-1].split(".")[:-1]) for img in image_paths]
+        return self.__match_glyphs(keys, image_paths, self.model.recognize_glyph)
+
+    def __match_glyphs(self, keys: List[str], images: Sequence, recognize: Callable[[Sequence], list]) -> Dict[Union[str, int], str]:
+        """Recognizes the glyph images in batches. A key is the glyph code (the char becomes the dict key) or the glyph name."""
         dictionary = {}
-        alphas = {}
-        image_paths = [img for img in images]
         batch_size = 32
-        num_batches = len(image_paths) // batch_size + (1 if len(image_paths) % batch_size != 0 else 0)
-        for batch_idx in range(num_batches):
-            batch_images = image_paths[batch_idx * batch_size:(batch_idx + 1) * batch_size]
-            predictions = self.model.recognize_glyph(batch_images)
-            for img, pred in zip(batch_images, predictions):
-                key = img.parts[-1].split(".")
-                key = "".join(key[:-1])
-                char = chr(int(pred))
+        for start in range(0, len(keys), batch_size):
+            batch_images = images[start:start + batch_size]
+            with self.metrics.stage("recognition.inference"):
+                predictions = recognize(batch_images)
+            self.metrics.count("recognized_glyphs", len(batch_images))
+            for key, pred in zip(keys[start:start + batch_size], predictions):
                 try:
                     dictionary[chr(int(key))] = chr(int(pred))
-                    k = chr(int(key))
                 except Exception:
                     dictionary[key] = chr(int(pred))
-                    k = key
-                if char.isalpha():
-                    alphas.setdefault(char.lower(), []).append((img, k))
-
         return dictionary
 
     def __restore_text(self, pdf_path: Path, start: int = 0, end: int = 0) -> str:
@@ -297,32 +451,44 @@ class PDFReader:
         except Exception:
             char_obj._text = char
 
-    def __correct_pages_text(self, o: Union[LTChar, LTTextLineHorizontal, Iterable], cached_fonts: dict, fulltext: list) -> None:
-        if isinstance(o, LTChar):
-            if o.get_text() == "’":
-                o._text = "'"
-            self.__correct_char_text(o, cached_fonts)
-            if o.get_text() == 'я':
-                x=1
-        elif isinstance(o, Iterable):
-            self.__correct_iterable_text(o, cached_fonts, fulltext)
-        elif isinstance(o, LTTextLineHorizontal):
-            self.__correct_line_text(o, fulltext)
-
-    def __correct_char_text(self, char_obj: LTChar, cached_fonts: dict) -> None:
-        char = char_obj.get_text()
-        fontname = char_obj.fontname
-
-        if not cached_fonts.get(fontname):
-            self.__apply_match_dict(char_obj, fontname, char)
-            return
+    def __correct_pages_text(self, layout: LTPage, cached_fonts: Dict[str, list]) -> None:
+        """
+        Rewrites the text of every LTChar of the page. Corrections are memoized per font in a flat table
+        {extracted char: corrected text} shared by the pages of the document, so a char already met costs one dict lookup.
+        """
+        tables = {}
+        for char_obj in iter_chars(layout):
+            fontname = char_obj.fontname
+            table = tables.get(fontname)
+            if table is None:
+                differences = cached_fonts.get(fontname) or []
+                table = tables[fontname] = self.__char_tables.setdefault((fontname, tuple(differences)), {})
+            text = char_obj._text
+            corrected = table.get(text)
+            if corrected is None:
+                corrected = table[text] = self.__correct_char(text, fontname, cached_fonts.get(fontname))
+            char_obj._text = corrected
+
+    def __correct_char(self, char: str, fontname: str, differences: Optional[list]) -> str:
+        """Corrected text of a char extracted by pdfminer with the font: the glyph of its code recognized by the CNN."""
+        if char == "’":
+            char = "'"
+        if fontname in self.__trusted_fonts:
+            return char
+        if not differences:
+            return self.match_dict.get(fontname, {}).get(char, char)
 
         index = self.__get_char_index(char)
         if index is None:
-            char_obj._text = char if char != "’" else "'"
-            return
-
-        self.__apply_correct_glyph(char_obj, fontname, index, cached_fonts)
+            return char
+        try:
+            glyph_name = differences[index]
+            actual_code = self.__name2code[fontname][glyph_name]
+            unicode_char = self.match_dict[fontname][chr(actual_code)]
+        except Exception:
+            return " "
+        self.__glyph_to_unicode.setdefault(fontname, {})[glyph_name] = unicode_char
+        return unicode_char
 
     def __get_char_index(self, char: str) -> Optional[int]:
         if "cid" in char:
@@ -335,48 +501,184 @@ class PDFReader:
         except Exception:
             return None
 
-    def __apply_match_dict(self, char_obj: LTChar, fontname: str, char: str) -> None:
-        try:
-            char_obj._text = self.match_dict[fontname][char]
-        except Exception:
-            char_obj._text = char
-
-    def __apply_correct_glyph(self, char_obj: LTChar, fontname: str, index: int, cached_fonts: dict) -> None:
+    def __glyph_unicode(self, fontname: str, glyph_name: Union[str, int]) -> Optional[str]:
         try:
-            glyph_name = cached_fonts[fontname][index]
             actual_code = self.__name2code[fontname][glyph_name]
-            unicode_char = self.match_dict[fontname][chr(actual_code)]
-            char_obj._text = unicode_char
-            if fontname not in self.__glyph_to_unicode:
-                self.__glyph_to_unicode[fontname] = {}
-            self.__glyph_to_unicode[fontname][glyph_name] = unicode_char
-        except Exception:
-            char_obj._text = " "
+            return self.match_dict[fontname][chr(actual_code)]
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def get_correct_layout(self, pdf_path: Path, on_progress: Optional[Callable[[str, int, int], None]] = None,
+                           with_corrected_pdf: bool = True, skip_if_correct: bool = False) -> List[list]:
+        """
+        Returns [[pages, layouts], good_pdf_path] with pdfminer pages and corrected layouts.
+        on_progress is called as on_progress(stage, done, total) when a stage starts and after each page of the layout stage.
+        Exceptions raised by the callback abort the processing.
+        If with_corrected_pdf is False the PDF with restored ToUnicode maps isn't written and None is returned instead of its path.
+        If skip_if_correct is True and is_text_layer_correct accepts the document, the native layout is returned
+        without running the repair pipeline, repair_skipped is set and no corrected PDF is written.
+        """
+        return self.__process(pdf_path, on_progress, with_corrected_pdf, skip_if_correct, compact=False)
+
+    def get_compact_layout(self, pdf_path: Path, on_progress: Optional[Callable[[str, int, int], None]] = None,
+                           with_corrected_pdf: bool = True, skip_if_correct: bool = False) -> list:
+        """
+        Same as get_correct_layout, but returns [compact_pages, good_pdf_path] with a CompactPage per page
+        instead of pdfminer objects, so that memory doesn't grow with the whole layout tree of the document.
+        """
+        return self.__process(pdf_path, on_progress, with_corrected_pdf, skip_if_correct, compact=True)
 
-    def __correct_iterable_text(self, iterable: Iterable, cached_fonts: dict, fulltext: list) -> None:
-        for item in iterable:
-            self.__correct_pages_text(item, cached_fonts, fulltext)
+    def iter_pages(self, pdf_path: Path, on_progress: Optional[Callable[[str, int, int], None]] = None,
+                   skip_if_correct: bool = False, compact: bool = True, start_page: int = 0,
+                   end_page: int = 0) -> Iterator[Union[CompactPage, Tuple[PDFPage, LTPage]]]:
+        """
+        Streaming version of get_compact_layout: builds the glyph map once and then yields corrected pages one at a time
+        (CompactPage or, if compact is False, (PDFPage, LTPage) pairs), so memory is bounded by one page plus the map.
+        The PDF with restored ToUnicode maps can be written by write_corrected_pdf after the iteration.
+        """
+        try:
+            self.__prepare(pdf_path, on_progress, skip_if_correct)
+            yield from self.__iter_layout(pdf_path, start_page, end_page, correct=not self.repair_skipped, compact=compact)
+        finally:
+            self.__on_progress = None
 
-    def __correct_line_text(self, line: LTTextLineHorizontal, fulltext: list) -> None:
-        text = line.get_text()
-        line._text = correct_string_incorrect_chars(text)
-        fulltext.append(line.get_text())
+    def glyph_map(self) -> Dict[str, Dict[str, str]]:
+        """Unicode recognized for the glyphs met on the pages of the last iter_pages run, {fontname: {glyph name: char}}."""
+        return {fontname: dict(glyphs) for fontname, glyphs in self.__glyph_to_unicode.items()}
 
-    def get_correct_layout(self, pdf_path: Path) -> List[list]:
+    def write_corrected_pdf(self, pdf_path: Path, glyph_map: Optional[Dict[str, Dict[str, str]]] = None,
+                            output_path: Optional[Path] = None) -> Optional[str]:
+        """
+        Writes the PDF with restored ToUnicode maps for the document processed by the last iter_pages run
+        to output_path, or to a new file of the scratch space that the caller has to remove.
+        A document read in page ranges passes the merged glyph_map of all its ranges.
+        The PDF is copied and the maps are appended as an incremental update, so the original bytes and signatures
+        are kept. Nothing is left at output_path if writing fails.
+        Returns the path or None if the repair was skipped.
+        """
+        if self.repair_skipped:
+            return None
+        self.__checkpoint()
+        if glyph_map is not None:
+            for fontname, glyphs in glyph_map.items():
+                self.__glyph_to_unicode.setdefault(fontname, {}).update(glyphs)
+            self.__collect_document_fonts(pdf_path)
+        output_path = str(output_path) if output_path is not None else self.scratch.temp_file(suffix=".pdf")
+        try:
+            with self.metrics.stage("pdf.cmap"):
+                # fitz дописывает только файл: документ, открытый из памяти (даже из BytesIO), сохраняется целиком
+                self.__process_pdf(str(pdf_path), output_path)
+        except BaseException:
+            Path(output_path).unlink(missing_ok=True)
+            raise
+        return output_path
+
+    def __process(self, pdf_path: Path, on_progress: Optional[Callable[[str, int, int], None]], with_corrected_pdf: bool,
+                  skip_if_correct: bool, compact: bool) -> list:
+        try:
+            self.__prepare(pdf_path, on_progress, skip_if_correct)
+            layouts = self.__restore_layout(pdf_path, correct=not self.repair_skipped, compact=compact)
+            good_pdf_path = None
+            if with_corrected_pdf and not self.repair_skipped:
+                self.__report_progress("pdf", 0, 0)
+                good_pdf_path = self.write_corrected_pdf(pdf_path)
+            return [layouts, good_pdf_path]
+        finally:
+            self.__on_progress = None
 
+    def __prepare(self, pdf_path: Path, on_progress: Optional[Callable[[str, int, int], None]], skip_if_correct: bool) -> None:
+        """Classifies the document and, if it needs the repair, builds the glyph map of its fonts."""
         self.text = ""
         self.match_dict = {}
-        with tempfile.TemporaryDirectory() as fonts_temp_dir, tempfile.TemporaryDirectory() as glyphs_temp_dir:
-            fonts_temp_path = Path(fonts_temp_dir)
-            glyphs_temp_path = Path(glyphs_temp_dir)
-            self.__read_pdf(pdf_path, fonts_temp_path, glyphs_temp_path)
-            self.__match_glyphs_and_encoding_for_all(fonts_temp_path, glyphs_temp_path)
+        self.__reset_document_state()
+        self.__on_progress = on_progress
+        self.repair_skipped = False
+        if skip_if_correct:
+            self.__report_progress("classification", 0, 0)
+            with self.metrics.stage("classification"):
+                self.repair_skipped = self.is_text_layer_correct(pdf_path)
+        if self.repair_skipped:
+            return
 
-        layouts = self.__restore_layout(pdf_path)
-        good_pdf_path = self.__process_pdf(str(pdf_path))
-        return [layouts, good_pdf_path]
+        if self.__triage_fonts:
+            with self.metrics.stage("triage"):
+                self.__trusted_fonts = self.__find_trusted_fonts(pdf_path)
+            self.metrics.count("trusted_fonts", len(self.__trusted_fonts))
+        if self.page_store is not None:
+            with self.metrics.stage("pages.fingerprint"):
+                self.__page_fingerprints = self.__fingerprint_pages(pdf_path)
+        if self.max_glyphs_per_font and self.glyph_engine == "numpy":
+            with self.metrics.stage("glyphs.usage"):
+                self.__glyph_usage = glyph_usage(pdf_path)
+        self.__report_progress("fonts", 0, 0)
+        with self.scratch.session() as scratch:
+            self.__scratch = scratch
+            try:
+                fonts_temp_path = scratch.mkdir("fonts")
+                glyphs_temp_path = scratch.mkdir("glyphs")
+                self.__read_pdf(pdf_path, fonts_temp_path, glyphs_temp_path)
+                self.__match_glyphs_and_encoding_for_all(fonts_temp_path, glyphs_temp_path)
+            finally:
+                self.__scratch = None
+
+    def is_text_layer_correct(self, pdf_path: Path) -> bool:
+        """
+        Quick document-level classifier: samples the text layer of the first pages with fitz
+        and accepts the document if text_quality finds enough valid words. Without the lexicon no document is accepted.
+        """
+        if pdf_text_correcter.lexicon_missing():
+            self.metrics.count("fast_path_no_lexicon")
+            return False
+        settings = config.fast_path
+        with fitz.open(pdf_path) as doc:
+            text = " ".join(doc[page_num].get_text() for page_num in range(min(settings["pages"], doc.page_count)))
+        words_count, valid_share = text_quality(text)
+        return words_count >= settings["min_words"] and valid_share >= settings["min_valid_share"]
+
+    def __reset_document_state(self) -> None:
+        # PDFReader переиспользуется между документами, шрифты разных документов не должны смешиваться
+        self.__pdf_fonts_dict = {}
+        self.__name2code = {}
+        self.__glyph_to_unicode = {}
+        self.__char_tables = {}
+        self.__trusted_fonts = set()
+        self.__font_digests = {}
+        self.__cached_matches = {}
+        self.__glyph_arrays = {}
+        self.__glyph_usage = {}
+        self.__partial_fonts = set()
+        self.__page_fingerprints = []
+        self.white_spaces = {}
+
+    def __check_scratch(self) -> None:
+        if self.__scratch is not None:
+            self.__scratch.check_quota()
+
+    def __checkpoint(self) -> None:
+        if self.cancel_token is not None:
+            self.cancel_token.check()
+
+    def __report_progress(self, stage: str, done: int, total: int) -> None:
+        self.__checkpoint()
+        if self.__on_progress is not None:
+            self.__on_progress(stage, done, total)
+
+    def __restore_layout(self, pdf_path: Path, start: int = 0, end: int = 0, correct: bool = True,
+                         compact: bool = False) -> Union[List[list], List[CompactPage]]:
+        """
+        Returns [pages, fixed_layouts] or, if compact is True, a CompactPage per page:
+        pdfminer objects of a page are released as soon as the page is corrected.
+        """
+        if compact:
+            return list(self.__iter_layout(pdf_path, start, end, correct, compact=True))
+        pages, fixed_layouts = [], []
+        for page, layout in self.__iter_layout(pdf_path, start, end, correct, compact=False):
+            pages.append(page)
+            fixed_layouts.append(layout)
+        return [pages, fixed_layouts]
 
-    def __restore_layout(self, pdf_path: Path, start: int = 0, end: int = 0) -> List[list]:
+    def __iter_layout(self, pdf_path: Path, start: int = 0, end: int = 0, correct: bool = True,
+                      compact: bool = False) -> Iterator[Union[CompactPage, Tuple[PDFPage, LTPage]]]:
         self.__cached_fonts = {}
         self.__fontname2basefont = {}
         self.__unicodemaps = {}
@@ -391,8 +693,10 @@ class PDFReader:
             laparams = LAParams()
             device = PDFPageAggregator(rsrcmgr, laparams=laparams)
             interpreter = PDFPageInterpreter(rsrcmgr, device)
-            fixed_layouts = []
-            pages = []
+            # неполное распознавание шрифтов зависит от остальных страниц документа, такие страницы не сохраняются
+            fingerprints = self.__page_fingerprints if correct and compact and not self.__partial_fonts else []
+            if fingerprints and len(fingerprints) != pages_count:
+                fingerprints = []
 
             for page_num, page in enumerate(PDFPage.create_pages(document)):
                 if page_num < start:
@@ -400,240 +704,265 @@ class PDFReader:
                 elif page_num >= end:
                     break
 
-                interpreter.process_page(page)
-                layout = device.get_result()
-                cached_fonts = {}
-                fonts = page.resources.get("Font", {})
-
-                for _, font_obj in fonts.items():
-                    font_dict = resolve1(font_obj)
-                    encoding = resolve1(font_dict.get("Encoding"))
-                    f = rsrcmgr.get_font(objid=font_obj.objid, spec=font_obj.objid)
-                    self.__fontname2basefont[f.fontname] = getattr(f, "basefont", f.fontname)
-
-                    if hasattr(f, "unicode_map") and hasattr(f.unicode_map, "cid2unichr"):
-                        basefont = self.__fontname2basefont[f.fontname]
-                        self.__unicodemaps[basefont] = f.unicode_map.cid2unichr
-
-                    if isinstance(encoding, dict) and ("Differences" in encoding or "/Differences" in encoding):
-                        cached_fonts[f.fontname] = [
-                            q.name if isinstance(q, PSLiteral) else q
-                            for q in encoding.get("Differences", [])
-                        ]
-                    else:
-                        cached_fonts[f.fontname] = []
+                self.__report_progress("layout", page_num - start, end - start)
+                fingerprint = fingerprints[page_num] if fingerprints else None
+                if fingerprint is not None:
+                    stored_page = self.__load_stored_page(fingerprint, page_num)
+                    if stored_page is not None:
+                        yield stored_page
+                        continue
+                with self.metrics.stage("layout.parse"):
+                    interpreter.process_page(page)
+                    layout = device.get_result()
+                    cached_fonts = self.__collect_page_fonts(page, rsrcmgr)
+                self.metrics.count("pages")
                 # Заменил потом надо переписать нормально
                 # self.__cached_fonts = cached_fonts
                 for fontname, differences in cached_fonts.items():
                     self.__cached_fonts.setdefault(fontname, differences)
 
                 # self.__cached_fonts = rsrcmgr._cached_fonts
-                fulltext = []
-                self.__correct_pages_text(layout, cached_fonts, fulltext)
-                fixed_layouts.append(layout)
-                pages.append(page)
+                char_texts = page_char_texts(layout) if fingerprint is not None else None
+                if correct:
+                    with self.metrics.stage("layout.correct"):
+                        self.__correct_pages_text(layout, cached_fonts)
+                if compact:
+                    with self.metrics.stage("layout.compact"):
+                        compact_page = CompactPage.from_layout(layout, page_num)
+                    self.metrics.count("chars", len(compact_page))
+                    if fingerprint is not None:
+                        self.__store_page(fingerprint, compact_page, cached_fonts, char_texts)
+                    yield compact_page
+                else:
+                    yield page, layout
+            self.__report_progress("layout", end - start, end - start)
 
-        return [pages, fixed_layouts]
+    def __fingerprint_pages(self, pdf_path: Path) -> List[str]:
+        """
+        Fingerprint of every page for page_store: the page with its resources, the glyph engine, the model version
+        and which of the page fonts the triage trusted, since these decide how the page is corrected.
+        """
+        with fitz.open(pdf_path) as doc:
+            pages = page_fingerprints(doc)
+        fingerprints = []
+        for page_digest, fonts in pages:
+            trusted = sorted(font for font in fonts if font in self.__trusted_fonts)
+            key = json.dumps([page_digest, self.glyph_engine, self.model.version, trusted])
+            fingerprints.append(hashlib.sha256(key.encode()).hexdigest())
+        return fingerprints
+
+    def __load_stored_page(self, fingerprint: str, page_num: int) -> Optional[CompactPage]:
+        """Takes the page from page_store with the fonts and glyphs it adds to the glyph map of the document."""
+        record = self.page_store.get(fingerprint)
+        if record is None:
+            return None
+        for fontname, differences in record["fonts"].items():
+            self.__cached_fonts.setdefault(fontname, differences)
+        for fontname, glyphs in record["glyphs"].items():
+            self.__glyph_to_unicode.setdefault(fontname, {}).update(glyphs)
+        # копия: та же страница может встретиться в документе еще раз или сместиться, если перед ней вставили другие
+        page = copy.copy(record["page"])
+        page.page_num = page_num
+        self.metrics.count("pages")
+        self.metrics.count("stored_pages")
+        self.metrics.count("chars", len(page))
+        return page
+
+    def __store_page(self, fingerprint: str, page: CompactPage, cached_fonts: Dict[str, list],
+                     char_texts: Dict[str, Set[str]]) -> None:
+        glyphs = {}
+        for fontname, texts in char_texts.items():
+            differences = cached_fonts.get(fontname)
+            known = self.__glyph_to_unicode.get(fontname)
+            if not differences or not known:
+                continue
+            for text in texts:
+                # тот же поиск имени глифа, что и в __correct_char
+                try:
+                    glyph_name = differences[self.__get_char_index("'" if text == "’" else text)]
+                except (IndexError, KeyError, TypeError, ValueError):
+                    continue
+                if glyph_name in known:
+                    glyphs.setdefault(fontname, {})[glyph_name] = known[glyph_name]
+        self.page_store.put(fingerprint, {"page": page, "fonts": cached_fonts, "glyphs": glyphs})
+
+    def __collect_page_fonts(self, page: PDFPage, rsrcmgr: PDFResourceManager) -> Dict[str, list]:
+        """
+        Returns {fontname: Differences glyph names} for the fonts of the page and remembers their ToUnicode maps.
+        """
+        cached_fonts = {}
+        fonts = page.resources.get("Font", {})
+
+        for _, font_obj in fonts.items():
+            font_dict = resolve1(font_obj)
+            encoding = resolve1(font_dict.get("Encoding"))
+            f = rsrcmgr.get_font(objid=font_obj.objid, spec=font_dict)
+            self.__fontname2basefont[f.fontname] = getattr(f, "basefont", f.fontname)
+
+            if hasattr(f, "unicode_map") and hasattr(f.unicode_map, "cid2unichr"):
+                basefont = self.__fontname2basefont[f.fontname]
+                self.__unicodemaps[basefont] = f.unicode_map.cid2unichr
+
+            if isinstance(encoding, dict) and ("Differences" in encoding or "/Differences" in encoding):
+                cached_fonts[f.fontname] = [
+                    q.name if isinstance(q, PSLiteral) else q
+                    for q in encoding.get("Differences", [])
+                ]
+            else:
+                cached_fonts[f.fontname] = []
+        return cached_fonts
+
+    def __collect_document_fonts(self, pdf_path: Path) -> None:
+        # шрифты страниц вне последнего диапазона берутся из ресурсов страниц, без разбора их содержимого
+        if self.__cached_fonts is None:
+            self.__cached_fonts = {}
+        rsrcmgr = PDFResourceManager()
+        with open(pdf_path, "rb") as fp:
+            for page in PDFPage.create_pages(PDFDocument(PDFParser(fp))):
+                for fontname, differences in self.__collect_page_fonts(page, rsrcmgr).items():
+                    self.__cached_fonts.setdefault(fontname, differences)
 
-    def save_corrected_pdf(self, input_path: Path, output_path: Path, pages_info: List[list]) -> None:
+    def __find_trusted_fonts(self, pdf_path: Path) -> Set[str]:
+        """
+        Finds fonts whose encoding is already correct, so that they can skip glyph export and recognition.
+        The check looks at the first pages only: the Differences glyph names must be standard ones,
+        must agree with the ToUnicode map if there is one, and the text decoded with the font must pass text_quality.
+        Fonts that don't occur on these pages are treated as broken, and so are all fonts without the lexicon.
+        """
+        if pdf_text_correcter.lexicon_missing():
+            self.metrics.count("triage_no_lexicon")
+            return set()
+        settings = config.triage
+        self.__fontname2basefont = {}
+        self.__unicodemaps = {}
+        fonts_differences = {}
+        font_texts = {}
+
+        with open(pdf_path, "rb") as fp:
+            document = PDFDocument(PDFParser(fp))
+            rsrcmgr = PDFResourceManager()
+            device = PDFPageAggregator(rsrcmgr, laparams=LAParams())
+            interpreter = PDFPageInterpreter(rsrcmgr, device)
+            for page_num, page in enumerate(PDFPage.create_pages(document)):
+                if page_num >= settings["pages"]:
+                    break
+                interpreter.process_page(page)
+                for fontname, differences in self.__collect_page_fonts(page, rsrcmgr).items():
+                    fonts_differences.setdefault(fontname, differences)
+                for line in iter_text_lines(device.get_result()):
+                    collect_font_texts(line, font_texts)
+
+        trusted = set()
+        for fontname, chunks in font_texts.items():
+            words_count, valid_share = text_quality("".join(chunks))
+            if words_count < settings["min_words"] or valid_share < settings["min_valid_share"]:
+                continue
+
+            code2name = list(iter_differences(fonts_differences.get(fontname, [])))
+            if code2name:
+                standard = {code: name2unicode_or_none(name) for code, name in code2name}
+                known = {code: uni for code, uni in standard.items() if uni is not None}
+                if len(known) / len(standard) < settings["min_standard_names_share"]:
+                    continue
+                unicode_map = self.__unicodemaps.get(self.__fontname2basefont.get(fontname, fontname))
+                if unicode_map:
+                    compared = [code for code in known if code in unicode_map]
+                    agreed = sum(unicode_map[code] == known[code] for code in compared)
+                    if compared and agreed / len(compared) < settings["min_tounicode_agreement"]:
+                        continue
+            trusted.add(fontname)
+        return trusted
+
+    def save_corrected_pdf(self, input_path: Path, output_path: Path, pages: List[CompactPage], workers: int = 1) -> None:
         """
         Сохраняет исправленный текст в новый PDF с поддержкой кириллицы
         :param input_path: путь к исходному PDF (для размеров страниц)
         :param output_path: путь для сохранения исправленного PDF
-        :param pages_info: результат работы __restore_layout ([pages, fixed_layouts])
+        :param pages: результат работы get_compact_layout или iter_pages
+        :param workers: число процессов, страницы делятся между ними поровну и потом склеиваются
         """
-        pages, layouts = pages_info
-
-        with fitz.open(input_path) as src_doc, fitz.open() as new_doc:
-            cyrillic_font = "Times-Roman"
-
-            for page, layout in zip(src_doc, layouts):
-                new_page = new_doc.new_page(
-                    width=page.rect.width,
-                    height=page.rect.height
-                )
-
-                def collect_text(element, text_items: list):
-                    if isinstance(element, LTChar):
-                        text_items.append({
-                            'text': element._text,
-                            'x': element.x0,
-                            'y': page.rect.height - element.y1,
-                            'size': element.size
-                        })
-                    elif hasattr(element, '__iter__'):
-                        for child in element:
-                            collect_text(child, text_items)
-
-                text_items = []
-                collect_text(layout, text_items)
-
-                from collections import defaultdict
-                lines = defaultdict(list)
-                for item in text_items:
-                    y = round(item['y'], 1)
-                    lines[y].append(item)
-
-                for y, items in sorted(lines.items(), reverse=True):
-                    items.sort(key=lambda x: x['x'])
-                    line_text = ''.join(item['text'] for item in items)
-
-                    if line_text.strip():
-                        try:
-                            new_page.insert_text(
-                                point=(items[0]['x'], y),
-                                text=line_text,
-                                fontsize=items[0]['size'],
-                                fontname=cyrillic_font
-                            )
-                        except Exception as e:
-                            print(f"Ошибка вставки текста: {e} | Текст: '{line_text}'")
-
+        if workers <= 1 or len(pages) < 2:
+            chunks = [render_text_layer(str(input_path), pages)]
+        else:
+            chunk_size = -(-len(pages) // workers)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(render_text_layer, str(input_path), pages[i:i + chunk_size]) for i in range(0, len(pages), chunk_size)]
+                chunks = [future.result() for future in futures]
+
+        with fitz.open() as new_doc:
+            for chunk in chunks:
+                with fitz.open("pdf", chunk) as chunk_doc:
+                    new_doc.insert_pdf(chunk_doc)
+            # garbage=4 объединяет одинаковые шрифты из разных частей
             new_doc.save(output_path, garbage=4, deflate=True)
 
-    def __process_pdf(self, pdf_path: str) -> str:
-        import fitz
-        import tempfile
-        import os
-
-        pdf_doc = fitz.open(pdf_path)
+    def __process_pdf(self, pdf_path: str, output_path: str) -> None:
+        """
+        Writes a copy of the PDF with restored ToUnicode maps to output_path.
+        Only the changed fonts and their CMaps are appended as an incremental update, fonts with identical maps share one stream.
+        """
+        shutil.copyfile(pdf_path, output_path)
 
-        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp_file:
-            output_path = tmp_file.name
+        pdf_doc = fitz.open(output_path)
+        incremental = pdf_doc.can_save_incrementally()
+        if not incremental:
+            # поврежденный файл (xref восстановлен при открытии) нельзя дописать, сохраняем его целиком
+            pdf_doc.close()
+            pdf_doc = fitz.open(pdf_path)
 
         try:
-            for font_name, char_map in self.match_dict.items():
-                if font_name in self.__pdf_fonts_dict:
-                    cmap_str = self.generate_cmap(char_map, font_name)
-                    font_xref = self.__pdf_fonts_dict[font_name]["xref"]
-                    self.__add_tounicode_cmap_to_font(pdf_doc, font_xref, cmap_str)
-                    print(f"Added cmap for font {font_name}")
-                else:
-                    print(f"Font {font_name} not found in PDF")
-
-            pdf_doc.save(output_path)
-            return output_path
-
+            if not self.__add_cmaps(pdf_doc) and incremental:
+                return
+            if incremental:
+                pdf_doc.save(output_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+            else:
+                pdf_doc.save(output_path)
+            self.metrics.count("pdf_bytes", os.path.getsize(output_path))
         finally:
             pdf_doc.close()
 
-    # def generate_cmap(match_dict_for_font: Dict[str, str]) -> str:
-    #     # match_dict_for_font: mapping from glyph codes (str or int) to unicode chars (str)
-    #     bfchar_lines = []
-    #     for glyph_code, unicode_char in match_dict_for_font.items():
-    #         # glyph_code — это строка, обычно имя глифа, нужно преобразовать в код (CID) — обычно integer
-    #         # Для примера пусть glyph_code — это символ, берем ord
-    #         # unicode_char — один символ
-    #         cid = ord(glyph_code) if len(glyph_code) == 1 else int(glyph_code)
-    #         uni = ord(unicode_char)
-    #         bfchar_lines.append(f"<{cid:04X}> <{uni:04X}>")
-    #
-    #     cmap_text = f"""
-    #         /CIDInit /ProcSet findresource begin
-    #         12 dict begin
-    #         begincmap
-    #         /CIDSystemInfo
-    #         << /Registry (Adobe)
-    #         /Ordering (UCS)
-    #         /Supplement 0
-    #         >> def
-    #         /CMapName /Adobe-Identity-UCS def
-    #         /CMapType 2 def
-    #         1 begincodespacerange
-    #         <0000> <FFFF>
-    #         endcodespacerange
-    #         {len(bfchar_lines)} beginbfchar
-    #         """ + "\n".join(bfchar_lines) + """
-    #         endbfchar
-    #         endcmap
-    #         CMapName currentdict /CMap defineresource pop
-    #         end
-    #         end
-    #         """
-    #     return cmap_text
-    # def __add_tounicode_cmap_to_font(self, pdf_doc: fitz.Document, font_xref, cmap_str):
-    #     # to_unicode_xref = pdf_doc.add_stream(cmap_str.encode("utf-8"), info={"Type": "/Stream", "Length": len(cmap_str)})
-    #     # font_obj = pdf_doc.get_obj(font_xref)
-    #     # font_obj.update({"/ToUnicode": to_unicode_xref})
-    #     cmap_xref = pdf_doc.get_new_xref()
-    #     cmap_bytes = cmap_str.encode("utf-8")
-    #     length = len(cmap_bytes)
-    #     # obj_str = (
-    #     #     f"<< /Length {length} >>\n"
-    #     #     f"stream\n"
-    #     #     f"{cmap_str}\n"
-    #     #     f"endstream"
-    #     # )
-    #     import zlib
-    #     obj_str = (
-    #         f"<< /Length {length} >>\n"
-    #         f"stream\n"
-    #         f"{cmap_str}\n"
-    #         f"endstream\n"
-    #     )
-    #     pdf_doc.update_object(cmap_xref, obj_str)
-    #
-    #     font_obj_str = pdf_doc.xref_object(font_xref, compressed=False)
-    #
-    #     insert_pos = font_obj_str.rfind(">>")
-    #     if insert_pos == -1:
-    #         raise ValueError("Invalid font object dictionary")
-    #
-    #     to_unicode_str = f"/ToUnicode {cmap_xref} 0 R\n"
-    #     new_font_obj_str = font_obj_str[:insert_pos] + to_unicode_str + font_obj_str[insert_pos:]
-    #     pdf_doc.update_object(font_xref, new_font_obj_str)
-
-    def __add_tounicode_cmap_to_font(self, pdf_doc: fitz.Document, font_xref, cmap_str):
-        cmap_bytes = cmap_str.encode("utf-8")
+    def __add_cmaps(self, pdf_doc: fitz.Document) -> int:
+        """Points the fonts of the document at the generated CMaps, returns the number of CMap streams added."""
+        cmap_xrefs = {}
+        for font_name, char_map in self.match_dict.items():
+            if font_name in self.__pdf_fonts_dict:
+                cmap_bytes = self.generate_cmap(char_map, font_name).encode("utf-8")
+                font_xref = self.__pdf_fonts_dict[font_name]["xref"]
+                if cmap_bytes not in cmap_xrefs:
+                    cmap_xrefs[cmap_bytes] = self.__add_cmap_stream(pdf_doc, cmap_bytes)
+                    self.metrics.count("cmap_streams")
+                    self.metrics.count("cmap_bytes", len(cmap_bytes))
+                pdf_doc.xref_set_key(font_xref, "ToUnicode", f"{cmap_xrefs[cmap_bytes]} 0 R")
+                logger.debug("added ToUnicode for font %s", font_name)
+            else:
+                logger.debug("font %s not found in the PDF", font_name)
+        return len(cmap_xrefs)
 
+    def __add_cmap_stream(self, pdf_doc: fitz.Document, cmap_bytes: bytes) -> int:
         cmap_xref = pdf_doc.get_new_xref()
+        pdf_doc.update_object(cmap_xref, "<<>>")
+        pdf_doc.update_stream(cmap_xref, cmap_bytes, new=True, compress=True)
+        return cmap_xref
 
-        pdf_doc.update_object(
-            cmap_xref,
-            f"<< /Length {len(cmap_bytes)} >>"
-        )
-
-        pdf_doc.update_stream(cmap_xref, cmap_bytes)
-
-        font_obj_str = pdf_doc.xref_object(font_xref, compressed=False)
-        insert_pos = font_obj_str.rfind(">>")
-        if insert_pos == -1:
-            raise ValueError("Invalid font object dictionary")
-
-        to_unicode_str = f"\n/ToUnicode {cmap_xref} 0 R\n"
-        new_font_obj_str = font_obj_str[:insert_pos] + to_unicode_str + font_obj_str[insert_pos:]
-
-        pdf_doc.update_object(font_xref, new_font_obj_str)
-
-
-
-
-    def generate_cmap(self, char_map: Dict, font_name):
+    def generate_cmap(self, char_map: Dict, font_name) -> str:
         """
         Генерирует ToUnicode CMap из словаря char_map {pdf_char: unicode_char}
+        Последовательные коды с последовательными символами сворачиваются в bfrange.
         """
-        bfchar_lines = []
+        code2unicode = {}
         glyph_to_unicode = self.__glyph_to_unicode.get(font_name, {})
         differences = self.__cached_fonts[font_name]
 
         if glyph_to_unicode and differences:
-            start_cid = differences[0]
-            glyph_names = differences[1:]
-            for offset, glyph_name in enumerate(glyph_names):
-                cid = start_cid + offset
-
+            for cid, glyph_name in iter_differences(differences):
                 uni_char = glyph_to_unicode.get(glyph_name)
-                if uni_char is None:
-                    uni_char = ' '
-                if uni_char:
-                    cid_hex = f"{cid:02X}"
-                    uni_hex = f"{ord(uni_char):04X}"
-                    bfchar_lines.append(f"<{cid_hex}> <{uni_hex}>")
+                code2unicode[cid] = uni_char if uni_char is not None else " "
         else:
             for pdf_char, uni_char in char_map.items():
-                pdf_code = f"{ord(pdf_char):02X}"
-                uni_code = f"{ord(uni_char):04X}"
-                bfchar_lines.append(f"<{pdf_code}> <{uni_code}>")
+                if len(pdf_char) == 1:
+                    code2unicode[ord(pdf_char)] = uni_char
+
+        mapping = sorted((code, ord(uni_char)) for code, uni_char in code2unicode.items() if code <= 0xFF and len(uni_char) == 1)
 
         header = (
             "/CIDInit /ProcSet findresource begin\n"
@@ -651,8 +980,142 @@ class PDFReader:
             "endcodespacerange\n"
         )
 
-        bfchar_block = f"{len(bfchar_lines)} beginbfchar\n" + "\n".join(bfchar_lines) + "\nendbfchar\n"
-
         footer = "endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend"
 
-        return header + bfchar_block + footer
+        return header + cmap_sections(mapping) + footer
+
+
+def glyph_usage(pdf_path: Path) -> Dict[str, Counter]:
+    """How many times every glyph id is drawn, per font name without the subset prefix, from the fitz text trace."""
+    usage = {}
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            for span in page.get_texttrace():
+                usage.setdefault(span["font"], Counter()).update(char[1] for char in span["chars"])
+    return usage
+
+
+def page_char_texts(layout: Iterable) -> Dict[str, Set[str]]:
+    """Distinct texts of the chars of the page per font, as pdfminer extracted them."""
+    texts = {}
+    for char in iter_chars(layout):
+        texts.setdefault(char.fontname, set()).add(char._text)
+    return texts
+
+
+def iter_differences(differences: list) -> Iterator[Tuple[int, str]]:
+    """Yields (code, glyph name) pairs of a /Differences array."""
+    code = 0
+    for item in differences:
+        if isinstance(item, int):
+            code = item
+        elif isinstance(item, str):
+            yield code, item
+            code += 1
+
+
+def name2unicode_or_none(glyph_name: str) -> Optional[str]:
+    try:
+        return name2unicode(glyph_name)
+    except Exception:
+        return None
+
+
+def iter_text_lines(layout: Iterable) -> Iterator[LTTextLine]:
+    stack = [layout]
+    while stack:
+        element = stack.pop()
+        if isinstance(element, LTTextLine):
+            yield element
+        elif isinstance(element, Iterable) and not isinstance(element, LTChar):
+            stack.extend(reversed(list(element)))
+
+
+def collect_font_texts(line: LTTextLine, font_texts: Dict[str, List[str]]) -> None:
+    """Splits the text of the line by fonts, chunks of different fonts are separated by spaces."""
+    current = None
+    for item in line:
+        if isinstance(item, LTChar):
+            if current is not None and item.fontname != current:
+                font_texts[current].append(" ")
+            current = item.fontname
+            font_texts.setdefault(current, []).append(item.get_text())
+        elif current is not None:
+            font_texts[current].append(item.get_text())
+    if current is not None:
+        font_texts[current].append(" ")
+
+
+def cmap_sections(mapping: List[Tuple[int, int]]) -> str:
+    """
+    Builds bfrange/bfchar sections from sorted (code, unicode) pairs:
+    runs of consecutive codes mapped to consecutive code points become a single bfrange entry.
+    A run never carries past the last byte of its code or destination, and sections hold at most 100 entries,
+    as the CMap format requires.
+    """
+    ranges, chars = [], []
+    run_start = 0
+    for index in range(1, len(mapping) + 1):
+        if index < len(mapping) and continues_run(mapping[index - 1], mapping[index]):
+            continue
+        first_code, first_uni = mapping[run_start]
+        last_code = mapping[index - 1][0]
+        if last_code > first_code:
+            ranges.append(f"<{first_code:02X}> <{last_code:02X}> <{first_uni:04X}>")
+        else:
+            chars.append(f"<{first_code:02X}> <{first_uni:04X}>")
+        run_start = index
+
+    sections = []
+    for operator, entries in (("bfrange", ranges), ("bfchar", chars)):
+        for chunk_start in range(0, len(entries), 100):
+            chunk = entries[chunk_start:chunk_start + 100]
+            sections.append(f"{len(chunk)} begin{operator}\n" + "\n".join(chunk) + f"\nend{operator}\n")
+    return "".join(sections)
+
+
+def continues_run(previous: Tuple[int, int], pair: Tuple[int, int]) -> bool:
+    code, uni = pair
+    # в bfrange меняется только последний байт: <00FF> -> <0100> начинает новый диапазон
+    return code == previous[0] + 1 and uni == previous[1] + 1 and code & 0xFF != 0 and uni & 0xFF != 0
+
+
+text_layer_font = None
+
+
+def render_text_layer(input_path: str, pages: List[CompactPage]) -> bytes:
+    """
+    Builds a PDF with the text of the pages: chars are grouped into lines by the rounded baseline
+    and every page is written with a single TextWriter, the font object is shared by all pages.
+    """
+    global text_layer_font
+    if text_layer_font is None:
+        text_layer_font = fitz.Font("tiro")
+
+    with fitz.open(input_path) as src_doc, fitz.open() as new_doc:
+        for compact_page in pages:
+            rect = src_doc[compact_page.page_num].rect
+            new_page = new_doc.new_page(width=rect.width, height=rect.height)
+            if len(compact_page) == 0:
+                continue
+
+            x0 = np.frombuffer(compact_page.x0, dtype=np.float32)
+            y = np.round(rect.height - np.frombuffer(compact_page.y1, dtype=np.float32), 1)
+            order = np.lexsort((x0, -y))
+            line_starts = np.concatenate(([0], np.flatnonzero(np.diff(y[order])) + 1))
+            line_ends = np.append(line_starts[1:], len(order))
+
+            writer = fitz.TextWriter(new_page.rect)
+            for line_start, line_end in zip(line_starts.tolist(), line_ends.tolist()):
+                indexes = order[line_start:line_end].tolist()
+                line_text = "".join(compact_page.char_text(i) for i in indexes)
+                if not line_text.strip():
+                    continue
+                first = indexes[0]
+                try:
+                    writer.append((compact_page.x0[first], float(y[first])), line_text, font=text_layer_font, fontsize=compact_page.size[first])
+                except Exception as e:
+                    # строка, которую шрифт не смог вывести, пропускается, остальной текст страницы сохраняется
+                    logger.warning("line of page %d not written to the text layer: %s", compact_page.page_num, e)
+            writer.write_text(new_page)
+        return new_doc.tobytes()
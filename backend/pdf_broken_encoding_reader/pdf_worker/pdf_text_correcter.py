@@ -1,8 +1,7 @@
+import logging
 import re
-from typing import List, Union
-
-import numpy as np
-from Levenshtein import distance
+from functools import lru_cache
+from typing import List, Optional, Set, Tuple, Union
 
 from pdf_broken_encoding_reader import config
 from pdf_broken_encoding_reader.functions import get_project_root
@@ -20,8 +19,11 @@ eng = [
 ]
 only_rus = ["я", "й", "ц", "б", "ж", "з", "д", "л", "ф", "ш", "щ", "ч", "ъ", "ь", "э", "ю", "г"]
 only_eng = ["q", "w", "f", "i", "j", "l", "z", "s", "v", "g"]
+alphabet = set(config.char_pool["rus_eng"])
+logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=None)
 def get_russian_and_english_words() -> List[list]:
     from nltk.corpus import words
 
@@ -42,6 +44,48 @@ def get_russian_and_english_words() -> List[list]:
     return result
 
 
+@lru_cache(maxsize=None)
+def get_lexicon() -> Optional[Set[str]]:
+    """Lowercased dictionary words, None if the dictionaries aren't installed."""
+    try:
+        return {word.lower() for words_of_length in get_russian_and_english_words() for word in words_of_length}
+    except (ImportError, LookupError, OSError):
+        return None
+
+
+@lru_cache(maxsize=None)
+def lexicon_missing() -> bool:
+    """
+    True if the dictionaries aren't installed. Without them text_quality only checks the alphabet of the words,
+    which scrambled letters pass as well, so no text layer or font may be trusted on its score.
+    """
+    if get_lexicon() is not None:
+        return False
+    logger.warning("nltk words and data/russian.txt are not installed: text layers and fonts are never trusted")
+    return True
+
+
+def text_quality(text: str) -> Tuple[int, float]:
+    """
+    Cheap check of an extracted text layer: returns the number of words and the share of words that look valid.
+    A word is valid if all its chars belong to the alphabet, it doesn't mix cyrillic and latin look-alikes
+    and it is found in the lexicon (when the lexicon is available).
+    (cid:N) placeholders of pdfminer and replacement chars of fitz count as invalid words.
+    """
+    lexicon = get_lexicon()
+    invalid = len(re.findall(r"\(cid:\d+\)", text)) + text.count("\ufffd")
+    words = re.findall(r"[^\W\d_]{3,}", re.sub(r"\(cid:\d+\)", " ", text))
+    valid = 0
+    for word in words:
+        if not all(char in alphabet for char in word) or correct_word_incorrect_chars(word) != word:
+            continue
+        if lexicon is not None and word.lower() not in lexicon:
+            continue
+        valid += 1
+    total = len(words) + invalid
+    return total, valid / total if total else 0.0
+
+
 def correct_string_incorrect_chars(input_string: str) -> str:
     strings = input_string.split(" ")
     ans = []
@@ -122,6 +166,9 @@ def t9_text(text: str) -> str:
 
 
 def find_closest_word(word: str) -> str:
+    import numpy as np
+    from Levenshtein import distance
+
     rus_and_eng_names = get_russian_and_english_words()
     lower_word = word.lower()
     distances = np.array([distance(lower_word, i.lower(), weights=(1000, 1000, 1)) for i in rus_and_eng_names[len(lower_word)]])
@@ -0,0 +1,231 @@
+import io
+import math
+import struct
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from fontTools.agl import toUnicode
+from fontTools.cffLib import CFFFontSet
+from fontTools.encodings.StandardEncoding import StandardEncoding
+from fontTools.pens.basePen import BasePen
+from fontTools.t1Lib import T1Font
+from fontTools.ttLib import TTFont, TTLibError
+
+from pdf_broken_encoding_reader import config
+
+settings = config.rasterizer
+
+
+class UnsupportedFont(Exception):
+    pass
+
+
+# так fontTools сообщает о поврежденных таблицах и глифах: таблицы шрифта lazy=True читаются при первом обращении
+font_errors = (TTLibError, KeyError, ValueError, IndexError, AssertionError, TypeError, struct.error, RecursionError)
+
+
+class FlatteningPen(BasePen):
+    """Collects the outline of a glyph as closed polygons, curves are split into straight segments."""
+
+    def __init__(self, glyph_set: Optional[dict] = None, curve_steps: int = settings["curve_steps"]) -> None:
+        super().__init__(glyph_set)
+        steps = [step / curve_steps for step in range(1, curve_steps + 1)]
+        # коэффициенты Безье для точек разбиения считаются один раз на перо
+        self.__cubic = [((1 - t) ** 3, 3 * (1 - t) ** 2 * t, 3 * (1 - t) * t * t, t ** 3) for t in steps]
+        self.__quadratic = [((1 - t) ** 2, 2 * (1 - t) * t, t * t) for t in steps]
+        self.contours: List[List[Tuple[float, float]]] = []
+        self.__contour: List[Tuple[float, float]] = []
+
+    def _moveTo(self, pt: Tuple[float, float]) -> None:
+        self._closePath()
+        self.__contour = [pt]
+
+    def _lineTo(self, pt: Tuple[float, float]) -> None:
+        self.__contour.append(pt)
+
+    def _curveToOne(self, pt1: Tuple[float, float], pt2: Tuple[float, float], pt3: Tuple[float, float]) -> None:
+        (x0, y0), (x1, y1), (x2, y2), (x3, y3) = self._getCurrentPoint(), pt1, pt2, pt3
+        self.__contour.extend((a * x0 + b * x1 + c * x2 + d * x3, a * y0 + b * y1 + c * y2 + d * y3) for a, b, c, d in self.__cubic)
+
+    def _qCurveToOne(self, pt1: Tuple[float, float], pt2: Tuple[float, float]) -> None:
+        (x0, y0), (x1, y1), (x2, y2) = self._getCurrentPoint(), pt1, pt2
+        self.__contour.extend((a * x0 + b * x1 + c * x2, a * y0 + b * y1 + c * y2) for a, b, c in self.__quadratic)
+
+    def _closePath(self) -> None:
+        if len(self.__contour) > 2:
+            self.contours.append(self.__contour)
+        self.__contour = []
+
+    _endPath = _closePath
+
+
+def rasterize(contours: List[List[Tuple[float, float]]], units_per_em: float, image_size: int = settings["image_size"],
+              output_size: int = 28, supersampling: int = settings["supersampling"]) -> np.ndarray:
+    """
+    Renders the polygons with the nonzero winding rule into an output_size x output_size uint8 buffer, white glyph on black.
+    The result follows fontforge export at image_size pixels per em + correctly_resize:
+    the glyph box is shrunk to fit the buffer keeping the aspect ratio (never enlarged) and centered.
+    """
+    image = np.zeros((output_size, output_size), dtype=np.uint8)
+    points = np.concatenate([np.asarray(contour, dtype=np.float64) for contour in contours])
+    x_min, y_min = points.min(axis=0)
+    x_max, y_max = points.max(axis=0)
+    scale = image_size / units_per_em
+    box = max(math.ceil((x_max - x_min) * scale), math.ceil((y_max - y_min) * scale), 1)
+    if box > output_size:
+        scale *= output_size / box
+    width = min(output_size, max(1, round((x_max - x_min) * scale)))
+    height = min(output_size, max(1, round((y_max - y_min) * scale)))
+
+    # ребра всех контуров: (x0, y0) -> (x1, y1) в пикселях с осью y вниз
+    edges = []
+    for contour in contours:
+        polygon = np.asarray(contour, dtype=np.float64)
+        start = np.column_stack(((polygon[:, 0] - x_min) * scale, (y_max - polygon[:, 1]) * scale))
+        edges.append(np.hstack((start, np.roll(start, -1, axis=0))))
+    edges = np.concatenate(edges)
+    edges = edges[edges[:, 1] != edges[:, 3]]
+
+    rows, columns = height * supersampling, width * supersampling
+    samples = (np.arange(rows) + 0.5) / supersampling
+    y0, y1 = edges[:, 1][None, :], edges[:, 3][None, :]
+    crosses = ((y0 <= samples[:, None]) & (samples[:, None] < y1)) | ((y1 <= samples[:, None]) & (samples[:, None] < y0))
+    row, edge = np.nonzero(crosses)
+    x0, ey0, x1, ey1 = edges[edge].T
+    x_cross = (x0 + (samples[row] - ey0) * (x1 - x0) / (ey1 - ey0)) * supersampling
+    direction = np.where(ey1 > ey0, 1, -1)
+
+    # пересечения каждой строки по порядку x: внутри глифа отрезки, где накопленное число оборотов не равно нулю.
+    # Сумма направлений по строке замкнутых контуров равна нулю, поэтому cumsum можно считать сквозь все строки
+    order = np.lexsort((x_cross, row))
+    row, x_cross, winding = row[order], x_cross[order], np.cumsum(direction[order])
+    inside = np.nonzero(winding[:-1] != 0)[0]
+    start = np.clip(np.floor(x_cross[inside] - 0.5).astype(int) + 1, 0, columns)
+    end = np.clip(np.floor(x_cross[inside + 1] - 0.5).astype(int) + 1, 0, columns)
+    spans = np.zeros((rows, columns + 1), dtype=np.int32)
+    np.add.at(spans, (row[inside], start), 1)
+    np.add.at(spans, (row[inside], end), -1)
+    mask = np.cumsum(spans[:, :-1], axis=1) > 0
+    coverage = mask.reshape(height, supersampling, width, supersampling).mean(axis=(1, 3))
+
+    top = (output_size - height) // 2
+    left = (output_size - width) // 2
+    image[top:top + height, left:left + width] = np.round(coverage * 255).astype(np.uint8)
+    return image
+
+
+class OutlineFont:
+    """Glyph outlines, glyph names and codes of an extracted font file: TrueType/OpenType, bare CFF or Type 1."""
+
+    def __init__(self, font_path: Path) -> None:
+        suffix = font_path.suffix.lower()
+        data = font_path.read_bytes()
+        self.codes: Dict[str, int] = {}
+        try:
+            if suffix in (".ttf", ".otf", ".ttc"):
+                self.__load_sfnt(data)
+            elif suffix == ".cff":
+                self.__load_cff(data)
+            elif suffix in (".pfa", ".pfb", ".t1"):
+                self.__load_type1(font_path)
+            else:
+                raise UnsupportedFont(suffix)
+        except font_errors as e:
+            raise UnsupportedFont(f"{font_path.name}: {e}")
+
+    def __load_sfnt(self, data: bytes) -> None:
+        font = TTFont(io.BytesIO(data), fontNumber=0, lazy=True)
+        self.glyph_set = font.getGlyphSet()
+        self.names = font.getGlyphOrder()
+        self.units_per_em = font["head"].unitsPerEm
+        cmap = font.getBestCmap()
+        if cmap is None and "cmap" in font and font["cmap"].tables:
+            # символьные шрифты PDF часто содержат только cmap (3, 0) или (1, 0)
+            cmap = font["cmap"].tables[0].cmap
+        for code, name in sorted((cmap or {}).items(), reverse=True):
+            self.codes[name] = code
+
+    def __load_cff(self, data: bytes) -> None:
+        cff = CFFFontSet()
+        cff.decompile(io.BytesIO(data), None)
+        top = cff[cff.fontNames[0]]
+        self.__load_charstrings(top.CharStrings, top.FontMatrix, top.Encoding, top.charset)
+
+    def __load_type1(self, font_path: Path) -> None:
+        font = T1Font(str(font_path))
+        font.parse()
+        charstrings = font.getGlyphSet()
+        self.__load_charstrings(charstrings, font.font["FontMatrix"], font.font.get("Encoding"), list(charstrings.keys()))
+
+    def __load_charstrings(self, charstrings: dict, font_matrix: list, encoding: object, names: List[str]) -> None:
+        self.glyph_set = charstrings
+        self.names = list(names)
+        self.units_per_em = round(1 / font_matrix[0]) if font_matrix and font_matrix[0] else 1000
+        if encoding == "StandardEncoding" or encoding is None:
+            encoding = StandardEncoding
+        if isinstance(encoding, (list, tuple)):
+            for code, name in enumerate(encoding):
+                if name != ".notdef":
+                    self.codes.setdefault(name, code)
+
+    def outline(self, name: str) -> List[List[Tuple[float, float]]]:
+        pen = FlatteningPen(self.glyph_set)
+        self.glyph_set[name].draw(pen)
+        pen._closePath()
+        return pen.contours
+
+
+def glyph_code(name: str, font: OutlineFont, index: int) -> int:
+    """
+    Code of the glyph as fontforge gives it: a single-char name is the char itself, then the font encoding,
+    then the unicode of a standard glyph name; unencoded glyphs get codes after the BMP by their index.
+    """
+    if len(name) == 1:
+        return ord(name)
+    if name in font.codes:
+        return font.codes[name]
+    if name.startswith("cid") and name[3:].isdigit():
+        return int(name[3:])
+    unicode = toUnicode(name)
+    if len(unicode) == 1:
+        return ord(unicode)
+    return 0x10000 + index
+
+
+def rasterize_font(font_path: Path, glyph_ids: Optional[Set[int]] = None) -> Tuple[List[str], np.ndarray, Dict[str, str], List[str], List[int]]:
+    """
+    In-process replacement of fontforge_wrapper generate_all_images + correctly_resize.
+    Returns (image keys, N x 28 x 28 uint8 images, whitespace glyphs, names, codes), where the keys are
+    the PNG file stems fontforge would write: the glyph code, or the name for a glyph without one.
+    With glyph_ids only the glyphs at these indexes of the glyph order are rendered.
+    Raises UnsupportedFont for formats fontTools can't read and for fonts with a broken glyph, fontforge is used for them.
+    """
+    font = OutlineFont(font_path)
+    keys, images, names, codes = [], [], [], []
+    white_spaces = {}
+    for index, name in enumerate(font.names):
+        if name == ".notdef" or "superior" in name or (glyph_ids is not None and index not in glyph_ids):
+            continue
+        code = glyph_code(name, font, index)
+        key = str(code)
+        try:
+            contours = font.outline(name)
+            image = rasterize(contours, font.units_per_em) if contours else None
+        except (*font_errors, ZeroDivisionError, OverflowError) as e:
+            # поврежденный глиф: весь шрифт отдается fontforge, чтобы не потерять буквы
+            raise UnsupportedFont(f"{font_path.name}, {name}: {e!r}")
+        if image is None:
+            # как и в fontforge_wrapper, пустые глифы кроме пробела не выводятся
+            if name == "space":
+                white_spaces[chr(code)] = " "
+            continue
+        if not image.any():
+            white_spaces[chr(code)] = " "
+            continue
+        keys.append(key)
+        images.append(image)
+        names.append(name)
+        codes.append(code)
+    images = np.stack(images) if images else np.zeros((0, 28, 28), dtype=np.uint8)
+    return keys, images, white_spaces, names, codes
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from pdf_broken_encoding_reader import config
+
+folder_prefix = "pdf-reader-"
+
+
+class ScratchQuotaExceeded(Exception):
+    pass
+
+
+class Scratch:
+    """Working folder of one document run, the files in it must stay within quota_bytes (0 - no limit)."""
+
+    def __init__(self, path: Path, quota_bytes: int) -> None:
+        self.path = path
+        self.quota_bytes = quota_bytes
+
+    def mkdir(self, name: str) -> Path:
+        path = self.path.joinpath(name)
+        path.mkdir()
+        return path
+
+    def used_bytes(self) -> int:
+        used = 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                try:
+                    used += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return used
+
+    def check_quota(self) -> None:
+        if not self.quota_bytes:
+            return
+        used = self.used_bytes()
+        if used > self.quota_bytes:
+            raise ScratchQuotaExceeded(f"scratch space quota exceeded: {used} > {self.quota_bytes} bytes")
+
+
+class ScratchSpace:
+    """
+    Hands out a scratch folder per document run under root: the system temp folder by default,
+    a tmpfs mount such as /dev/shm keeps the files in RAM. The folder is removed when the run ends,
+    on errors and cancellation too; purge_stale removes the folders of processes that were killed.
+    """
+
+    def __init__(self, root: Optional[Path] = None, quota_mb: Optional[float] = None) -> None:
+        root = root or config.scratch["root"]
+        self.root = Path(root) if root else Path(tempfile.gettempdir())
+        self.root.mkdir(parents=True, exist_ok=True)
+        quota_mb = config.scratch["quota_mb"] if quota_mb is None else quota_mb
+        self.quota_bytes = int(quota_mb * 1024 * 1024)
+
+    @contextmanager
+    def session(self) -> Iterator[Scratch]:
+        path = self.mkdtemp()
+        try:
+            yield Scratch(path, self.quota_bytes)
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def mkdtemp(self) -> Path:
+        """A new folder under root that the caller removes, purge_stale removes it if the process dies first."""
+        return Path(tempfile.mkdtemp(prefix=f"{folder_prefix}{os.getpid()}-", dir=self.root))
+
+    def temp_file(self, suffix: str = "") -> str:
+        """A new empty file under root with the pid in its name, like the session folders."""
+        fd, path = tempfile.mkstemp(prefix=f"{folder_prefix}{os.getpid()}-", suffix=suffix, dir=self.root)
+        os.close(fd)
+        return path
+
+    def purge_stale(self) -> int:
+        """Removes the folders and files left by dead processes, returns their number."""
+        removed = 0
+        for path in self.root.glob(f"{folder_prefix}*"):
+            pid = path.name[len(folder_prefix):].split("-")[0]
+            if not pid.isdigit() or process_alive(int(pid)):
+                continue
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+
+def process_alive(pid: int) -> bool:
+    # на windows сигнал 0 — это CTRL_C_EVENT, там процесс считается живым
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
@@ -0,0 +1,277 @@
+import argparse
+import gc
+import os
+import resource
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Callable, Dict, List, Optional
+
+import settings
+
+# запросы к этим эндпоинтам считаются обработанными документами для перезапуска воркера
+document_paths = ("/extract-text", "/extract-batch")
+# воркер, упавший быстрее этого времени, перезапускается с паузой, чтобы не крутить fork в цикле
+min_worker_lifetime = 1.0
+
+
+def log(message: str) -> None:
+    print(f"[prefork {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+def memory_mb() -> float:
+    """
+    Memory of the process not shared with the master: private pages of smaps_rollup.
+    Pages shared copy-on-write don't count until the worker writes to them. Falls back to RSS where smaps_rollup is missing.
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            private_kb = sum(int(line.split()[1]) for line in f if line.startswith(("Private_Clean:", "Private_Dirty:")))
+        return private_kb / 1024
+    except OSError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        # ru_maxrss в килобайтах на linux и в байтах на macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024 / 1024
+
+
+def exit_code(status: int) -> int:
+    # код завершения из статуса waitpid, для убитого сигналом процесса — минус номер сигнала
+    return -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+
+
+class RecyclePolicy:
+    """Tells a worker to retire after max_documents documents or once memory_mb exceeds max_memory_mb, 0 disables a limit."""
+
+    def __init__(self, max_documents: int = 0, max_memory_mb: float = 0) -> None:
+        self.max_documents = max_documents
+        self.max_memory_mb = max_memory_mb
+
+    def __call__(self, documents: int) -> bool:
+        if self.max_documents and documents >= self.max_documents:
+            return True
+        return bool(self.max_memory_mb) and memory_mb() > self.max_memory_mb
+
+
+class RecyclingApp:
+    """
+    ASGI wrapper that counts finished document requests and calls retire once the policy asks for it.
+    retire only stops accepting new connections: requests already in flight are served to the end.
+    """
+
+    def __init__(self, app: Callable, policy: RecyclePolicy, retire: Callable[[], None]) -> None:
+        self.app = app
+        self.policy = policy
+        self.retire = retire
+        self.documents = 0
+        self.retiring = False
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if scope["type"] == "http" and scope["path"] in document_paths and not self.retiring:
+                self.documents += 1
+                if self.policy(self.documents):
+                    self.retiring = True
+                    self.retire()
+
+
+def warm_up() -> None:
+    """
+    Loads in the master what the workers only read: the app with its modules, the CNN weights and the dictionaries.
+    The model isn't run here, torch thread pools started before fork are not usable in the children.
+    """
+    import main
+    from pdf_broken_encoding_reader.model import shared_model
+    from pdf_broken_encoding_reader import rasterizer  # noqa: F401 numpy и fontTools
+    from pdf_broken_encoding_reader.pdf_worker import pdf_reader  # noqa: F401 fitz и pdfminer
+    from pdf_broken_encoding_reader.pdf_worker.pdf_text_correcter import get_lexicon
+
+    shared_model()
+    get_lexicon()
+    main.scratch_space.purge_stale()
+    main.job_store.requeue_orphaned(settings.job_stale_after)
+    main.manage_jobs = False
+
+
+def serve_http(sock: socket.socket, retire_fd: int, policy: RecyclePolicy, log_level: str) -> None:
+    import uvicorn
+    import main
+
+    def retire() -> None:
+        # мастер сразу запускает замену, а этот воркер дообслуживает текущие запросы и завершается
+        os.write(retire_fd, b"r")
+        server.should_exit = True
+
+    config = uvicorn.Config(RecyclingApp(main.app, policy, retire), log_level=log_level)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def serve_jobs(policy: RecyclePolicy) -> None:
+    from jobs import run_worker
+
+    run_worker(settings.jobs_db_path, settings.jobs_dir, settings.job_poll_interval, settings.job_result_ttl, should_retire=policy)
+
+
+class Worker:
+    def __init__(self, kind: str, pid: int, retire_fd: Optional[int]) -> None:
+        self.kind = kind
+        self.pid = pid
+        self.retire_fd = retire_fd
+        self.started = time.monotonic()
+        self.retiring = False
+
+
+class Master:
+    """
+    Forks HTTP workers sharing the listening socket and job workers, and keeps their number constant:
+    a retiring HTTP worker is replaced as soon as it reports, a worker that exited otherwise is replaced when it is reaped.
+    """
+
+    def __init__(self, sock: socket.socket, http_workers: int, job_workers: int, policy: RecyclePolicy, log_level: str) -> None:
+        self.sock = sock
+        self.counts = {"http": http_workers, "jobs": job_workers}
+        self.policy = policy
+        self.log_level = log_level
+        self.workers: Dict[int, Worker] = {}
+        self.stopping = False
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.__stop)
+        signal.signal(signal.SIGINT, self.__stop)
+        for kind, count in self.counts.items():
+            for _ in range(count):
+                self.spawn(kind)
+        while not self.stopping:
+            fds = [worker.retire_fd for worker in self.workers.values() if worker.retire_fd is not None]
+            ready, _, _ = select.select(fds, [], [], 1.0)
+            for fd in ready:
+                self.__read_retire(fd)
+            self.reap()
+        self.shutdown()
+
+    def spawn(self, kind: str) -> None:
+        read_fd, write_fd = os.pipe() if kind == "http" else (None, None)
+        pid = os.fork()
+        if pid == 0:
+            self.__run_child(kind, read_fd, write_fd)
+        if write_fd is not None:
+            os.close(write_fd)
+        self.workers[pid] = Worker(kind, pid, read_fd)
+        log(f"started {kind} worker {pid}")
+
+    def __run_child(self, kind: str, read_fd: Optional[int], write_fd: Optional[int]) -> None:
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            for fd in [read_fd] + [worker.retire_fd for worker in self.workers.values()]:
+                if fd is not None:
+                    os.close(fd)
+            gc.enable()
+            if kind == "http":
+                serve_http(self.sock, write_fd, self.policy, self.log_level)
+            else:
+                serve_jobs(self.policy)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+
+    def __read_retire(self, fd: int) -> None:
+        worker = next((worker for worker in self.workers.values() if worker.retire_fd == fd), None)
+        # пустое чтение — воркер уже завершился, его подберет reap
+        if worker is None or not os.read(fd, 1) or worker.retiring:
+            return
+        worker.retiring = True
+        log(f"{worker.kind} worker {worker.pid} retires")
+        if not self.stopping:
+            self.spawn(worker.kind)
+
+    def reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            if worker.retire_fd is not None:
+                os.close(worker.retire_fd)
+            log(f"{worker.kind} worker {pid} exited with code {exit_code(status)}")
+            if worker.retiring or self.stopping:
+                continue
+            if time.monotonic() - worker.started < min_worker_lifetime:
+                time.sleep(min_worker_lifetime)
+            self.spawn(worker.kind)
+
+    def shutdown(self) -> None:
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        while self.workers:
+            try:
+                pid, _ = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            worker = self.workers.pop(pid, None)
+            if worker is not None and worker.retire_fd is not None:
+                os.close(worker.retire_fd)
+
+    def __stop(self, signum: int, frame: object) -> None:
+        self.stopping = True
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pre-fork server: the model is loaded once and shared by the workers copy-on-write")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.prefork_workers, help="HTTP workers")
+    parser.add_argument("--job-workers", type=int, default=settings.job_workers, help="background job workers")
+    parser.add_argument("--max-documents", type=int, default=settings.worker_max_documents,
+                        help="documents after which a worker is replaced, 0 - never")
+    parser.add_argument("--max-memory-mb", type=int, default=settings.worker_max_memory_mb,
+                        help="private memory of a worker after which it is replaced, 0 - no limit")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    # сборщик мусора выключен до fork и объекты мастера заморожены: обход gc не трогает разделяемые страницы воркеров
+    gc.disable()
+    sock = bind_socket(args.host, args.port)
+    start = time.perf_counter()
+    warm_up()
+    gc.freeze()
+    log(f"warmed up in {time.perf_counter() - start:.1f}s, listening on {args.host}:{args.port}")
+
+    policy = RecyclePolicy(args.max_documents, args.max_memory_mb)
+    Master(sock, args.workers, args.job_workers, policy, args.log_level).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+profile_filename = "profile.prof"
+summary_filename = "profile.txt"
+info_filename = "profile.json"
+
+
+@contextmanager
+def profile_run(output_dir: Path, input_hash: Optional[str]) -> Iterator[None]:
+    """
+    Runs the block under cProfile and tracemalloc and saves into output_dir:
+    the raw pstats dump, a text summary sorted by cumulative time and the peak traced memory with the input hash.
+    """
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        wall_time = time.perf_counter() - start
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profiler.dump_stats(str(output_dir.joinpath(profile_filename)))
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(50)
+        output_dir.joinpath(summary_filename).write_text(summary.getvalue(), encoding="utf-8")
+        with open(output_dir.joinpath(info_filename), "w", encoding="utf-8") as f:
+            json.dump({"input_hash": input_hash, "wall_time": wall_time, "peak_memory_bytes": peak_memory}, f)
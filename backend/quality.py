@@ -0,0 +1,58 @@
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+import settings
+
+# Уровни качества от полного к самому быстрому. cost_factor — доля времени полной обработки, glyph_engine=None —
+# растеризатор из настроек, max_glyphs_per_font=0 — распознаются все глифы
+quality_levels = dict(
+    full=dict(corrected_pdf=True, glyph_engine=None, max_glyphs_per_font=0, cost_factor=1.0),
+    no_pdf=dict(corrected_pdf=False, glyph_engine=None, max_glyphs_per_font=0, cost_factor=0.9),
+    fast=dict(corrected_pdf=False, glyph_engine="numpy", max_glyphs_per_font=0, cost_factor=0.5),
+    minimal=dict(corrected_pdf=False, glyph_engine="numpy", max_glyphs_per_font=64, cost_factor=0.3)
+)
+level_names: List[str] = list(quality_levels)
+
+
+class Load:
+    """Number and expected seconds of the extractions running or waiting for their turn in this process."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.cost = 0.0
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def track(self, cost: float) -> Iterator[None]:
+        with self.__lock:
+            self.count += 1
+            self.cost += cost
+        try:
+            yield
+        finally:
+            with self.__lock:
+                self.count -= 1
+                self.cost -= cost
+
+
+def choose_level(cost: float, load: Load, budget: Optional[float]) -> str:
+    """
+    The best level at which the work ahead plus the document itself fits into the budget in seconds, the fastest one if none does.
+    Without a budget the level drops by one for every settings.degrade_queue_depth extractions ahead, 0 keeps the full level.
+    """
+    if budget is None:
+        if not settings.degrade_queue_depth:
+            return level_names[0]
+        return level_names[min(load.count // settings.degrade_queue_depth, len(level_names) - 1)]
+    for name in level_names:
+        if load.cost + cost * quality_levels[name]["cost_factor"] <= budget:
+            return name
+    return level_names[-1]
+
+
+def apply_level(options: dict, level: str) -> dict:
+    """Request options at the level. The full level leaves them as they are, so results stored before the levels still match."""
+    if level == level_names[0]:
+        return options
+    return dict(options, corrected_pdf=options["corrected_pdf"] and quality_levels[level]["corrected_pdf"], quality=level)
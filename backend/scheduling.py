@@ -0,0 +1,45 @@
+from pathlib import Path
+from typing import List, Tuple
+
+import settings
+
+# глифов в шрифте, который fitz не прочитал: примерно полная однобайтовая кодировка
+unreadable_font_glyphs = 256
+
+
+def estimate_document(pdf_path: Path) -> Tuple[int, int]:
+    """
+    Returns the page count and the number of glyphs in the embedded fonts.
+    Only the page resources and the font programs are read, nothing is rendered or laid out.
+    """
+    import fitz
+
+    glyphs = 0
+    with fitz.open(pdf_path) as doc:
+        xrefs = {font[0] for page_num in range(doc.page_count) for font in doc.get_page_fonts(page_num)}
+        for xref in xrefs:
+            _, extension, _, content = doc.extract_font(xref)
+            # невстроенные шрифты не распознаются
+            if extension == "n/a" or not content:
+                continue
+            try:
+                glyphs += fitz.Font(fontbuffer=content).glyph_count
+            except Exception:
+                glyphs += unreadable_font_glyphs
+        return doc.page_count, glyphs
+
+
+def job_cost(pages: int, glyphs: int) -> float:
+    """Expected processing time in seconds: glyph export and recognition grow with the glyphs, the layout stage with the pages."""
+    return pages * settings.job_cost_per_page + glyphs * settings.job_cost_per_glyph
+
+
+def plan_chunks(pages: int, glyphs: int, chunk_pages: int) -> List[Tuple[int, int, float]]:
+    """
+    Splits a document into (start page, end page, cost) chunks of chunk_pages pages, a single chunk if it is short enough.
+    Every chunk is charged for the fonts: any of them may be the first to recognize them.
+    """
+    if chunk_pages <= 0 or pages <= chunk_pages:
+        return [(0, pages, job_cost(pages, glyphs))]
+    return [(start, min(start + chunk_pages, pages), job_cost(min(chunk_pages, pages - start), glyphs))
+            for start in range(0, pages, chunk_pages)]
@@ -0,0 +1,69 @@
+import os
+from pathlib import Path
+
+base_dir = Path(__file__).parent
+
+# Хранилище фоновых задач: sqlite-таблица и папки с входными файлами и результатами
+jobs_dir = Path(os.environ.get("JOBS_DIR", base_dir.joinpath("data", "jobs")))
+jobs_db_path = jobs_dir.joinpath("jobs.sqlite3")
+job_workers = int(os.environ.get("JOB_WORKERS", "1"))
+job_poll_interval = float(os.environ.get("JOB_POLL_INTERVAL", "0.5"))
+job_result_ttl = int(os.environ.get("JOB_RESULT_TTL", str(24 * 60 * 60)))
+# Планировщик очереди: стоимость задачи в секундах оценивается по числу страниц и глифов встроенных шрифтов.
+# Раньше берутся задачи клиентов, меньше загрузивших воркеры за последние job_fair_window секунд, среди них — самые дешевые;
+# каждая секунда ожидания снижает стоимость на job_cost_aging, чтобы большие задачи не голодали.
+# Документы длиннее job_chunk_pages страниц обрабатываются частями вперемешку с другими задачами
+job_cost_per_page = float(os.environ.get("JOB_COST_PER_PAGE", "0.05"))
+job_cost_per_glyph = float(os.environ.get("JOB_COST_PER_GLYPH", "0.002"))
+job_cost_aging = float(os.environ.get("JOB_COST_AGING", "0.1"))
+job_fair_window = float(os.environ.get("JOB_FAIR_WINDOW", "300"))
+job_chunk_pages = int(os.environ.get("JOB_CHUNK_PAGES", "50"))
+# Процессы, выполняющие задачи, раз в job_heartbeat_interval секунд отмечают их живыми. Задача в статусе running
+# без отметки дольше job_stale_after секунд считается брошенной (процесс упал или перезапущен) и возвращается в очередь
+job_heartbeat_interval = float(os.environ.get("JOB_HEARTBEAT_INTERVAL", "10"))
+job_stale_after = float(os.environ.get("JOB_STALE_AFTER", "60"))
+
+# Срок запроса /extract-text в секундах, если он не передан параметром timeout; 0 — без ограничения.
+# По истечении срока или при разрыве соединения обработка останавливается
+request_timeout = float(os.environ.get("REQUEST_TIMEOUT", "0"))
+# Уровень качества /extract-text при quality=auto: по сроку запроса, а без срока — на уровень ниже
+# за каждые degrade_queue_depth обработок впереди в процессе; 0 — без срока всегда полное качество
+degrade_queue_depth = int(os.environ.get("DEGRADE_QUEUE_DEPTH", "4"))
+
+# Рабочие папки обработки документов (шрифты, глифы, загрузки): по умолчанию системная временная папка,
+# /dev/shm держит их в памяти. Папка документа удаляется после обработки, папки убитых процессов — при старте;
+# обработка документа, которому нужно больше scratch_quota_mb, прерывается (0 — без ограничения)
+scratch_dir = os.environ.get("SCRATCH_DIR") or None
+scratch_quota_mb = float(os.environ.get("SCRATCH_QUOTA_MB", "1024"))
+
+# Ограничения на загружаемые файлы
+upload_chunk_size = 1024 * 1024
+max_upload_bytes = int(os.environ.get("MAX_UPLOAD_MB", "100")) * 1024 * 1024
+max_pages = int(os.environ.get("MAX_PAGES", "1000"))
+# /extract-batch: суммарный размер загрузки (и распакованных архивов) и число PDF в одном запросе
+max_batch_bytes = int(os.environ.get("MAX_BATCH_MB", "500")) * 1024 * 1024
+max_batch_files = int(os.environ.get("MAX_BATCH_FILES", "500"))
+
+# Замеры этапов PDFReader: поле timings в ответах и эндпоинт /metrics
+collect_metrics = os.environ.get("COLLECT_METRICS", "1") == "1"
+
+# Растеризатор глифов: fontforge или numpy (без запуска внешнего процесса)
+glyph_engine = os.environ.get("GLYPH_ENGINE", "fontforge")
+# Восстановленные страницы сохраняются в jobs_dir/page_store по отпечатку страницы и ее шрифтов:
+# в новой редакции документа заново обрабатываются только измененные страницы
+store_pages = os.environ.get("STORE_PAGES", "1") == "1"
+# Сколько мегабайт на диске занимают кэш шрифтов и сохраненные страницы: лишние записи удаляются, начиная с давно не использованных
+font_cache_mb = float(os.environ.get("FONT_CACHE_MB", "1024"))
+page_store_mb = float(os.environ.get("PAGE_STORE_MB", "4096"))
+
+# Профилирование запросов (cProfile + tracemalloc): для всех запросов или по заголовку X-Profile: 1 вместе с X-Admin-Token
+profile_requests = os.environ.get("PROFILE_REQUESTS", "0") == "1"
+# Токен для /admin/*, без него админские эндпоинты отключены
+admin_token = os.environ.get("ADMIN_TOKEN", "")
+
+# Prefork-сервер (python prefork.py): модель загружается в мастер-процессе до fork и разделяется воркерами.
+# Воркер перезапускается после worker_max_documents документов или когда его собственная память превысит
+# worker_max_memory_mb, 0 отключает ограничение
+prefork_workers = int(os.environ.get("PREFORK_WORKERS", "2"))
+worker_max_documents = int(os.environ.get("WORKER_MAX_DOCUMENTS", "0"))
+worker_max_memory_mb = int(os.environ.get("WORKER_MAX_MEMORY_MB", "0"))
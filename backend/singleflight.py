@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class Flight:
+    def __init__(self, task: asyncio.Future, abandon: Optional[Callable[[], None]]) -> None:
+        self.task = task
+        self.abandon = abandon
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key within the process: the first call starts the work,
+    calls arriving while it runs await the same task and get its result or its exception.
+    The work runs as a separate task, so a caller that goes away doesn't cancel it for the others;
+    once all callers are gone the abandon hook of the first caller is called to stop it.
+    """
+
+    def __init__(self) -> None:
+        self.__flights: Dict[Hashable, Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self.__flights)
+
+    async def do(self, key: Hashable, start: Callable[[], Awaitable[Any]],
+                 abandon: Optional[Callable[[], None]] = None) -> Tuple[Any, bool]:
+        """
+        Returns (result, shared), shared is True if the result was computed for an earlier caller.
+        start is called only by the first caller, before the first await, and returns the awaitable of the work.
+        """
+        flight = self.__flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = Flight(asyncio.ensure_future(start()), abandon)
+            self.__flights[key] = flight
+            flight.task.add_done_callback(lambda done: self.__forget(key, flight))
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # брошенная работа останавливается, а следующий такой же запрос начинает ее заново
+                self.__forget(key, flight)
+                if flight.abandon is not None:
+                    flight.abandon()
+
+    def __forget(self, key: Hashable, flight: Flight) -> None:
+        if self.__flights.get(key) is flight:
+            del self.__flights[key]
+        # исключение забирается здесь, чтобы asyncio не ругался, если все ожидавшие уже ушли
+        if flight.task.done() and not flight.task.cancelled():
+            flight.task.exception()
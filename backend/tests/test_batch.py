@@ -0,0 +1,26 @@
+import pytest
+
+from benchmarks.corpus import default_fonts, generate_document
+from pdf_broken_encoding_reader import batch
+from pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader
+
+pytestmark = pytest.mark.skipif(not default_fonts[0].exists(), reason="DejaVu fonts are not installed")
+
+
+def test_dotted_names_get_their_own_outputs(tmp_path, monkeypatch, letter_model):
+    monkeypatch.setattr(batch, "reader", PDFReader(glyph_engine="numpy", model=letter_model))
+    input_dir, output_dir = tmp_path.joinpath("input"), tmp_path.joinpath("output")
+    input_dir.mkdir()
+    for seed, name in enumerate(["report.v1.pdf", "report.v2.pdf"]):
+        generate_document(input_dir.joinpath(name), pages=seed + 1, fonts_count=1, alphabet="eng", font_files=default_fonts[:1], seed=seed)
+
+    for pdf_path, relative in batch.iter_inputs([input_dir]):
+        output_base = output_dir.joinpath(relative).with_suffix("")
+        batch.process_file(str(pdf_path), str(output_base), list(batch.output_formats), skip_if_correct=False)
+
+    assert sorted(path.name for path in output_dir.iterdir()) == [
+        "report.v1.json", "report.v1.pdf", "report.v1.txt", "report.v2.json", "report.v2.pdf", "report.v2.txt"
+    ]
+    pages = [page.get_text() for page in PDFReader(glyph_engine="numpy", model=letter_model).iter_pages(input_dir.joinpath("report.v2.pdf"))]
+    # текст склеивается так же, как в ответе API
+    assert output_dir.joinpath("report.v2.txt").read_text(encoding="utf-8") == "\n".join(pages)
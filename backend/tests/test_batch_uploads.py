@@ -0,0 +1,35 @@
+import asyncio
+import io
+import zipfile
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+import main
+
+member_size = 600 * 1024
+
+
+def archive_upload(name: str) -> UploadFile:
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("document.pdf", b"%PDF-1.4\n" + b"0" * member_size)
+    data.seek(0)
+    return UploadFile(file=data, filename=name)
+
+
+@pytest.fixture
+def batch_limit(monkeypatch):
+    # каждый архив сжат до нескольких килобайт, а распакованный помещается в лимит только один
+    monkeypatch.setattr(main.settings, "max_batch_bytes", member_size + 100 * 1024)
+
+
+def test_one_archive_fits_the_batch_limit(batch_limit, tmp_path):
+    inputs = asyncio.run(main.save_batch_uploads([archive_upload("a.zip")], tmp_path))
+    assert [item["name"] for item in inputs] == ["document.pdf"]
+
+
+def test_archives_share_the_batch_limit(batch_limit, tmp_path):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.save_batch_uploads([archive_upload("a.zip"), archive_upload("b.zip")], tmp_path))
+    assert error.value.status_code == 413
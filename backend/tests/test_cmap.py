@@ -0,0 +1,18 @@
+from pdf_broken_encoding_reader.pdf_worker.pdf_reader import cmap_sections
+
+
+def entries(sections: str, operator: str) -> list:
+    body = sections.split(f"begin{operator}\n")[1].split(f"\nend{operator}")[0] if f"begin{operator}" in sections else ""
+    return body.splitlines()
+
+
+def test_consecutive_codes_become_ranges():
+    sections = cmap_sections([(0x41, 0x0410), (0x42, 0x0411), (0x43, 0x0412), (0x50, 0x20)])
+    assert entries(sections, "bfrange") == ["<41> <43> <0410>"]
+    assert entries(sections, "bfchar") == ["<50> <0020>"]
+
+
+def test_range_does_not_carry_past_the_last_destination_byte():
+    sections = cmap_sections([(0x10, 0x04FE), (0x11, 0x04FF), (0x12, 0x0500), (0x13, 0x0501)])
+    assert entries(sections, "bfrange") == ["<10> <11> <04FE>", "<12> <13> <0500>"]
+
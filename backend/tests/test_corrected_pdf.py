@@ -0,0 +1,41 @@
+import fitz
+import pytest
+
+from benchmarks.corpus import default_fonts, generate_document
+from pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader
+
+pytestmark = pytest.mark.skipif(not default_fonts[0].exists(), reason="DejaVu fonts are not installed")
+
+
+def test_corrected_pdf_is_an_incremental_update(tmp_path, letter_model):
+    pdf_path = tmp_path.joinpath("document.pdf")
+    generate_document(pdf_path, pages=2, fonts_count=1, alphabet="eng", font_files=default_fonts[:1], seed=2)
+    reader = PDFReader(glyph_engine="numpy", model=letter_model)
+    list(reader.iter_pages(pdf_path))
+    output_path = reader.write_corrected_pdf(pdf_path, output_path=tmp_path.joinpath("corrected.pdf"))
+
+    original = pdf_path.read_bytes()
+    corrected = tmp_path.joinpath("corrected.pdf").read_bytes()
+    # исходный файл, в том числе маленький, не переписывается, а дописывается
+    assert corrected.startswith(original) and len(corrected) > len(original)
+    with fitz.open(output_path) as doc:
+        fonts = doc.get_page_fonts(0)
+        assert all(doc.xref_get_key(font[0], "ToUnicode")[0] == "xref" for font in fonts)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_text_layer_has_the_restored_text(tmp_path, letter_model, workers):
+    pdf_path = tmp_path.joinpath("document.pdf")
+    generate_document(pdf_path, pages=3, fonts_count=1, alphabet="eng", font_files=default_fonts[:1], seed=3)
+    reader = PDFReader(glyph_engine="numpy", model=letter_model)
+    pages = list(reader.iter_pages(pdf_path))
+    output_path = tmp_path.joinpath("text_layer.pdf")
+    reader.save_corrected_pdf(pdf_path, output_path, pages, workers=workers)
+
+    with fitz.open(output_path) as doc:
+        assert doc.page_count == len(pages)
+        for page, compact_page in zip(doc, pages):
+            # все символы восстановлены как «a», поэтому в слое только они и пробелы
+            words = page.get_text().split()
+            assert words and set("".join(words)) == {"a"}
+            assert len("".join(words)) == len(compact_page.chars.replace(" ", ""))
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.corpus import default_fonts, generate_document
+from pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader
+
+pytest.importorskip("dedoc")
+from pdf_broken_encoding_reader.pdf_broken_encoding_reader import PdfBrokenEncodingReader  # noqa: E402
+
+
+class PageRecorder:
+    def __init__(self) -> None:
+        self.page_numbers = []
+
+    def handle_page(self, page, page_number, path, parameters, layout):
+        self.page_numbers.append(page_number)
+        return SimpleNamespace(bboxes=[])
+
+    def extract_metadata_and_set_annotations(self, page_with_lines, call_classifier):
+        return []
+
+
+@pytest.mark.skipif(not default_fonts[0].exists(), reason="DejaVu fonts are not installed")
+def test_page_slice_keeps_document_page_numbers(tmp_path, letter_model):
+    pdf_path = tmp_path.joinpath("doc.pdf")
+    generate_document(pdf_path, pages=5, fonts_count=1, alphabet="eng", font_files=default_fonts[:1], seed=0)
+    # конструктор требует полный dedoc, для чтения нужны только эти атрибуты
+    reader = PdfBrokenEncodingReader.__new__(PdfBrokenEncodingReader)
+    recorder = PageRecorder()
+    reader.extractor_layer = recorder
+    reader.metadata_extractor = recorder
+    reader.reader = PDFReader(glyph_engine="numpy", model=letter_model)
+
+    reader.read(str(pdf_path), parameters={"pages": "3:4"})
+    assert recorder.page_numbers == [2, 3]
@@ -0,0 +1,47 @@
+import time
+from pathlib import Path
+
+from jobs import JobStatus, JobStore
+
+
+def make_store(tmp_path: Path) -> JobStore:
+    return JobStore(tmp_path.joinpath("jobs.sqlite3"), tmp_path.joinpath("jobs"))
+
+
+def create_running(store: JobStore, tmp_path: Path, name: str) -> str:
+    upload = tmp_path.joinpath(name)
+    upload.write_bytes(b"%PDF-1.4")
+    job_id = store.create(name, upload, input_hash=name)
+    claimed = store.claim(worker_pid=12345)
+    assert claimed["id"] == job_id
+    return job_id
+
+
+def test_requeue_orphaned_keeps_jobs_of_live_workers(tmp_path):
+    store = make_store(tmp_path)
+    job_id = create_running(store, tmp_path, "a.pdf")
+    store.heartbeat(12345)
+
+    assert store.requeue_orphaned(stale_after=60) == []
+    assert store.get(job_id)["status"] == JobStatus.running.value
+
+
+def test_requeue_orphaned_requeues_stale_jobs(tmp_path):
+    store = make_store(tmp_path)
+    job_id = create_running(store, tmp_path, "a.pdf")
+    time.sleep(0.05)
+
+    assert store.requeue_orphaned(stale_after=0.01) == [job_id]
+    job = store.get(job_id)
+    assert job["status"] == JobStatus.queued.value
+    assert job["worker_pid"] is None
+
+
+def test_requeue_orphaned_cancels_stale_jobs_with_cancel_requested(tmp_path):
+    store = make_store(tmp_path)
+    job_id = create_running(store, tmp_path, "a.pdf")
+    store.cancel(job_id)
+    time.sleep(0.05)
+
+    store.requeue_orphaned(stale_after=0.01)
+    assert store.get(job_id)["status"] == JobStatus.cancelled.value
@@ -0,0 +1,80 @@
+import json
+import os
+from array import array
+
+from pdf_broken_encoding_reader.font_cache import DiskFontCache
+from pdf_broken_encoding_reader.lru_store import JsonFolder
+from pdf_broken_encoding_reader.page_store import DiskPageStore
+from pdf_broken_encoding_reader.pdf_worker.compact_page import CompactPage, column_names
+
+
+def make_page() -> CompactPage:
+    page = CompactPage(3, 595.5, 842.25)
+    page.text = "Привет, world\n"
+    page.chars = "Привет"
+    page.char_offsets = array("I", range(7))
+    for name in ("x0", "y0", "x1", "y1", "size"):
+        setattr(page, name, array("f", [0.5 * index for index in range(6)]))
+    page.font = array("H", [0, 0, 0, 1, 1, 1])
+    page.fonts = ("F1", "F2")
+    return page
+
+
+def age_files(folder: JsonFolder, keys) -> None:
+    # записи с разницей во времени изменения, по которому выбираются давно не использованные
+    for age, key in enumerate(reversed(keys)):
+        os.utime(folder.path(key), (1000000 - age, 1000000 - age))
+
+
+def test_page_survives_the_disk(tmp_path):
+    DiskPageStore(tmp_path).put("a" * 64, {"page": make_page(), "fonts": {"F1": [32, "space", "a"]}, "glyphs": {"F1": {"a": "б"}}})
+    record = DiskPageStore(tmp_path).get("a" * 64)
+    page = record["page"]
+    assert (page.page_num, page.width, page.height, page.text, page.chars, page.fonts) == (3, 595.5, 842.25, "Привет, world\n", "Привет", ("F1", "F2"))
+    assert all(getattr(page, name) == getattr(make_page(), name) for name in column_names)
+    assert record["fonts"] == {"F1": [32, "space", "a"]} and record["glyphs"] == {"F1": {"a": "б"}}
+
+
+def test_broken_page_file_is_a_miss(tmp_path):
+    store = DiskPageStore(tmp_path)
+    store.files.path("b" * 64).write_text(json.dumps({"page": {"page_num": 0}, "fonts": {}, "glyphs": {}}))
+    assert store.get("b" * 64) is None
+    assert store.misses == 1
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    folder = JsonFolder(tmp_path, max_files=10, max_mb=1)
+    keys = [f"{index:02}" for index in range(10)]
+    for key in keys:
+        folder.store(key, {"key": key})
+    age_files(folder, keys)
+    # чтение делает запись свежей
+    assert folder.load("00") == {"key": "00"}
+    folder.store("10", {"key": "10"})
+    left = sorted(path.stem for path in tmp_path.glob("*.json"))
+    assert len(left) == 9 and "00" in left and "10" in left and "01" not in left
+
+
+def test_folder_size_is_limited(tmp_path):
+    folder = JsonFolder(tmp_path, max_files=1000, max_mb=0.01)
+    for index in range(20):
+        folder.store(f"{index:02}", {"data": "x" * 2000})
+    assert sum(path.stat().st_size for path in tmp_path.glob("*.json")) <= 0.01 * 1024 * 1024
+    assert tmp_path.joinpath("19.json").exists()
+
+
+def test_font_cache_is_limited(tmp_path):
+    cache = DiskFontCache(tmp_path, max_files=5)
+    for index in range(12):
+        cache.put(f"{index:064}", {"name2code": {}, "white_spaces": {}, "match": {}})
+    assert len(list(tmp_path.glob("*.json"))) <= 5
+    # запись, вытесненная с диска, остается в памяти процесса
+    assert cache.get(f"{0:064}") is not None
+
+
+def test_limits_are_applied_on_start(tmp_path):
+    folder = JsonFolder(tmp_path, max_files=100, max_mb=1)
+    for index in range(20):
+        folder.store(f"{index:02}", {})
+    assert JsonFolder(tmp_path, max_files=10, max_mb=1).evict() == 0
+    assert len(list(tmp_path.glob("*.json"))) == 9
@@ -0,0 +1,36 @@
+import struct
+from pathlib import Path
+
+import pytest
+
+from benchmarks.corpus import default_fonts
+from pdf_broken_encoding_reader.rasterizer import UnsupportedFont, rasterize_font
+
+font_file = next((path for path in default_fonts if path.suffix == ".ttf" and path.exists()), None)
+
+
+def table_range(data: bytes, tag: bytes) -> tuple:
+    tables_count = struct.unpack(">H", data[4:6])[0]
+    for index in range(tables_count):
+        name, _, offset, length = struct.unpack(">4sIII", data[12 + 16 * index:28 + 16 * index])
+        if name == tag:
+            return offset, length
+    raise KeyError(tag)
+
+
+@pytest.mark.skipif(font_file is None, reason="no TrueType font to break")
+def test_broken_glyph_falls_back_to_fontforge(tmp_path):
+    # заголовок и таблицы шрифта читаются, но glyf после первой четверти испорчен
+    data = bytearray(font_file.read_bytes())
+    offset, length = table_range(data, b"glyf")
+    data[offset + length // 4:offset + length] = b"\xff" * (length - length // 4)
+    broken = tmp_path.joinpath("broken.ttf")
+    broken.write_bytes(bytes(data))
+    with pytest.raises(UnsupportedFont):
+        rasterize_font(broken)
+
+
+@pytest.mark.skipif(font_file is None, reason="no TrueType font")
+def test_font_is_rasterized(tmp_path):
+    keys, images, _, names, _ = rasterize_font(Path(font_file), glyph_ids=set(range(100)))
+    assert keys and images.shape == (len(keys), 28, 28) and len(names) == len(keys)
@@ -0,0 +1,40 @@
+import pytest
+
+from benchmarks.corpus import default_fonts, generate_document
+from conftest import LetterModel
+from pdf_broken_encoding_reader.font_cache import FontCache, font_key
+from pdf_broken_encoding_reader.metrics import Metrics
+from pdf_broken_encoding_reader.page_store import PageStore
+from pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader
+
+pytestmark = pytest.mark.skipif(not default_fonts[0].exists(), reason="DejaVu fonts are not installed")
+
+
+class RetrainedModel(LetterModel):
+    version = "letter-a-retrained"
+
+
+def run(pdf_path, model, font_cache: FontCache, page_store: PageStore) -> dict:
+    reader = PDFReader(glyph_engine="numpy", model=model, font_cache=font_cache, page_store=page_store)
+    reader.metrics = Metrics()
+    list(reader.iter_pages(pdf_path))
+    return reader.metrics.counters
+
+
+def test_new_weights_do_not_reuse_stored_results(tmp_path):
+    pdf_path = tmp_path.joinpath("document.pdf")
+    generate_document(pdf_path, pages=2, fonts_count=1, alphabet="eng", font_files=default_fonts[:1], seed=4)
+    font_cache, page_store = FontCache(), PageStore()
+    run(pdf_path, LetterModel(), font_cache, page_store)
+
+    counters = run(pdf_path, RetrainedModel(), font_cache, page_store)
+    assert counters.get("stored_pages", 0) == 0 and counters.get("font_cache_hits", 0) == 0
+    counters = run(pdf_path, LetterModel(), font_cache, page_store)
+    assert counters["stored_pages"] == 2
+
+
+def test_font_key_depends_on_the_engine_and_the_model(tmp_path):
+    font_path = default_fonts[0]
+    keys = {font_key(font_path, engine, version) for engine in ("fontforge", "numpy") for version in ("a", "b")}
+    assert len(keys) == 4
+    assert font_key(font_path, "numpy", "a") == font_key(font_path, "numpy", "a")
@@ -0,0 +1,61 @@
+import random
+import string
+from pathlib import Path
+
+import fitz
+import pytest
+
+from benchmarks.corpus import default_fonts, generate_document
+from pdf_broken_encoding_reader.metrics import Metrics
+from pdf_broken_encoding_reader.pdf_worker import pdf_text_correcter
+from pdf_broken_encoding_reader.pdf_worker.pdf_reader import PDFReader
+
+pytestmark = pytest.mark.skipif(not default_fonts[0].exists(), reason="DejaVu fonts are not installed")
+
+
+@pytest.fixture
+def no_lexicon(monkeypatch):
+    monkeypatch.setattr(pdf_text_correcter, "get_lexicon", lambda: None)
+    pdf_text_correcter.lexicon_missing.cache_clear()
+    yield
+    pdf_text_correcter.lexicon_missing.cache_clear()
+
+
+@pytest.fixture
+def wrong_names_pdf(tmp_path) -> Path:
+    """
+    A font without ToUnicode whose Differences use standard glyph names, but the wrong ones:
+    the text layer decodes to scrambled letters that only a lexicon tells from words.
+    """
+    generated_path = tmp_path.joinpath("generated.pdf")
+    generate_document(generated_path, pages=2, fonts_count=1, alphabet="eng", font_files=default_fonts[:1], seed=0)
+    rng = random.Random(0)
+    pdf_path = tmp_path.joinpath("wrong_names.pdf")
+    with fitz.open(generated_path) as doc:
+        for xref in range(1, doc.xref_length()):
+            if doc.xref_get_key(xref, "Subtype")[1] != "/TrueType":
+                continue
+            names = [rng.choice(string.ascii_lowercase) for _ in range(int(doc.xref_get_key(xref, "LastChar")[1]) - 32)]
+            doc.xref_set_key(xref, "Encoding", f"<< /Type /Encoding /Differences [32 /space /{' /'.join(names)}] >>")
+        doc.save(pdf_path)
+    return pdf_path
+
+
+def test_fonts_are_not_trusted_without_lexicon(no_lexicon, wrong_names_pdf, letter_model):
+    reader = PDFReader(glyph_engine="numpy", model=letter_model)
+    reader.metrics = Metrics()
+    list(reader.iter_pages(wrong_names_pdf))
+    assert reader.metrics.counters.get("trusted_fonts", 0) == 0
+    assert reader.metrics.counters["triage_no_lexicon"] == 1
+    assert reader.metrics.counters["recognized_glyphs"] > 0
+
+
+@pytest.mark.parametrize("alphabet", ["eng", "eng_no_reg_diff", "rus"])
+def test_repair_is_not_skipped_without_lexicon(no_lexicon, tmp_path, alphabet, letter_model):
+    pdf_path = tmp_path.joinpath("scrambled.pdf")
+    generate_document(pdf_path, pages=2, fonts_count=1, alphabet=alphabet, font_files=default_fonts[:1], seed=1)
+    reader = PDFReader(glyph_engine="numpy", model=letter_model)
+    reader.metrics = Metrics()
+    list(reader.iter_pages(pdf_path, skip_if_correct=True))
+    assert not reader.repair_skipped
+    assert reader.metrics.counters["fast_path_no_lexicon"] == 1
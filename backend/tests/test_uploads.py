@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+import fitz
+import httpx
+
+import main
+
+
+def pdf_bytes() -> bytes:
+    doc = fitz.open()
+    doc.new_page()
+    return doc.tobytes()
+
+
+def test_duplicates_coalesce_and_keep_the_deadline_while_extraction_runs():
+    async def upload_twice_while_extracting() -> list:
+        transport = httpx.ASGITransport(app=main.app)
+        data = pdf_bytes()
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            def upload() -> asyncio.Future:
+                files = {"file": ("document.pdf", data, "application/pdf")}
+                return asyncio.ensure_future(client.post("/extract-text", params={"timeout": 1}, files=files))
+
+            # extraction_lock занят обработкой другого документа
+            with main.extraction_lock:
+                started = time.monotonic()
+                requests = [upload(), upload()]
+                await asyncio.sleep(0.5)
+                # повтор присоединился к первому запросу, не дожидаясь проверки PDF
+                assert len(main.in_flight) == 1
+                responses = await asyncio.wait_for(asyncio.gather(*requests), timeout=5)
+                # срок запроса соблюдается и во время ожидания проверки
+                assert time.monotonic() - started < 3
+            return responses
+
+    responses = asyncio.run(upload_twice_while_extracting())
+    assert [response.status_code for response in responses] == [504, 504]
+    assert len(main.in_flight) == 0
+
+
+def test_profiling_header_needs_the_admin_token(monkeypatch):
+    monkeypatch.setattr(main.settings, "admin_token", "secret")
+
+    async def create_jobs() -> list:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = []
+            for headers in ({"X-Profile": "1"}, {"X-Profile": "1", "X-Admin-Token": "wrong"}, {"X-Profile": "1", "X-Admin-Token": "secret"}):
+                files = {"file": ("document.pdf", pdf_bytes(), "application/pdf")}
+                responses.append(await client.post("/jobs", files=files, headers=headers))
+            return responses
+
+    responses = asyncio.run(create_jobs())
+    assert [response.status_code for response in responses] == [403, 403, 202]
+    assert main.job_store.get(responses[-1].json()["id"])["options"]["profile"] is True
@@ -49,10 +49,10 @@ const TextExtractorPage = () => {
 
       const data = await response.json();
       setResult(data.text);
-      setPdfData({
-        base64: data.pdf,
+      setPdfData(data.pdf_url ? {
+        url: `${API_BASE_URL}${data.pdf_url}`,
         filename: data.filename
-      });
+      } : null);
     } catch (err) {
       setError(err.message || 'Ошибка при обработке файла');
       console.error('Ошибка:', err);
@@ -66,30 +66,15 @@ const TextExtractorPage = () => {
     if (!pdfData) return;
     
     try {
-      // Декодируем base64
-      const byteCharacters = atob(pdfData.base64);
-      const byteNumbers = new Array(byteCharacters.length);
-      for (let i = 0; i < byteCharacters.length; i++) {
-        byteNumbers[i] = byteCharacters.charCodeAt(i);
-      }
-      const byteArray = new Uint8Array(byteNumbers);
-      const blob = new Blob([byteArray], {type: 'application/pdf'});
-      
-      // Создаем ссылку для скачивания
-      const url = URL.createObjectURL(blob);
+      // Сервер отдает PDF как файл (Content-Disposition: attachment), декодировать ничего не нужно
       const link = document.createElement('a');
-      link.href = url;
+      link.href = pdfData.url;
       link.download = pdfData.filename;
       document.body.appendChild(link);
       link.click();
-      
-      // Очистка
-      setTimeout(() => {
-        document.body.removeChild(link);
-        URL.revokeObjectURL(url);
-      }, 100);
+      document.body.removeChild(link);
     } catch (err) {
-      setError('Ошибка при создании PDF');
+      setError('Ошибка при скачивании PDF');
       console.error(err);
     }
   };